@@ -0,0 +1,329 @@
+# backend/app/answer_cache.py
+import os
+import time
+import uuid
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from typing import Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from . import metrics
+
+logger = logging.getLogger("znatok.answer_cache")
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+# Минимальное косинусное сходство вопросов, при котором ответ переиспользуется
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+
+# Индексация может идти в другом процессе (сервис ingestion), а кэш живёт в памяти бэкенда.
+# Поэтому каждая инвалидация ещё и пишется в журнал в общем SQLite на томе /app/data.
+# С журналом работает только фоновый поток: раз в ANSWER_CACHE_SYNC_SECONDS он пишет
+# свои инвалидации и дочитывает чужие. lookup/store журнал не трогают и event loop не блокируют;
+# если поток давно не смог прочитать журнал, lookup считает кэш недостоверным (промах).
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "/app/data/answer_cache.db")
+ANSWER_CACHE_SYNC_SECONDS = float(os.getenv("ANSWER_CACHE_SYNC_SECONDS", 1.0))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    source TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+# Процессы в разных контейнерах могут иметь одинаковый pid, поэтому свой токен
+_ORIGIN = uuid.uuid4().hex
+
+class InvalidationLog:
+    """
+    Журнал инвалидаций, общий для процессов. source = NULL — сброс всей коллекции.
+    Записи старше TTL кэша удаляются: ответов, которые они сбрасывали, уже нет.
+    Процесс, отставший дальше самой старой записи, сбрасывает кэш целиком.
+    """
+
+    def __init__(self, path: str, retention_seconds: float, origin: str = _ORIGIN):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.origin = origin
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    def append(self, source: Optional[str]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO invalidations (origin, source, created_at) VALUES (?, ?, ?)",
+                (self.origin, source, now)
+            )
+            conn.execute("DELETE FROM invalidations WHERE created_at < ?", (now - self.retention_seconds,))
+
+    def last_id(self) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT MAX(id) FROM invalidations").fetchone()
+        return row[0] or 0
+
+    def read_after(self, last_id: int):
+        """(новый last_id, записи других процессов, потеряны ли записи из-за очистки)."""
+        with self._connect() as conn:
+            first = conn.execute("SELECT MIN(id) FROM invalidations").fetchone()[0]
+            rows = conn.execute(
+                "SELECT id, origin, source FROM invalidations WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+        gap = first is not None and first > last_id + 1
+        if rows:
+            last_id = rows[-1][0]
+        return last_id, [source for _, origin, source in rows if origin != self.origin], gap
+
+class SemanticAnswerCache:
+    """
+    Семантический кэш ответов LLM.
+
+    Запись привязана к эмбеддингу вопроса, фильтру по отделу и версии коллекции.
+    Ответ переиспользуется, только если новый вопрос близок по косинусу
+    и поиск вернул тот же набор чанков: кандидаты берутся из индекса
+    (отдел, набор чанков), косинус считается только по ним. Вытеснение — LRU + TTL;
+    TTL у всех записей один, поэтому очередь создания совпадает с очередью истечения
+    и просроченные снимаются с её головы — без обхода всего кэша,
+    переиндексация источника сбрасывает все ответы, которые на него ссылались —
+    в том числе если она прошла в другом процессе (через InvalidationLog).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float,
+                 log: Optional[InvalidationLog] = None, sync_seconds: float = ANSWER_CACHE_SYNC_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.version = 0
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._by_source: Dict[str, Set[int]] = {}
+        self._by_query: Dict[Tuple[Optional[str], FrozenSet[str]], Set[int]] = {}
+        # (создана в, ключ) в порядке создания; ключи удалённых записей отбрасываются при снятии
+        self._expiry: Deque[Tuple[float, int]] = deque()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._log = log
+        self._sync_seconds = sync_seconds
+        self._log_position: Optional[int] = None
+        self._synced_at = float("-inf")
+        # Сколько кэш живёт без успешного чтения журнала, прежде чем перестать ему доверять
+        self._stale_seconds = max(10.0, 5 * sync_seconds)
+        self._outbox: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._syncer: Optional[threading.Thread] = None
+        self._syncer_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for source in entry["cited_sources"]:
+            keys = self._by_source.get(source)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_source[source]
+        query_key = (entry["department"], entry["chunk_ids"])
+        keys = self._by_query.get(query_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_query[query_key]
+
+    def _evict_expired(self, now: float):
+        while self._expiry and now - self._expiry[0][0] > self.ttl_seconds:
+            _, key = self._expiry.popleft()
+            self._remove(key)
+
+    def _clear(self):
+        self.version += 1
+        self._entries.clear()
+        self._by_source.clear()
+        self._by_query.clear()
+        self._expiry.clear()
+
+    def _invalidate(self, source: str) -> int:
+        keys = list(self._by_source.get(source, ()))
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def _publish(self, source: Optional[str]):
+        if self._log is None:
+            return
+        self._outbox.put(source)
+        self._ensure_syncer()
+        self._wake.set()
+
+    def _ensure_syncer(self):
+        if self._log is None or self._syncer is not None:
+            return
+        with self._syncer_lock:
+            if self._syncer is None:
+                self._syncer = threading.Thread(target=self._sync_loop, name="znatok-answer-cache-sync", daemon=True)
+                self._syncer.start()
+
+    def _sync_loop(self):
+        while True:
+            self._wake.wait(timeout=max(0.05, self._sync_seconds))
+            self._wake.clear()
+            self.sync()
+
+    def _is_fresh(self, now: float) -> bool:
+        if self._log is None:
+            return True
+        self._ensure_syncer()
+        return now - self._synced_at <= self._stale_seconds
+
+    def sync(self) -> bool:
+        """
+        Пишет в журнал свои инвалидации и применяет чужие; вызывается фоновым потоком.
+        False — журнал недоступен (не записанное останется в очереди до следующей попытки).
+        """
+        if self._log is None:
+            return True
+        try:
+            while True:
+                try:
+                    source = self._outbox.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self._log.append(source)
+                except Exception:
+                    self._outbox.put(source)
+                    raise
+            if self._log_position is None:
+                # Ответов, сохранённых до запуска процесса, у нас нет — старые записи не нужны
+                position, sources, gap = self._log.last_id(), [], False
+            else:
+                position, sources, gap = self._log.read_after(self._log_position)
+        except Exception as e:
+            logger.error(f"Журнал инвалидаций кэша ответов недоступен: {e}")
+            return False
+        with self._lock:
+            if gap or None in sources:
+                self._clear()
+                dropped = None
+            else:
+                dropped = sum(self._invalidate(source) for source in set(sources))
+            self._log_position = position
+            self._synced_at = time.monotonic()
+        if dropped is None:
+            logger.info("Кэш ответов сброшен по журналу инвалидаций")
+        elif dropped:
+            metrics.inc("answer_cache_invalidations", dropped)
+            logger.info(f"Сброшено {dropped} кэшированных ответов по журналу инвалидаций")
+        return True
+
+    def lookup(self, vector, department: Optional[str], chunk_ids: Iterable[str]) -> Optional[dict]:
+        query = self._normalize(vector)
+        chunk_ids = frozenset(chunk_ids)
+        now = time.monotonic()
+        if not self._is_fresh(now):
+            metrics.inc("answer_cache_misses")
+            return None
+        with self._lock:
+            self._evict_expired(now)
+            keys = self._by_query.get((department, chunk_ids), ())
+            candidates = [(key, self._entries[key]) for key in keys]
+            best = None
+            if candidates:
+                matrix = np.stack([entry["vector"] for _, entry in candidates])
+                scores = matrix @ query
+                idx = int(np.argmax(scores))
+                if scores[idx] >= self.threshold:
+                    best = candidates[idx]
+
+            if best is None:
+                metrics.inc("answer_cache_misses")
+                return None
+            self._entries.move_to_end(best[0])
+        metrics.inc("answer_cache_hits")
+        return {"answer": best[1]["answer"], "sources": best[1]["sources"]}
+
+    def store(self, vector, department: Optional[str], chunk_ids: Iterable[str],
+              answer: str, sources: List[dict]):
+        cited_sources = {s["source"] for s in sources}
+        chunk_ids = frozenset(chunk_ids)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = {
+                "vector": self._normalize(vector),
+                "department": department,
+                "version": self.version,
+                "chunk_ids": chunk_ids,
+                "answer": answer,
+                "sources": sources,
+                "cited_sources": cited_sources,
+                "created_at": now,
+            }
+            self._expiry.append((now, key))
+            self._by_query.setdefault((department, chunk_ids), set()).add(key)
+            for source in cited_sources:
+                self._by_source.setdefault(source, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                metrics.inc("answer_cache_evictions")
+            if len(self._expiry) > 2 * max(1, self.max_entries):
+                # Вытесненные по LRU записи остаются в очереди до истечения — изредка её сжимаем
+                self._expiry = deque((created_at, k) for created_at, k in self._expiry if k in self._entries)
+
+    def invalidate_source(self, source: str):
+        with self._lock:
+            dropped = self._invalidate(source)
+        self._publish(source)
+        if dropped:
+            metrics.inc("answer_cache_invalidations", dropped)
+            logger.info(f"Сброшено {dropped} кэшированных ответов по источнику {source}")
+
+    def bump_version(self):
+        """Новая версия коллекции (сброс/пересоздание) — все ответы устаревают."""
+        with self._lock:
+            self._clear()
+        self._publish(None)
+
+    def __len__(self):
+        return len(self._entries)
+
+_ANSWER_CACHE = SemanticAnswerCache(
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_THRESHOLD,
+    log=InvalidationLog(ANSWER_CACHE_DB, ANSWER_CACHE_TTL_SECONDS) if ANSWER_CACHE_DB else None
+)
+
+def get_answer_cache() -> SemanticAnswerCache:
+    return _ANSWER_CACHE
+
+def invalidate_source(source: str):
+    _ANSWER_CACHE.invalidate_source(source)
+
+def bump_collection_version():
+    _ANSWER_CACHE.bump_version()
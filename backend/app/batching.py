@@ -0,0 +1,120 @@
+# backend/app/batching.py
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from typing import Callable, List, Optional
+from . import metrics
+
+logger = logging.getLogger("znatok.batching")
+
+class EmbeddingBatcher:
+    """
+    Микробатчинг эмбеддингов запросов.
+
+    Одновременные вызовы encode() собираются в пачку — до max_batch_size текстов
+    или max_wait_ms с момента прихода первого — и кодируются одним вызовом модели.
+    Пока одна пачка считается в executor, следующая уже набирается.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], List[List[float]]],
+        executor: Executor,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_inflight: int = 2,
+        name: str = "embedding_batch"
+    ):
+        self.encode_batch = encode_batch
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._max_inflight = max(1, max_inflight)
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight = set()
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self._max_inflight)
+            self._task = asyncio.create_task(self._run())
+
+    async def encode(self, text: str) -> List[float]:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._encode(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _encode(self, batch: list):
+        try:
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                return
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                metrics.observe(f"{self.name}_queue_wait_ms", (started - enqueued) * 1000)
+            metrics.observe(f"{self.name}_size", len(batch))
+
+            texts = [text for text, _, _ in batch]
+            loop = asyncio.get_running_loop()
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.encode_batch, texts)
+            except Exception as e:
+                logger.error(f"Ошибка батча эмбеддингов ({len(texts)} шт.): {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            metrics.observe(f"{self.name}_encode_ms", (time.perf_counter() - started) * 1000)
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -0,0 +1,287 @@
+# backend/app/bitrix24_kb.py
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+import httpx
+from .models import current_settings, update_knowledge_source
+from .ingestion import index_text_content, new_upsert_writer
+from .storage import ORIGIN_BITRIX24_KB
+
+logger = logging.getLogger("znatok.bitrix24_kb")
+
+# Синхронизация Базы знаний Битрикс24.
+# Лимиты REST API Битрикс24 — «дырявое ведро»: 2 запроса/с и запас 50 на облачных тарифах
+# (5/с и 250 на Энтерпрайз). Запросы идут через токен-бакет с теми же параметрами,
+# а при QUERY_LIMIT_EXCEEDED бакет ставится на паузу с экспоненциальной задержкой.
+# Статьи скачиваются пачками через метод batch (до 50 команд в одном запросе),
+# индексация идёт отдельными воркерами через очередь и не тормозит скачивание.
+BITRIX24_RATE_PER_SEC = float(os.getenv("BITRIX24_RATE_PER_SEC", 2))
+BITRIX24_BURST = int(os.getenv("BITRIX24_BURST", 50))
+BITRIX24_BATCH_SIZE = min(50, int(os.getenv("BITRIX24_BATCH_SIZE", 50)))
+BITRIX24_USE_BATCH = os.getenv("BITRIX24_USE_BATCH", "true").lower() == "true"
+BITRIX24_FETCH_CONCURRENCY = int(os.getenv("BITRIX24_FETCH_CONCURRENCY", 2))
+BITRIX24_INDEX_CONCURRENCY = int(os.getenv("BITRIX24_INDEX_CONCURRENCY", 4))
+BITRIX24_MAX_RETRIES = int(os.getenv("BITRIX24_MAX_RETRIES", 5))
+
+LIST_METHOD = "crm/knowledge-base/article.list"
+GET_METHOD = "crm/knowledge-base/article.get"
+
+class Bitrix24Error(Exception):
+    def __init__(self, code: str, description: str = ""):
+        super().__init__(f"{code}: {description}" if description else code)
+        self.code = code
+
+class TokenBucket:
+    """
+    Асинхронный токен-бакет: rate токенов в секунду, не больше burst про запас.
+    Если сервер всё же ответил QUERY_LIMIT_EXCEEDED (на портале работают и другие
+    приложения), скорость снижается вдвое и потом плавно возвращается к исходной.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = max(rate, 0.001)
+        self.rate = self.base_rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """Сервер сказал, что лимит превышен: пауза на seconds, запас обнуляется, скорость — вдвое ниже."""
+        now = time.monotonic()
+        if now >= self.paused_until:
+            # Параллельные отказы в одно окно считаем одним сигналом
+            self.rate = max(self.base_rate / 16, self.rate / 2)
+        self.paused_until = max(self.paused_until, now + seconds)
+        self._refill(now)
+        self.tokens = 0
+
+    def on_success(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate * 1.05)
+
+class Bitrix24Client:
+    def __init__(self, domain: str, token: str, http: httpx.AsyncClient, bucket: TokenBucket):
+        self.domain = domain
+        self.token = token
+        self.http = http
+        self.bucket = bucket
+        self.requests = 0
+        self.rate_limited = 0
+
+    async def call(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict:
+        """Вызов метода REST API с учётом лимитов; возвращает тело ответа целиком."""
+        payload = {"auth": self.token, **(params or {})}
+        for attempt in range(BITRIX24_MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            self.requests += 1
+            resp = await self.http.post(f"{self.domain}/rest/{method}", json=payload)
+            try:
+                data = resp.json()
+            except ValueError:
+                resp.raise_for_status()
+                raise Bitrix24Error("INVALID_RESPONSE", resp.text[:200])
+
+            error = data.get("error") if isinstance(data, dict) else None
+            if error == "QUERY_LIMIT_EXCEEDED":
+                self.rate_limited += 1
+                delay = min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+                logger.warning(f"Bitrix24: превышен лимит запросов, пауза {delay:.1f}с")
+                self.bucket.penalize(delay)
+                continue
+            if error:
+                raise Bitrix24Error(error, data.get("error_description", ""))
+            resp.raise_for_status()
+            self.bucket.on_success()
+            return data
+        raise Bitrix24Error("QUERY_LIMIT_EXCEEDED", f"не удалось после {BITRIX24_MAX_RETRIES} повторов")
+
+    async def batch(self, commands: Dict[str, Tuple[str, Dict[str, Any]]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Метод batch: до 50 вызовов одним запросом. Возвращает (результаты, ошибки) по ключам."""
+        cmd = {key: f"{method}?{urlencode(params)}" for key, (method, params) in commands.items()}
+        data = await self.call("batch", {"halt": 0, "cmd": cmd})
+        result = data.get("result") or {}
+        return result.get("result") or {}, result.get("result_error") or {}
+
+async def list_articles(api: Bitrix24Client) -> List[Dict]:
+    """Все статьи Базы знаний с учётом постраничной выдачи (start/next)."""
+    articles: List[Dict] = []
+    start: Optional[int] = 0
+    while start is not None:
+        data = await api.call(LIST_METHOD, {"start": start} if start else None)
+        result = data.get("result")
+        if not isinstance(result, dict) or "articles" not in result:
+            raise ValueError(f"Unexpected Bitrix24 response: {data}")
+        articles.extend(result["articles"])
+        start = data.get("next")
+    return articles
+
+def _article_text(detail: Any) -> Optional[str]:
+    if isinstance(detail, dict):
+        return detail.get("text")
+    return None
+
+async def _fetch_details(api: Bitrix24Client, ids: List[Any]) -> Tuple[Dict[str, Optional[str]], List[str]]:
+    """
+    Тексты статей: одной batch-командой или (BITRIX24_USE_BATCH=false) отдельными запросами.
+    Возвращает (тексты по ID, ID статей, которые API вернул с ошибкой).
+    """
+    if BITRIX24_USE_BATCH:
+        results, errors = await api.batch({str(article_id): (GET_METHOD, {"id": article_id}) for article_id in ids})
+        for key, error in errors.items():
+            logger.warning(f"Bitrix24: статья {key} не получена: {error}")
+        texts = {
+            str(article_id): _article_text(results.get(str(article_id)))
+            for article_id in ids if str(article_id) not in errors
+        }
+        return texts, [str(key) for key in errors]
+
+    async def one(article_id):
+        data = await api.call(GET_METHOD, {"id": article_id})
+        return str(article_id), _article_text(data.get("result"))
+    return dict(await asyncio.gather(*(one(article_id) for article_id in ids))), []
+
+IndexFn = Callable[[str, str], Awaitable[None]]
+
+async def run_sync(api: Bitrix24Client, last_sync: Optional[str], index_article: IndexFn) -> Dict[str, int]:
+    """
+    Скачивает изменённые после last_sync статьи и передаёт их index_article(source, text).
+    Скачивание (пачками, до BITRIX24_FETCH_CONCURRENCY пачек одновременно) и индексация
+    (BITRIX24_INDEX_CONCURRENCY воркеров) связаны ограниченной очередью.
+    """
+    stats = {"listed": 0, "changed": 0, "synced": 0, "skipped": 0, "failed": 0}
+    articles = await list_articles(api)
+    stats["listed"] = len(articles)
+    changed = [
+        article for article in articles
+        if not (last_sync and article.get("updated") and article["updated"] <= last_sync)
+    ]
+    stats["changed"] = len(changed)
+
+    queue: "asyncio.Queue[Optional[Tuple[str, str]]]" = asyncio.Queue(maxsize=BITRIX24_BATCH_SIZE * 2)
+    fetch_slots = asyncio.Semaphore(max(1, BITRIX24_FETCH_CONCURRENCY))
+
+    async def fetch(ids: List[Any]):
+        async with fetch_slots:
+            try:
+                texts, errored = await _fetch_details(api, ids)
+            except (Bitrix24Error, httpx.HTTPError) as e:
+                # Пачка не скачалась — last_sync не сдвинется, статьи заберём в следующий раз
+                stats["failed"] += len(ids)
+                logger.error(f"Bitrix24: не удалось получить {len(ids)} статей: {e}")
+                return
+        # Ошибки отдельных команд batch — такой же сбой: иначе last_sync сдвинется и статьи потеряются
+        stats["failed"] += len(errored)
+        for article_id, text in texts.items():
+            if not text:
+                logger.warning(f"Пропускаем статью {article_id}: нет текста")
+                stats["skipped"] += 1
+                continue
+            await queue.put((f"bitrix24_kb:{article_id}", text))
+
+    async def index_worker():
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                source, text = item
+                try:
+                    await index_article(source, text)
+                    stats["synced"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.error(f"Ошибка индексации {source}: {e}")
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(index_worker()) for _ in range(max(1, BITRIX24_INDEX_CONCURRENCY))]
+    try:
+        ids = [article["id"] for article in changed]
+        await asyncio.gather(*(
+            fetch(ids[i:i + BITRIX24_BATCH_SIZE]) for i in range(0, len(ids), BITRIX24_BATCH_SIZE)
+        ))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+    return stats
+
+async def sync_bitrix24_kb() -> Dict:
+    """Синхронизирует статьи из Битрикс24 Базы знаний"""
+    kb_config = current_settings().knowledge_sources.get("bitrix24_kb", {})
+
+    if not kb_config.get("enabled") or not kb_config.get("domain") or not kb_config.get("access_token"):
+        logger.warning("Bitrix24 KB sync skipped: not configured")
+        return {"status": "skipped", "reason": "not configured"}
+
+    domain = kb_config["domain"]
+    if not domain.startswith(("https://", "http://")):
+        domain = f"https://{domain.strip('/')}"
+    domain = domain.rstrip("/")
+    # Статьи, изменённые во время синхронизации, попадут в следующую
+    now = datetime.now(timezone.utc).isoformat()
+
+    index_stats: Dict[str, int] = {}
+    # Статьи короткие: точки всех статей пишем в Qdrant общими пачками
+    writer = new_upsert_writer()
+
+    async def index_article(source: str, text: str):
+        await index_text_content(text, source, "all", stats=index_stats, writer=writer, origin=ORIGIN_BITRIX24_KB)
+
+    try:
+        async with httpx.AsyncClient(timeout=30.0) as http:
+            api = Bitrix24Client(domain, kb_config["access_token"], http,
+                                 TokenBucket(BITRIX24_RATE_PER_SEC, BITRIX24_BURST))
+            stats = await run_sync(api, kb_config.get("last_sync"), index_article)
+
+        # last_sync сдвигаем только после подтверждения записи всех точек
+        await asyncio.to_thread(writer.flush)
+        if stats["failed"]:
+            logger.warning(f"Не удалось проиндексировать статей: {stats['failed']}, last_sync не обновлён")
+        else:
+            update_knowledge_source("bitrix24_kb", {"last_sync": now})
+
+        logger.info(
+            f"Синхронизировано {stats['synced']} статей из Bitrix24 KB "
+            f"(запросов к API: {api.requests}, упёрлись в лимит: {api.rate_limited}), "
+            f"эмбеддингов сэкономлено: {index_stats.get('reused', 0)}"
+        )
+        return {
+            "status": "ok",
+            "synced": stats["synced"],
+            "failed": stats["failed"],
+            "total": stats["listed"],
+            "api_requests": api.requests,
+            "embeddings_computed": index_stats.get("embedded", 0),
+            "embeddings_avoided": index_stats.get("reused", 0)
+        }
+
+    except Exception as e:
+        logger.error(f"Ошибка синхронизации Bitrix24 KB: {e}")
+        return {"status": "error", "message": str(e)}
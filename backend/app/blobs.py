@@ -0,0 +1,89 @@
+# backend/app/blobs.py
+import os
+import zlib
+import shutil
+import hashlib
+import logging
+import tempfile
+from functools import lru_cache
+from typing import Optional, Tuple
+
+logger = logging.getLogger("znatok.blobs")
+
+# Полный извлечённый текст документа хранится один раз, сжатым (zlib), по адресу содержимого:
+# имя файла — sha256 текста в UTF-8, одинаковые тексты разных источников делят один файл.
+# /api/documents/{source} отдаёт из него страницы по байтовым смещениям, без обхода Qdrant.
+DOCUMENT_BLOB_DIR = os.getenv("DOCUMENT_BLOB_DIR", "/app/data/blobs")
+DOCUMENT_BLOB_CACHE_SIZE = int(os.getenv("DOCUMENT_BLOB_CACHE_SIZE", 16))
+_COMPRESS_LEVEL = 6
+
+def digest_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _path(digest: str) -> str:
+    return os.path.join(DOCUMENT_BLOB_DIR, digest[:2], f"{digest}.z")
+
+def put(data: bytes) -> str:
+    """Сохраняет данные (если таких ещё нет) и возвращает их адрес."""
+    digest = digest_of(data)
+    path = _path(digest)
+    if os.path.exists(path):
+        return digest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Пишем во временный файл и переименовываем: читатель не увидит недописанный блоб
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.compress(data, _COMPRESS_LEVEL))
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return digest
+
+def put_text(text: str) -> str:
+    return put(text.encode("utf-8"))
+
+@lru_cache(maxsize=max(1, DOCUMENT_BLOB_CACHE_SIZE))
+def _load(digest: str) -> bytes:
+    with open(_path(digest), "rb") as f:
+        return zlib.decompress(f.read())
+
+def get(digest: str) -> Optional[bytes]:
+    """Распакованные данные или None, если блоба нет. Последние прочитанные держим в памяти."""
+    try:
+        return _load(digest)
+    except FileNotFoundError:
+        return None
+
+def exists(digest: str) -> bool:
+    return os.path.exists(_path(digest))
+
+def delete(digest: str):
+    try:
+        os.unlink(_path(digest))
+    except FileNotFoundError:
+        pass
+    _load.cache_clear()
+
+def clear():
+    shutil.rmtree(DOCUMENT_BLOB_DIR, ignore_errors=True)
+    _load.cache_clear()
+
+def _char_start(data: bytes, pos: int) -> int:
+    # Байты продолжения UTF-8 имеют вид 10xxxxxx: отступаем к началу символа
+    while 0 < pos < len(data) and data[pos] & 0xC0 == 0x80:
+        pos -= 1
+    return pos
+
+def utf8_range(data: bytes, offset: int, limit: int) -> Tuple[int, int]:
+    """Границы страницы [start, end) около offset/limit, не разрезающие символы UTF-8."""
+    start = _char_start(data, min(max(0, offset), len(data)))
+    end = _char_start(data, min(len(data), start + max(1, limit)))
+    if end <= start < len(data):
+        # Страница короче одного символа — отдаём символ целиком
+        end = start + 1
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end += 1
+    return start, end
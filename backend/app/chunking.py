@@ -0,0 +1,176 @@
+# backend/app/chunking.py
+import os
+import re
+import logging
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("znatok.chunking")
+
+# Нарезка текста на чанки по токенам модели эмбеддингов, а не по символам:
+# MiniLM видит только max_seq_length (128) токенов, всё сверх обрезается и не попадает в вектор.
+# Длина чанка по умолчанию — окно модели за вычетом служебных токенов и префикса "passage: ".
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 0))  # 0 — по окну модели
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+PASSAGE_PREFIX = "passage: "
+
+# Предложение — до [.!?] с пробелом после или до конца строки ("3.14" не режется)
+_SENTENCE_RE = re.compile(r"[^\n]+?(?:[.!?]+(?=\s)|(?=\n)|$)", re.MULTILINE)
+
+Span = Tuple[int, int]
+
+def split_sentences(text: str) -> List[Span]:
+    """Границы предложений (start, end) в исходном тексте за один проход."""
+    spans = []
+    for match in _SENTENCE_RE.finditer(text):
+        start, end = match.span()
+        # Без ведущих/хвостовых пробелов, чтобы чанк начинался и заканчивался текстом
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            spans.append((start, end))
+    return spans
+
+class TokenChunker:
+    """
+    Линейный по длине текста нарезчик. Все предложения документа токенизируются
+    одним батчем, дальше чанки собираются жадно по сумме токенов; соседние чанки
+    перекрываются на overlap_tokens (целыми предложениями). Предложение длиннее
+    окна режется по границам токенов через offset_mapping.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = 0):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens должен быть положительным")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+
+    def _tokenize(self, texts: List[str]) -> List[List[Span]]:
+        encoded = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+        return encoded["offset_mapping"]
+
+    def split(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def split_spans(self, text: str) -> List[Span]:
+        """Границы чанков (start, end) в исходном тексте; чанк — ровно text[start:end]."""
+        sentences = split_sentences(text)
+        if not sentences:
+            return []
+        offsets = self._tokenize([text[start:end] for start, end in sentences])
+
+        # Единицы нарезки: (start, end, токенов). Длинные предложения режем на окна по max_tokens
+        units: List[Tuple[int, int, int]] = []
+        for (start, end), token_offsets in zip(sentences, offsets):
+            count = len(token_offsets)
+            if count <= self.max_tokens:
+                units.append((start, end, max(count, 1)))
+                continue
+            for i in range(0, count, self.max_tokens):
+                window = token_offsets[i:i + self.max_tokens]
+                piece_start = start + window[0][0]
+                piece_end = start + window[-1][1] if i + self.max_tokens < count else end
+                units.append((piece_start, piece_end, len(window)))
+
+        chunks: List[Span] = []
+        first = 0          # первая единица текущего чанка
+        tokens = 0         # токенов в текущем чанке
+        for i, (_, _, count) in enumerate(units):
+            if tokens + count > self.max_tokens and i > first:
+                chunks.append((units[first][0], units[i - 1][1]))
+                # Перекрытие: хвостовые предложения предыдущего чанка, но не больше overlap_tokens
+                new_first, carried = i, 0
+                while new_first - 1 > first and carried + units[new_first - 1][2] <= self.overlap_tokens \
+                        and carried + units[new_first - 1][2] + count <= self.max_tokens:
+                    new_first -= 1
+                    carried += units[new_first][2]
+                first, tokens = new_first, carried
+            tokens += count
+        chunks.append((units[first][0], units[-1][1]))
+        return chunks
+
+def model_token_budget(model) -> Optional[int]:
+    """Сколько токенов текста помещается в окно модели с префиксом "passage: "."""
+    tokenizer = getattr(model, "tokenizer", None)
+    max_seq_length = getattr(model, "max_seq_length", None)
+    if tokenizer is None or not max_seq_length:
+        return None
+    special = tokenizer.num_special_tokens_to_add(pair=False) if hasattr(tokenizer, "num_special_tokens_to_add") else 2
+    prefix = len(tokenizer(PASSAGE_PREFIX, add_special_tokens=False)["input_ids"])
+    return max(16, max_seq_length - special - prefix)
+
+def chunk_text_legacy(text: str, max_length: int = 1024) -> List[str]:
+    """Прежний символьный нарезчик — запасной вариант для моделей без быстрого токенизатора."""
+    return [chunk for chunk, _ in chunk_text_legacy_spans(text, max_length)]
+
+def chunk_text_legacy_spans(text: str, max_length: int = 1024) -> List[Tuple[str, Span]]:
+    """
+    Чанки прежнего нарезчика (предложения набираются, пока влезают в max_length символов)
+    с границами в исходном тексте. Чанк — ровно text[start:end], как и у TokenChunker:
+    по границам документ собирается обратно из чанков.
+    """
+    if not text.strip():
+        return []
+    # То же, что re.split(r'(?<=[.!?])\s+', text), но с позициями предложений
+    sentences: List[Span] = []
+    pos = 0
+    for match in re.finditer(r'(?<=[.!?])\s+', text):
+        sentences.append((pos, match.start()))
+        pos = match.end()
+    sentences.append((pos, len(text)))
+
+    spans: List[Span] = []
+    current: Optional[Span] = None
+    for start, end in sentences:
+        if current is not None and end - current[0] < max_length:
+            current = (current[0], end)
+        else:
+            if current is not None:
+                spans.append(current)
+            current = (start, end)
+    if current is not None:
+        spans.append(current)
+
+    chunks = []
+    for start, end in spans:
+        # Пробельные символы по краям (начало текста) в чанк не берём
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            chunks.append((text[start:end], (start, end)))
+    return chunks or [(text[:max_length], (0, min(len(text), max_length)))]
+
+_CHUNKER: Optional[TokenChunker] = None
+_CHUNKER_UNAVAILABLE = False
+
+def get_chunker() -> Optional[TokenChunker]:
+    global _CHUNKER, _CHUNKER_UNAVAILABLE
+    if _CHUNKER is None and not _CHUNKER_UNAVAILABLE:
+        from .registry import get_embedding_model
+        model = get_embedding_model()
+        budget = model_token_budget(model)
+        tokenizer = getattr(model, "tokenizer", None)
+        if budget is None or not getattr(tokenizer, "is_fast", False):
+            logger.warning("У модели эмбеддингов нет быстрого токенизатора, используем символьную нарезку")
+            _CHUNKER_UNAVAILABLE = True
+            return None
+        max_tokens = min(CHUNK_MAX_TOKENS, budget) if CHUNK_MAX_TOKENS > 0 else budget
+        _CHUNKER = TokenChunker(tokenizer, max_tokens, CHUNK_OVERLAP_TOKENS)
+        logger.info(f"Нарезка по токенам: до {max_tokens} токенов, перекрытие {_CHUNKER.overlap_tokens}")
+    return _CHUNKER
+
+def chunk_text(text: str) -> List[str]:
+    return [chunk for chunk, _ in chunk_text_spans(text)]
+
+def chunk_text_spans(text: str) -> List[Tuple[str, Span]]:
+    """Чанки вместе с их границами (start, end) в символах исходного текста."""
+    if not text.strip():
+        return []
+    chunker = get_chunker()
+    if chunker is None:
+        return chunk_text_legacy_spans(text)
+    return [(text[start:end], (start, end)) for start, end in chunker.split_spans(text)]
@@ -0,0 +1,368 @@
+# backend/app/confluence.py
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set
+import httpx
+from .models import current_settings, update_knowledge_source
+from .extraction import ahtml_to_text
+from .ingestion import index_text_content, new_upsert_writer, delete_document_from_qdrant
+from .storage import ORIGIN_CONFLUENCE
+
+logger = logging.getLogger("znatok.confluence")
+
+# Синхронизация Confluence идёт фоновой задачей (запуск и single-flight — app.scheduler): следующая страница выдачи API
+# запрашивается, пока обрабатывается текущая; HTML разбирается в пуле процессов,
+# индексация — не больше CONFLUENCE_INDEX_CONCURRENCY страниц одновременно.
+#
+# Инкрементальность на стороне сервера: CQL lastmodified отдаёт только изменённые страницы
+# (без тел, с номером версии), тела запрашиваются пачками только для страниц, чья версия
+# отличается от проиндексированной. Удаления находим сравнением лёгкого списка ID
+# пространства с сохранённым состоянием (CONFLUENCE_STATE_FILE: id страницы -> версия).
+CONFLUENCE_ID_PAGE_LIMIT = int(os.getenv("CONFLUENCE_ID_PAGE_LIMIT", 500))
+CONFLUENCE_BODY_BATCH = int(os.getenv("CONFLUENCE_BODY_BATCH", 25))
+CONFLUENCE_INDEX_CONCURRENCY = int(os.getenv("CONFLUENCE_INDEX_CONCURRENCY", 4))
+# Запас для CQL lastmodified: часы на сервере и время правки не идеально совпадают
+CONFLUENCE_CQL_OVERLAP_MINUTES = int(os.getenv("CONFLUENCE_CQL_OVERLAP_MINUTES", 15))
+CONFLUENCE_STATE_FILE = os.getenv("CONFLUENCE_STATE_FILE", "/app/data/confluence_pages.json")
+
+_SYNC_LOCK = asyncio.Lock()
+_PROGRESS: Dict = {"state": "idle"}
+
+def _new_progress() -> Dict:
+    return {
+        "state": "running",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        "mode": None,             # full | incremental
+        "pages_total": None,      # страниц в пространстве
+        "pages_changed": None,    # сколько нужно скачать и проиндексировать
+        "pages_fetched": 0,
+        "pages_unchanged": 0,     # версия не изменилась — не скачиваются
+        "pages_indexed": 0,
+        "pages_skipped": 0,       # скачаны, но пустые
+        "pages_failed": 0,
+        "pages_deleted": 0,
+        "bytes_downloaded": 0,
+        "error": None,
+        "result": None,
+        "_started": time.monotonic(),
+    }
+
+def sync_status() -> Dict:
+    """Прогресс текущей (или последней) синхронизации: скорость страниц/с и ETA."""
+    status = {k: v for k, v in _PROGRESS.items() if not k.startswith("_")}
+    if _PROGRESS.get("state") != "running":
+        return status
+    elapsed = time.monotonic() - _PROGRESS["_started"]
+    # Скорость и ETA — только по страницам, которые реально скачиваются и индексируются:
+    # неизменённые отсеиваются разом в начале и исказили бы и то, и другое
+    processed = _PROGRESS["pages_indexed"] + _PROGRESS["pages_skipped"] + _PROGRESS["pages_failed"]
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    status["elapsed_seconds"] = round(elapsed, 1)
+    status["rate_pages_per_sec"] = round(rate, 2)
+    total = _PROGRESS.get("pages_changed")
+    if total and rate > 0:
+        status["progress"] = round(min(1.0, processed / total), 3)
+        status["eta_seconds"] = round(max(0, total - processed) / rate, 1)
+    return status
+
+def reset_progress():
+    """Сбрасывает прогресс перед запуском, чтобы статус сразу показывал running."""
+    _PROGRESS.clear()
+    _PROGRESS.update(_new_progress())
+
+# ======================
+# Состояние: какие страницы и в какой версии проиндексированы
+# ======================
+def _scope(base_url: str, space_key: Optional[str]) -> str:
+    return f"{base_url}|{space_key or '*'}"
+
+def _load_state(scope: str) -> Dict[str, int]:
+    try:
+        with open(CONFLUENCE_STATE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("scope") != scope:
+        # Сменились адрес или пространство — начинаем с полной синхронизации
+        return {}
+    return {str(k): int(v) for k, v in data.get("pages", {}).items()}
+
+def _save_state(scope: str, pages: Dict[str, int]):
+    os.makedirs(os.path.dirname(CONFLUENCE_STATE_FILE) or ".", exist_ok=True)
+    tmp_path = f"{CONFLUENCE_STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"scope": scope, "pages": pages}, f)
+    os.replace(tmp_path, CONFLUENCE_STATE_FILE)
+
+def _page_link(base_url: str, page_id: str) -> str:
+    return f"{base_url}/pages/viewpage.action?pageId={page_id}"
+
+def _page_version(page: dict) -> Optional[int]:
+    return (page.get("version") or {}).get("number")
+
+# ======================
+# Запросы к Confluence REST API
+# ======================
+async def _get(client: httpx.AsyncClient, url: str, auth, params: Optional[dict] = None) -> dict:
+    resp = await client.get(url, auth=auth, params=params)
+    if resp.status_code == 401:
+        raise ValueError("401: Неверные email или API token")
+    if resp.status_code == 404:
+        raise ValueError(f"404: Проверьте Base URL и SpaceKey ({url})")
+    resp.raise_for_status()
+    _PROGRESS["bytes_downloaded"] += len(resp.content)
+    return resp.json()
+
+async def _paginate(client: httpx.AsyncClient, base_url: str, path: str, auth, params: dict) -> AsyncIterator[List[dict]]:
+    """Постраничный обход выдачи: по _links.next (Cloud, курсоры) или по start/limit (Server)."""
+    url, params = f"{base_url}{path}", dict(params)
+    start = 0
+    while True:
+        data = await _get(client, url, auth, params)
+        results = data.get("results", [])
+        if results:
+            yield results
+        links = data.get("_links") or {}
+        if links.get("next"):
+            url, params = f"{links.get('base', base_url)}{links['next']}", None
+        elif params is not None and results and len(results) >= data.get("limit", params["limit"]):
+            # Сервер может урезать limit — ориентируемся на то, что он вернул
+            start += len(results)
+            params = {**params, "start": start}
+        else:
+            return
+
+async def _list_page_ids(client: httpx.AsyncClient, base_url: str, auth, space_key: Optional[str]) -> Set[str]:
+    """Лёгкий список ID всех страниц: без тел и расширений, только для поиска удалённых."""
+    params = {"type": "page", "limit": CONFLUENCE_ID_PAGE_LIMIT}
+    if space_key:
+        params["spaceKey"] = space_key
+    ids: Set[str] = set()
+    async for results in _paginate(client, base_url, "/rest/api/content", auth, params):
+        ids.update(str(page["id"]) for page in results)
+    return ids
+
+async def _user_timezone(client: httpx.AsyncClient, base_url: str, auth) -> Optional[timezone]:
+    """Даты в CQL Confluence трактует в часовом поясе пользователя API."""
+    try:
+        from zoneinfo import ZoneInfo
+        data = await _get(client, f"{base_url}/rest/api/user/current", auth)
+        name = data.get("timeZone")
+        return ZoneInfo(name) if name else None
+    except Exception as e:
+        logger.debug(f"Не удалось узнать часовой пояс пользователя Confluence: {e}")
+        return None
+
+def _cql_since(last_sync: str, tz) -> str:
+    since = datetime.fromisoformat(last_sync)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    since -= timedelta(minutes=CONFLUENCE_CQL_OVERLAP_MINUTES)
+    if tz is None:
+        # Пояс неизвестен — берём с запасом на максимальное смещение; лишние страницы
+        # отсеются сравнением версий и тела для них не скачиваются
+        since -= timedelta(hours=14)
+        tz = timezone.utc
+    return since.astimezone(tz).strftime("%Y-%m-%d %H:%M")
+
+async def _changed_since(client: httpx.AsyncClient, base_url: str, auth, space_key: Optional[str],
+                         last_sync: str, tz) -> Dict[str, Optional[int]]:
+    """ID и версии страниц, изменённых после last_sync (CQL lastmodified, без тел)."""
+    cql = f'type=page and lastmodified > "{_cql_since(last_sync, tz)}"'
+    if space_key:
+        cql += f' and space="{space_key}"'
+    changed: Dict[str, Optional[int]] = {}
+    params = {"cql": cql, "expand": "version", "limit": CONFLUENCE_ID_PAGE_LIMIT}
+    async for results in _paginate(client, base_url, "/rest/api/content/search", auth, params):
+        for page in results:
+            changed[str(page["id"])] = _page_version(page)
+    return changed
+
+async def _fetch_bodies(client: httpx.AsyncClient, base_url: str, auth, page_ids: List[str]) -> List[dict]:
+    """Тела пачки страниц одним запросом: CQL id in (...)."""
+    params = {
+        "cql": f"id in ({','.join(page_ids)})",
+        "expand": "version,body.storage",
+        "limit": len(page_ids)
+    }
+    # Пачка не больше limit — хватает одного запроса
+    data = await _get(client, f"{base_url}/rest/api/content/search", auth, params)
+    return data.get("results", [])
+
+# ======================
+# Синхронизация
+# ======================
+async def sync_confluence() -> Dict:
+    async with _SYNC_LOCK:
+        if _PROGRESS.get("state") != "running":
+            reset_progress()
+        try:
+            result = await _sync()
+        except asyncio.CancelledError:
+            _PROGRESS.update(state="cancelled", finished_at=datetime.now(timezone.utc).isoformat())
+            raise
+        _PROGRESS.update(
+            state="error" if result["status"] == "error" else "done",
+            error=result.get("message"),
+            result=result,
+            finished_at=datetime.now(timezone.utc).isoformat()
+        )
+        return result
+
+async def _sync() -> Dict:
+    ks = current_settings().knowledge_sources or {}
+    conf = ks.get("confluence", {})
+
+    if not (conf.get("enabled") and conf.get("base_url") and conf.get("email") and conf.get("api_token")):
+        logger.warning("Confluence sync skipped: not configured")
+        return {"status": "skipped", "reason": "not configured"}
+
+    base_url = conf["base_url"].rstrip("/")
+    if not base_url.startswith(("https://", "http://")):
+        base_url = f"https://{base_url}"
+
+    space_key = conf.get("space_key")
+    last_sync = conf.get("last_sync")
+    auth = (conf["email"], conf["api_token"])
+    # Страницы, изменённые во время синхронизации, попадут в следующую
+    sync_started_at = datetime.now(timezone.utc).isoformat()
+
+    scope = _scope(base_url, space_key)
+    state = _load_state(scope)
+    index_stats: Dict[str, int] = {}
+    # Страницы пишем в Qdrant общими пачками, а не отдельным upsert на каждую
+    writer = new_upsert_writer()
+    slots = asyncio.Semaphore(max(1, CONFLUENCE_INDEX_CONCURRENCY))
+    tasks = set()
+    next_fetch: Optional[asyncio.Task] = None
+
+    async def process_page(page: dict):
+        title = page.get("title", "Без названия")
+        page_id = str(page["id"])
+        try:
+            body = page.get("body", {}).get("storage", {}).get("value", "")
+            text = await ahtml_to_text(body) if body else ""
+            if not text:
+                logger.warning(f"Пропускаем страницу {page_id}: пустое тело")
+                _PROGRESS["pages_skipped"] += 1
+            else:
+                await index_text_content(
+                    text=text,
+                    source=_page_link(base_url, page_id),
+                    department="all",
+                    stats=index_stats,
+                    writer=writer,
+                    origin=ORIGIN_CONFLUENCE,
+                )
+                _PROGRESS["pages_indexed"] += 1
+                logger.info(f"✅ Индексирована: {title}")
+            state[page_id] = _page_version(page) or 0
+        except Exception as e:
+            # Версию не запоминаем — страница будет скачана снова в следующий раз
+            _PROGRESS["pages_failed"] += 1
+            logger.error(f"Ошибка индексации страницы {page_id} ({title}): {e}")
+        finally:
+            slots.release()
+
+    try:
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            current_ids = await _list_page_ids(client, base_url, auth, space_key)
+            _PROGRESS["pages_total"] = len(current_ids)
+
+            if last_sync and state:
+                _PROGRESS["mode"] = "incremental"
+                tz = await _user_timezone(client, base_url, auth)
+                candidates = await _changed_since(client, base_url, auth, space_key, last_sync, tz)
+                # Страницы, которых нет в состоянии (например, упали в прошлый раз), тоже берём
+                for page_id in current_ids - state.keys():
+                    candidates.setdefault(page_id, None)
+            else:
+                _PROGRESS["mode"] = "full"
+                candidates = {page_id: None for page_id in current_ids}
+
+            to_fetch = sorted(
+                page_id for page_id, version in candidates.items()
+                if page_id in current_ids and (version is None or state.get(page_id) != version)
+            )
+            _PROGRESS["pages_changed"] = len(to_fetch)
+            _PROGRESS["pages_unchanged"] = len(current_ids) - len(to_fetch)
+            logger.info(
+                f"Confluence ({_PROGRESS['mode']}): страниц {len(current_ids)}, "
+                f"к загрузке {len(to_fetch)}, было проиндексировано {len(state)}"
+            )
+
+            # Удалённые в Confluence страницы убираем из Qdrant
+            for page_id in [page_id for page_id in state if page_id not in current_ids]:
+                # Из состояния убираем только после удаления: иначе при ошибке точки останутся навсегда
+                if await asyncio.to_thread(delete_document_from_qdrant, _page_link(base_url, page_id)):
+                    state.pop(page_id, None)
+                    _PROGRESS["pages_deleted"] += 1
+                else:
+                    logger.warning(f"Страница {page_id} удалена в Confluence, но не из индекса; повторим в следующий раз")
+
+            batches = [
+                to_fetch[i:i + CONFLUENCE_BODY_BATCH]
+                for i in range(0, len(to_fetch), max(1, CONFLUENCE_BODY_BATCH))
+            ]
+            for i, batch in enumerate(batches):
+                if next_fetch is None:
+                    next_fetch = asyncio.create_task(_fetch_bodies(client, base_url, auth, batch))
+                pages = await next_fetch
+                # Следующую пачку тел запрашиваем, пока обрабатываем текущую
+                next_fetch = None
+                if i + 1 < len(batches):
+                    next_fetch = asyncio.create_task(_fetch_bodies(client, base_url, auth, batches[i + 1]))
+                _PROGRESS["pages_fetched"] += len(pages)
+
+                for page in pages:
+                    # Ждём свободный слот: заодно не уходим далеко вперёд по выдаче API
+                    await slots.acquire()
+                    task = asyncio.create_task(process_page(page))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+            # Состояние и last_sync сдвигаем только после подтверждения записи всех точек
+            await asyncio.to_thread(writer.flush)
+            _save_state(scope, state)
+
+        failed = _PROGRESS["pages_failed"]
+        if failed:
+            # Не сдвигаем last_sync, иначе упавшие страницы не будут переиндексированы
+            logger.warning(f"Не удалось проиндексировать страниц: {failed}, last_sync не обновлён")
+        else:
+            update_knowledge_source("confluence", {"last_sync": sync_started_at})
+
+        logger.info(
+            f"✅ Синхронизация завершена. Всего страниц: {_PROGRESS['pages_total']}, "
+            f"проиндексировано: {_PROGRESS['pages_indexed']}, удалено: {_PROGRESS['pages_deleted']}, "
+            f"скачано {_PROGRESS['bytes_downloaded'] / 1e6:.1f} МБ, "
+            f"эмбеддингов сэкономлено: {index_stats.get('reused', 0)}"
+        )
+        return {
+            "status": "ok",
+            "mode": _PROGRESS["mode"],
+            "synced": _PROGRESS["pages_indexed"],
+            "failed": failed,
+            "deleted": _PROGRESS["pages_deleted"],
+            "total": _PROGRESS["pages_total"],
+            "bytes_downloaded": _PROGRESS["bytes_downloaded"],
+            "embeddings_computed": index_stats.get("embedded", 0),
+            "embeddings_avoided": index_stats.get("reused", 0)
+        }
+
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"❌ Ошибка синхронизации Confluence: {error_msg}")
+        return {"status": "error", "message": error_msg}
+    finally:
+        if next_fetch is not None:
+            next_fetch.cancel()
+        for task in list(tasks):
+            task.cancel()
@@ -0,0 +1,258 @@
+# backend/app/context_store.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from . import metrics
+
+logger = logging.getLogger("znatok.context_store")
+
+# Контекст диалогов для /api/ask: последние сообщения каждого разговора.
+# На разговор — кольцевой буфер из CONTEXT_HISTORY_MESSAGES сообщений (в вопрос
+# подмешиваются только они), разговор живёт CONTEXT_TTL_SECONDS с последней реплики.
+# Общий предел — CONTEXT_MAX_CONVERSATIONS разговоров и CONTEXT_MAX_BYTES текста;
+# при превышении вытесняются давно не продолженные.
+#   memory — в памяти процесса;
+#   sqlite — файл на томе /app/data: переживает перезапуск, общий для нескольких воркеров.
+CONTEXT_STORE_BACKEND = os.getenv("CONTEXT_STORE_BACKEND", "memory").lower()
+CONTEXT_STORE_DB = os.getenv("CONTEXT_STORE_DB", "/app/data/contexts.db")
+CONTEXT_TTL_SECONDS = float(os.getenv("CONTEXT_TTL_SECONDS", 1800))
+CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", 2))
+CONTEXT_MAX_CONVERSATIONS = int(os.getenv("CONTEXT_MAX_CONVERSATIONS", 10000))
+CONTEXT_MAX_BYTES = int(os.getenv("CONTEXT_MAX_BYTES", 16 * 1024 * 1024))
+# Длинные ответы в истории обрезаем: в вопрос всё равно идёт только их начало
+CONTEXT_MESSAGE_MAX_CHARS = int(os.getenv("CONTEXT_MESSAGE_MAX_CHARS", 4000))
+
+def _message(role: str, content: str) -> Dict:
+    return {
+        "role": role,
+        "content": content[:CONTEXT_MESSAGE_MAX_CHARS],
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def _size(messages) -> int:
+    return sum(len(msg["content"].encode("utf-8")) for msg in messages)
+
+class ContextStore(ABC):
+    """Хранилище контекста диалогов: append добавляет сообщения, history отдаёт последние."""
+
+    @abstractmethod
+    def append(self, conv_id: str, messages: List[Dict]):
+        ...
+
+    @abstractmethod
+    def history(self, conv_id: str) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def delete(self, conv_id: str):
+        ...
+
+    def remember(self, conv_id: str, question: str, answer: str):
+        self.append(conv_id, [_message("user", question), _message("assistant", answer)])
+
+class MemoryContextStore(ContextStore):
+    """
+    Разговоры в OrderedDict в порядке последней реплики. TTL у всех один, поэтому
+    этот порядок совпадает с порядком истечения: просроченные и вытесняемые по лимиту
+    всегда в начале, каждая операция снимает их с головы — амортизированно O(1).
+    """
+
+    def __init__(self, ttl_seconds: float, max_messages: int, max_conversations: int, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max(1, max_messages)
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        # conv_id -> (буфер сообщений, истекает в (monotonic), байт текста)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _pop_oldest(self):
+        _, (_, _, size) = self._entries.popitem(last=False)
+        self._bytes -= size
+
+    def _evict(self, now: float):
+        while self._entries:
+            _, expires_at, _ = next(iter(self._entries.values()))
+            if expires_at > now:
+                break
+            self._pop_oldest()
+            metrics.inc("context_evicted_ttl")
+        while self._entries and (len(self._entries) > self.max_conversations or self._bytes > self.max_bytes):
+            self._pop_oldest()
+            metrics.inc("context_evicted_capacity")
+
+    def append(self, conv_id: str, messages: List[Dict]):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.pop(conv_id, None)
+            buffer = entry[0] if entry is not None else deque(maxlen=self.max_messages)
+            if entry is not None:
+                self._bytes -= entry[2]
+            buffer.extend(messages)
+            size = _size(buffer)
+            self._entries[conv_id] = (buffer, now + self.ttl_seconds, size)
+            self._bytes += size
+            self._evict(now)
+
+    def history(self, conv_id: str) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(conv_id)
+            return list(entry[0]) if entry is not None else []
+
+    def delete(self, conv_id: str):
+        with self._lock:
+            entry = self._entries.pop(conv_id, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conv_id TEXT PRIMARY KEY,
+    messages TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_expires ON conversations(expires_at);
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 1), count INTEGER NOT NULL, bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals (id, count, bytes) VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS conversations_insert AFTER INSERT ON conversations BEGIN
+    UPDATE totals SET count = count + 1, bytes = bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS conversations_update AFTER UPDATE OF size ON conversations BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS conversations_delete AFTER DELETE ON conversations BEGIN
+    UPDATE totals SET count = count - 1, bytes = bytes - OLD.size WHERE id = 1;
+END;
+"""
+
+# Сколько разговоров удаляем за один проход вытеснения
+_EVICT_BATCH = 100
+
+class SQLiteContextStore(ContextStore):
+    """
+    Разговоры в SQLite (WAL). Срок истечения — в индексе expires_at (время стены, общее
+    для процессов), число разговоров и объём текста ведут триггеры в таблице totals,
+    поэтому проверка лимитов не сканирует таблицу. Вытеснение — пачками с начала индекса.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_messages: int, max_conversations: int, max_bytes: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max(1, max_messages)
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(_SCHEMA)
+                        self._initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute(
+            "DELETE FROM conversations WHERE conv_id IN "
+            "(SELECT conv_id FROM conversations WHERE expires_at <= ? ORDER BY expires_at LIMIT ?)",
+            (now, _EVICT_BATCH)
+        ).rowcount
+        if expired:
+            metrics.inc("context_evicted_ttl", expired)
+        while True:
+            count, size = conn.execute("SELECT count, bytes FROM totals WHERE id = 1").fetchone()
+            excess = count - self.max_conversations
+            if excess <= 0 and size <= self.max_bytes:
+                break
+            evicted = conn.execute(
+                "DELETE FROM conversations WHERE conv_id IN "
+                "(SELECT conv_id FROM conversations ORDER BY expires_at LIMIT ?)",
+                (max(1, min(excess, _EVICT_BATCH)),)
+            ).rowcount
+            if not evicted:
+                break
+            metrics.inc("context_evicted_capacity", evicted)
+
+    def append(self, conv_id: str, messages: List[Dict]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT messages FROM conversations WHERE conv_id = ? AND expires_at > ?", (conv_id, now)
+                ).fetchone()
+                buffer = (json.loads(row[0]) if row else []) + list(messages)
+                buffer = buffer[-self.max_messages:]
+                conn.execute(
+                    """
+                    INSERT INTO conversations (conv_id, messages, size, expires_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(conv_id) DO UPDATE SET
+                        messages = excluded.messages, size = excluded.size, expires_at = excluded.expires_at
+                    """,
+                    (conv_id, json.dumps(buffer, ensure_ascii=False), _size(buffer), now + self.ttl_seconds)
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def history(self, conv_id: str) -> List[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT messages FROM conversations WHERE conv_id = ? AND expires_at > ?", (conv_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def delete(self, conv_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM conversations WHERE conv_id = ?", (conv_id,))
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT count FROM totals WHERE id = 1").fetchone()[0]
+
+_STORE: Optional[ContextStore] = None
+
+def get_context_store() -> ContextStore:
+    global _STORE
+    if _STORE is None:
+        params = dict(
+            ttl_seconds=CONTEXT_TTL_SECONDS,
+            max_messages=CONTEXT_HISTORY_MESSAGES,
+            max_conversations=CONTEXT_MAX_CONVERSATIONS,
+            max_bytes=CONTEXT_MAX_BYTES
+        )
+        if CONTEXT_STORE_BACKEND == "sqlite":
+            _STORE = SQLiteContextStore(CONTEXT_STORE_DB, **params)
+        else:
+            if CONTEXT_STORE_BACKEND != "memory":
+                logger.warning(f"Неизвестный CONTEXT_STORE_BACKEND={CONTEXT_STORE_BACKEND}, используем memory")
+            _STORE = MemoryContextStore(**params)
+        logger.info(f"Контекст диалогов: {type(_STORE).__name__}")
+    return _STORE
@@ -0,0 +1,295 @@
+# backend/app/embedding_cache.py
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from . import metrics
+from .registry import get_embedding_model, EMBEDDING_MODEL_NAME, EMBEDDING_QUANTIZATION
+
+logger = logging.getLogger("znatok.embedding_cache")
+
+# Персистентный кэш эмбеддингов на томе /app/data: одинаковые абзацы (дисклеймеры,
+# шапки, повторяющиеся пункты политик) и частые вопросы не кодируются повторно.
+# Векторы лежат в memory-mapped файле float32 [capacity x dim], индекс ключ -> слот — в SQLite.
+# Ключ — sha256(модель, префикс, нормализованный текст). При заполнении вытесняются
+# давно не использованные записи (LRU по last_used).
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "/app/data/embedding_cache")
+EMBEDDING_CACHE_CAPACITY = int(os.getenv("EMBEDDING_CACHE_CAPACITY", 200_000))
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 384))
+# last_used обновляем не чаще раза в TOUCH_INTERVAL секунд, чтобы чтение не превращалось в запись
+TOUCH_INTERVAL = 3600
+# memmap сбрасываем на диск не на каждую запись, а не чаще раза в FLUSH_SECONDS и при остановке.
+# Страницы memmap общие с ядром: другие процессы видят запись сразу, теряется она только при сбое ОС
+# (тогда слот без сброшенной метки читается как промах).
+EMBEDDING_CACHE_FLUSH_SECONDS = float(os.getenv("EMBEDDING_CACHE_FLUSH_SECONDS", 30))
+# Эмбеддинги вопросов не пишем в SQLite на каждом запросе: копим в памяти и сохраняем пачкой
+EMBEDDING_CACHE_QUERY_BATCH = int(os.getenv("EMBEDDING_CACHE_QUERY_BATCH", 64))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    slot INTEGER NOT NULL UNIQUE,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def _tag(key: str) -> int:
+    # Метка слота: по ней читатель проверяет, что слот не перезаписали под другой ключ
+    return int(key[:15], 16) or 1
+
+class EmbeddingCache:
+    def __init__(self, directory: str, capacity: int, dim: int, model_key: str):
+        self.directory = directory
+        self.capacity = capacity
+        self.dim = dim
+        self.model_key = model_key
+        self._lock = threading.Lock()
+        # Отложенные записи (эмбеддинги вопросов): ключ -> вектор
+        self._pending: Dict[str, np.ndarray] = {}
+        self._pending_lock = threading.Lock()
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self._db_path = os.path.join(directory, "index.db")
+        self._vectors = self._open_memmap("vectors.f32", np.float32, (capacity, dim))
+        self._tags = self._open_memmap("tags.u64", np.uint64, (capacity,))
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('next_slot', 0)")
+
+    def _open_memmap(self, name: str, dtype, shape):
+        path = os.path.join(self.directory, name)
+        expected = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if os.path.exists(path) and os.path.getsize(path) != expected:
+            # Сменилась ёмкость или размерность — старый кэш несовместим
+            logger.warning(f"Кэш эмбеддингов {name} несовместим с текущими настройками, пересоздаём")
+            os.remove(path)
+            if os.path.exists(self._db_path):
+                os.remove(self._db_path)
+        mode = "r+" if os.path.exists(path) else "w+"
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def make_key(self, prefix: str, text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model_key}\x00{prefix}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, prefix: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        keys = [self.make_key(prefix, text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        if not keys:
+            return results
+
+        rows = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                for key, slot, last_used in conn.execute(
+                    f"SELECT key, slot, last_used FROM entries WHERE key IN ({placeholders})", part
+                ):
+                    rows[key] = (slot, last_used)
+
+            now = time.time()
+            stale = [(now, key) for key, (_, last_used) in rows.items() if now - last_used > TOUCH_INTERVAL]
+            if stale:
+                conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", stale)
+
+        with self._pending_lock:
+            pending = {key: self._pending[key] for key in keys if key in self._pending} if self._pending else {}
+        for i, key in enumerate(keys):
+            entry = rows.get(key)
+            if entry is None:
+                if key in pending:
+                    results[i] = pending[key].copy()
+                continue
+            slot = entry[0]
+            vector = np.array(self._vectors[slot])
+            if int(self._tags[slot]) == _tag(key):
+                results[i] = vector
+
+        hits = sum(1 for r in results if r is not None)
+        metrics.inc("embedding_cache_hits", hits)
+        metrics.inc("embedding_cache_misses", len(keys) - hits)
+        return results
+
+    def _items(self, prefix: str, texts: Sequence[str], vectors) -> Optional[Dict[str, np.ndarray]]:
+        items = {}
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            if vector.shape != (self.dim,):
+                logger.warning(f"Размерность эмбеддинга {vector.shape} не совпадает с кэшем ({self.dim}), не кэшируем")
+                return None
+            items[self.make_key(prefix, text)] = vector
+        return items
+
+    def put_many(self, prefix: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        items = self._items(prefix, texts, vectors) if texts else None
+        if items:
+            self._write(items)
+        self._maybe_flush()
+
+    def defer_many(self, prefix: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Как put_many, но запись откладывается до пачки из EMBEDDING_CACHE_QUERY_BATCH или flush."""
+        items = self._items(prefix, texts, vectors) if texts else None
+        if items:
+            with self._pending_lock:
+                self._pending.update(items)
+                full = len(self._pending) >= EMBEDDING_CACHE_QUERY_BATCH
+            if full:
+                self._write_pending()
+        self._maybe_flush()
+
+    def _write_pending(self):
+        with self._pending_lock:
+            items, self._pending = self._pending, {}
+        if items:
+            self._write(items)
+
+    def _write(self, items: Dict[str, np.ndarray]):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ",".join("?" * len(items))
+                known = {row[0] for row in conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders})", list(items)
+                )}
+                fresh = [key for key in items if key not in known]
+                if not fresh:
+                    conn.execute("COMMIT")
+                    return
+
+                next_slot = conn.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()[0]
+                free = list(range(next_slot, min(self.capacity, next_slot + len(fresh))))
+                conn.execute("UPDATE meta SET value = ? WHERE name = 'next_slot'", (next_slot + len(free),))
+
+                evict = len(fresh) - len(free)
+                if evict > 0:
+                    victims = conn.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict,)
+                    ).fetchall()
+                    conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+                    free.extend(slot for _, slot in victims)
+                    metrics.inc("embedding_cache_evictions", len(victims))
+
+                written = []
+                for key, slot in zip(fresh, free):
+                    self._tags[slot] = 0
+                    self._vectors[slot] = items[key]
+                    self._tags[slot] = _tag(key)
+                    written.append((key, slot, now))
+                self._dirty = True
+                conn.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", written)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= EMBEDDING_CACHE_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Сохраняет отложенные записи и сбрасывает memmap на диск."""
+        self._write_pending()
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            if not self._dirty:
+                return
+            self._vectors.flush()
+            self._tags.flush()
+            self._dirty = False
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+_CACHE_FAILED = False
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _CACHE, _CACHE_FAILED
+    if not EMBEDDING_CACHE_ENABLED or _CACHE_FAILED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None and not _CACHE_FAILED:
+                try:
+                    _CACHE = EmbeddingCache(
+                        EMBEDDING_CACHE_DIR,
+                        EMBEDDING_CACHE_CAPACITY,
+                        EMBEDDING_DIM,
+                        model_key=f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_QUANTIZATION}"
+                    )
+                except Exception as e:
+                    # Кэш — оптимизация: без него просто считаем эмбеддинги заново
+                    logger.error(f"Кэш эмбеддингов недоступен: {e}")
+                    _CACHE_FAILED = True
+    return _CACHE
+
+def flush():
+    """Сохраняет отложенные записи кэша; вызывается при остановке процесса."""
+    if _CACHE is None:
+        return
+    try:
+        _CACHE.flush()
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить кэш эмбеддингов: {e}")
+
+def encode(texts: Sequence[str], prefix: str, batch_size: int = 32) -> List[List[float]]:
+    """
+    Эмбеддинги для texts с префиксом модели ("query" / "passage").
+    Сначала ищем в кэше, модель вызываем только для промахов.
+    Эмбеддинги вопросов сохраняются в кэш отложенно, пачками, — не на пути запроса.
+    """
+    texts = list(texts)
+    cache = get_embedding_cache()
+    cached = [None] * len(texts)
+    if cache is not None:
+        try:
+            cached = cache.get_many(prefix, texts)
+        except Exception as e:
+            # Кэш — только ускорение: при сбое считаем все тексты промахами
+            logger.warning(f"Не удалось прочитать эмбеддинги из кэша: {e}")
+
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    result: List[Optional[List[float]]] = [None if v is None else v.tolist() for v in cached]
+    if missing:
+        model = get_embedding_model()
+        missing_texts = [texts[i] for i in missing]
+        vectors = model.encode(
+            [f"{prefix}: {text}" for text in missing_texts],
+            batch_size=max(1, min(batch_size, len(missing_texts)))
+        )
+        for i, vector in zip(missing, vectors):
+            result[i] = vector.tolist()
+        if cache is not None:
+            try:
+                if prefix == "query":
+                    cache.defer_many(prefix, missing_texts, vectors)
+                else:
+                    cache.put_many(prefix, missing_texts, vectors)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить эмбеддинги в кэш: {e}")
+    return result
@@ -0,0 +1,142 @@
+# backend/app/extraction.py
+import os
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("znatok.extraction")
+
+# Извлечение текста — CPU-bound (PyPDF2, python-docx, unstructured), поэтому выполняется
+# в пуле процессов. Большие PDF режутся на диапазоны страниц, которые разбираются параллельно.
+# Модуль намеренно лёгкий: дочерние процессы импортируют только его, без torch и Qdrant.
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", os.cpu_count() or 2))
+# Сколько страниц PDF отдаём одному процессу за раз
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+def read_text_file(filepath: str) -> str:
+    encodings = ['utf-8', 'cp1251', 'iso-8859-1']
+    for enc in encodings:
+        try:
+            with open(filepath, 'r', encoding=enc) as f:
+                return f.read()
+        except UnicodeDecodeError:
+            continue
+    with open(filepath, 'rb') as f:
+        return f.read().decode('utf-8', errors='replace')
+
+def extract_text(filepath: str, filename: str) -> str:
+    # Извлечение текста с использованием более простых методов
+    if filename.lower().endswith('.txt'):
+        return read_text_file(filepath)
+    elif filename.lower().endswith('.pdf'):
+        return extract_pdf_pages(filepath, 0, None)
+    elif filename.lower().endswith(('.docx', '.doc')):
+        # Используем python-docx для Word
+        from docx import Document
+        doc = Document(filepath)
+        return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+    else:
+        # Для других форматов используем минимальную версию unstructured
+        from unstructured.partition.auto import partition
+        elements = partition(filename=filepath)
+        return "\n".join([str(el) for el in elements])
+
+def extract_pdf_pages(filepath: str, start: int, stop: Optional[int]) -> str:
+    # Используем PyPDF2 для PDF; каждый процесс открывает файл сам
+    from PyPDF2 import PdfReader
+    reader = PdfReader(filepath)
+    text = ""
+    for page in reader.pages[start:stop]:
+        text += (page.extract_text() or "") + "\n"
+    return text
+
+def html_to_text(html: str) -> str:
+    """Текст из HTML (Confluence storage format)."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.get_text(separator="\n", strip=True)
+
+async def ahtml_to_text(html: str) -> str:
+    """html_to_text в пуле процессов (или в потоке, если пул отключён)."""
+    pool = get_extraction_pool()
+    if pool is None:
+        return await asyncio.to_thread(html_to_text, html)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, html_to_text, html)
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+
+def count_pdf_pages(filepath: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(filepath).pages)
+
+def get_extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """Общий пул процессов извлечения; EXTRACTION_PROCESSES=0 — извлекать в текущем потоке."""
+    global _POOL
+    if EXTRACTION_PROCESSES <= 0:
+        return None
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                # spawn: не форкаем процесс с загруженной моделью и потоками torch
+                _POOL = ProcessPoolExecutor(
+                    max_workers=EXTRACTION_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _POOL
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is broken:
+            _POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def extract_document(filepath: str, filename: str) -> Tuple[str, int]:
+    """
+    Извлекает текст документа в пуле процессов. Возвращает (текст, число страниц);
+    для не-PDF форматов страница одна.
+    """
+    pool = get_extraction_pool()
+    try:
+        return _extract_with_pool(pool, filepath, filename)
+    except BrokenProcessPool:
+        # Процесс упал (например, OOM на кривом файле) — следующая задача получит новый пул
+        logger.error(f"Пул извлечения сломан при обработке {filename}, пересоздаём")
+        if pool is not None:
+            _reset_pool(pool)
+        raise
+
+def _extract_with_pool(pool: Optional[ProcessPoolExecutor], filepath: str, filename: str) -> Tuple[str, int]:
+    if pool is None:
+        pages = count_pdf_pages(filepath) if filename.lower().endswith('.pdf') else 1
+        return extract_text(filepath, filename), pages
+
+    if not filename.lower().endswith('.pdf'):
+        return pool.submit(extract_text, filepath, filename).result(), 1
+
+    pages = count_pdf_pages(filepath)
+    if pages <= PDF_PAGES_PER_TASK:
+        return pool.submit(extract_pdf_pages, filepath, 0, None).result(), pages
+    futures = [
+        pool.submit(extract_pdf_pages, filepath, start, start + PDF_PAGES_PER_TASK)
+        for start in range(0, pages, PDF_PAGES_PER_TASK)
+    ]
+    # Порядок страниц сохраняем: собираем результаты в порядке отправки
+    parts: List[str] = [future.result() for future in futures]
+    return "".join(parts), pages
+
+def shutdown():
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
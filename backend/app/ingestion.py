@@ -1,83 +1,51 @@
 import os
+import time
+import asyncio
 import uuid
+import hashlib
 import logging
 from datetime import datetime
-from typing import List
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance, Filter, FieldCondition, MatchValue
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from qdrant_client.models import (
+    PointStruct, PointIdsList, Filter, FieldCondition, MatchValue,
+    SetPayload, SetPayloadOperation
+)
 from qdrant_client.http.models import FilterSelector  # ← добавили для удаления
-from sentence_transformers import SentenceTransformer
+from .registry import get_qdrant_client, get_collection_schema, forget_collection
+from .answer_cache import invalidate_source
+from .extraction import extract_document, extract_text, read_text_file  # noqa: F401 (реэкспорт)
+from .upsert_writer import UpsertWriter
+from .chunking import chunk_text_spans
+from . import metrics, embedding_cache, lexical, storage, blobs, qdrant_config
 
 logger = logging.getLogger("znatok.ingestion")
 
-_EMBEDDING_MODEL = None
-_QDRANT_CLIENT = None
-
-def get_embedding_model():
-    global _EMBEDDING_MODEL
-    if _EMBEDDING_MODEL is None:
-        logger.info("Загрузка модели эмбеддингов...")# Используйте (в 3 раза меньше и быстрее)
-        _EMBEDDING_MODEL = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        logger.info("Модель загружена.")
-    return _EMBEDDING_MODEL
-
-def get_qdrant_client():
-    global _QDRANT_CLIENT
-    if _QDRANT_CLIENT is None:
-        host = os.getenv("QDRANT_HOST", "qdrant")
-        port = int(os.getenv("QDRANT_PORT", 6333))
-        _QDRANT_CLIENT = QdrantClient(host=host, port=port)
-    return _QDRANT_CLIENT
+# Эмбеддинги документа считаем пачками, чтобы отдавать прогресс по ходу
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+
+ProgressCallback = Callable[[float, str], None]
 
 def ensure_collection_exists(collection_name: str):
+    if get_collection_schema(collection_name) is not None:
+        return
     client = get_qdrant_client()
     if not client.collection_exists(collection_name):
-        logger.info(f"Создаём коллекцию {collection_name} с размерностью 384")
-        client.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=384, distance=Distance.COSINE)  # ← 384 вместо 1024
-        )
-
-def chunk_text(text: str, max_length: int = 1024) -> List[str]:
-    import re
-    if not text.strip():
-        return []
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks = []
-    current = ""
-    for sent in sentences:
-        if len(current) + len(sent) < max_length:
-            current += " " + sent
-        else:
-            if current:
-                chunks.append(current.strip())
-            current = sent
-    if current:
-        chunks.append(current.strip())
-    return chunks or [text[:max_length]]
-
-def read_text_file(filepath: str) -> str:
-    encodings = ['utf-8', 'cp1251', 'iso-8859-1']
-    for enc in encodings:
-        try:
-            with open(filepath, 'r', encoding=enc) as f:
-                return f.read()
-        except UnicodeDecodeError:
-            continue
-    with open(filepath, 'rb') as f:
-        return f.read().decode('utf-8', errors='replace')
+        logger.info(f"Создаём коллекцию {collection_name} с размерностью {qdrant_config.VECTOR_SIZE}")
+        qdrant_config.create_collection(client, collection_name)
+    forget_collection(collection_name)
+    get_collection_schema(collection_name)
 
-def delete_document_from_qdrant(filename: str):
-    """Удаляет документ из Qdrant по имени файла."""
+def delete_document_from_qdrant(filename: str) -> bool:
+    """Удаляет документ из Qdrant по имени файла. False — удалить не удалось, документ остался."""
     if not filename or filename == "undefined":
         logger.warning(f"Попытка удаления с невалидным именем: {filename}")
-        return
+        return False
 
     try:
         client = get_qdrant_client()
         collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
-        if not client.collection_exists(collection):
-            return
+        if get_collection_schema(collection) is None:
+            return True
 
         # ВАЖНО: используем оригинальное имя файла (без хэша)
         # При индексации мы сохраняем оригинальное имя в payload.source
@@ -89,111 +57,420 @@ def delete_document_from_qdrant(filename: str):
             collection_name=collection,
             points_selector=FilterSelector(filter=delete_filter)
         )
+        lexical.delete_source(filename)
+        removed = storage.delete_document(filename)
+        if removed:
+            _release_text(removed.get("text_hash"))
+        invalidate_source(filename)
         logger.info(f"Удалено из Qdrant: {filename}")
+        return True
     except Exception as e:
         logger.warning(f"Ошибка удаления из Qdrant: {e}")
+        return False
+
+def _report(progress: Optional[ProgressCallback], value: float, stage: str):
+    if progress is not None:
+        try:
+            progress(value, stage)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс ({stage}): {e}")
 
-def index_document(filepath: str, filename: str, department: str):
-    """Индексирует документ в Qdrant."""
+def is_document_unchanged(filename: str, department: str, content_hash: str) -> bool:
+    """Документ уже проиндексирован из файла с тем же хэшем содержимого."""
+    collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    if not content_hash or get_collection_schema(collection) is None:
+        return False
+    points, _ = get_qdrant_client().scroll(
+        collection_name=collection,
+        scroll_filter=Filter(must=[
+            FieldCondition(key="source", match=MatchValue(value=filename)),
+            FieldCondition(key="department", match=MatchValue(value=department)),
+            FieldCondition(key="content_hash", match=MatchValue(value=content_hash)),
+        ]),
+        limit=1,
+        with_payload=False
+    )
+    return bool(points)
+
+def _catalog_unchanged(source: str, department: str, content_hash: str) -> Optional[Dict]:
+    """Запись каталога, если источник уже проиндексирован из того же текста."""
     try:
-        delete_document_from_qdrant(filename)
-
-        # Извлечение текста с использованием более простых методов
-        if filename.lower().endswith('.txt'):
-            text = read_text_file(filepath)
-        elif filename.lower().endswith('.pdf'):
-            # Используем PyPDF2 для PDF
-            from PyPDF2 import PdfReader
-            reader = PdfReader(filepath)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        elif filename.lower().endswith(('.docx', '.doc')):
-            # Используем python-docx для Word
-            from docx import Document
-            doc = Document(filepath)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-        else:
-            # Для других форматов используем минимальную версию unstructured
-            from unstructured.partition.auto import partition
-            elements = partition(filename=filepath)
-            text = "\n".join([str(el) for el in elements])
-        
-        if not text.strip():
-            raise ValueError("Пустой текст")
+        doc = storage.get_document(source)
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать каталог для {source}: {e}")
+        return None
+    if doc and doc.get("department") == department and doc.get("content_hash") == content_hash:
+        return doc
+    return None
+
+# ======================
+# Инкрементальная индексация
+# ======================
+# ID точки детерминирован: uuid5(source, department, хэш текста чанка).
+# При переиндексации считаем эмбеддинги только для новых чанков,
+# удаляем исчезнувшие, а неизменный документ не трогаем вовсе.
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a52-8f0e-4d55-9a51-5b0f3c7e2d11")
+
+def chunk_hash(chunk: str) -> str:
+    normalized = " ".join(chunk.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
 
-        chunks = chunk_text(text)
-        if not chunks:
-            raise ValueError("Нет чанков")
+def chunk_point_id(source: str, department: str, chunk_digest: str) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\x00{department}\x00{chunk_digest}"))
+
+# Положение чанка в документе: порядковый номер и байтовые границы в полном тексте (UTF-8),
+# который хранится блобом (app.blobs). По ним текст собирается в исходном порядке.
+# Одинаковые чанки документа — одна точка; границы повторных вхождений — в byte_repeats.
+LAYOUT_FIELDS = ("chunk_index", "byte_start", "byte_end", "byte_repeats")
+
+def _existing_points(collection: str, source: str) -> Dict[str, Dict]:
+    """ID точек источника и их положение в документе (пустое у точек, записанных до LAYOUT_FIELDS)."""
+    client = get_qdrant_client()
+    existing: Dict[str, Dict] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            scroll_filter=Filter(must=[FieldCondition(key="source", match=MatchValue(value=source))]),
+            limit=1000,
+            offset=offset,
+            with_payload=list(LAYOUT_FIELDS),
+            with_vectors=False
+        )
+        for point in points:
+            existing[str(point.id)] = {key: point.payload[key] for key in LAYOUT_FIELDS if key in (point.payload or {})}
+        if offset is None:
+            return existing
 
-        model = get_embedding_model()
-        embeddings = model.encode([f"passage: {chunk}" for chunk in chunks]).tolist()
+def byte_spans(text: str, spans: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Символьные границы чанков -> байтовые в text.encode("utf-8"), за один проход по тексту."""
+    offsets: Dict[int, int] = {}
+    pos = total = 0
+    for boundary in sorted({p for span in spans for p in span}):
+        total += len(text[pos:boundary].encode("utf-8"))
+        offsets[boundary] = total
+        pos = boundary
+    return [(offsets[start], offsets[end]) for start, end in spans]
 
-        points = []
-        uploaded_at = datetime.utcnow().isoformat()
-        for chunk, emb in zip(chunks, embeddings):
-            points.append(PointStruct(
-                id=str(uuid.uuid4()),
+def _set_layout(collection: str, layout: Dict[str, Dict]):
+    """Обновляет положение сдвинувшихся чанков одним пакетным запросом на 500 точек."""
+    client = get_qdrant_client()
+    items = list(layout.items())
+    for start in range(0, len(items), 500):
+        client.batch_update_points(
+            collection_name=collection,
+            update_operations=[
+                SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in items[start:start + 500]
+            ]
+        )
+
+def _new_stats() -> Dict[str, int]:
+    return {"chunks": 0, "embedded": 0, "reused": 0, "deleted": 0, "unchanged_documents": 0}
+
+def _merge_stats(target: Optional[Dict[str, int]], stats: Dict[str, int]):
+    if target is None:
+        return
+    for key, value in stats.items():
+        target[key] = target.get(key, 0) + value
+
+def new_upsert_writer() -> UpsertWriter:
+    """Писатель для сессии индексации; точки пишутся пачками, кэш ответов сбрасывается после подтверждения."""
+    collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    return UpsertWriter(get_qdrant_client(), collection, on_confirmed=invalidate_source)
+
+def _sync_chunks(chunks: List[str], source: str, department: str,
+                 extra_payload: Optional[Dict] = None,
+                 progress: Optional[ProgressCallback] = None,
+                 writer: Optional[UpsertWriter] = None,
+                 positions: Optional[List[Tuple[int, int]]] = None) -> Dict[str, int]:
+    """
+    Приводит точки источника в Qdrant к набору chunks, пересчитывая только изменившееся.
+    Если передан общий writer (синхронизация множества страниц), точки копятся в его пачках
+    вместе с точками других документов, а видимыми становятся после writer.flush().
+    positions — байтовые границы чанков в полном тексте; вместе с порядковым номером
+    пишутся в payload, у неизменившихся чанков обновляются, если текст вокруг них сдвинулся.
+    """
+    extra_payload = extra_payload or {}
+    collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    ensure_collection_exists(collection)
+    client = get_qdrant_client()
+
+    # Одинаковые чанки внутри документа храним один раз (положение — первого вхождения,
+    # остальные вхождения — в byte_repeats)
+    target: Dict[str, str] = {}
+    layout: Dict[str, Dict] = {}
+    for ordinal, chunk in enumerate(chunks):
+        point_id = chunk_point_id(source, department, chunk_hash(chunk))
+        if point_id in target:
+            if positions is not None:
+                # Без этих границ текст повтора при сборке документа из чанков потерялся бы
+                layout[point_id].setdefault("byte_repeats", []).append(list(positions[ordinal]))
+            continue
+        target[point_id] = chunk
+        layout[point_id] = {"chunk_index": ordinal}
+        if positions is not None:
+            layout[point_id]["byte_start"], layout[point_id]["byte_end"] = positions[ordinal]
+
+    existing = _existing_points(collection, source)
+    new_ids = [point_id for point_id in target if point_id not in existing]
+    kept_ids = [point_id for point_id in target if point_id in existing]
+    vanished_ids = [point_id for point_id in existing if point_id not in target]
+    moved = {point_id: layout[point_id] for point_id in kept_ids if existing[point_id] != layout[point_id]}
+
+    stats = _new_stats()
+    stats["chunks"] = len(target)
+    stats["reused"] = len(kept_ids)
+    stats["deleted"] = len(vanished_ids)
+    metrics.inc("embeddings_avoided", len(kept_ids))
+
+    if not new_ids and not vanished_ids:
+        stats["unchanged_documents"] = 1
+        if extra_payload and kept_ids:
+            # Текст тот же, но метаданные (например, хэш файла) могли смениться
+            client.set_payload(collection_name=collection, payload=extra_payload, points=kept_ids)
+        if moved:
+            # Точки, записанные до появления положения чанков, получают его здесь
+            _set_layout(collection, moved)
+        logger.info(f"{source}: без изменений ({len(kept_ids)} чанков), пропускаем")
+        return stats
+
+    own_writer = writer is None
+    if own_writer:
+        writer = new_upsert_writer()
+
+    uploaded_at = datetime.utcnow().isoformat()
+    embedded = 0
+    for start in range(0, len(new_ids), EMBED_BATCH_SIZE):
+        batch_ids = new_ids[start:start + EMBED_BATCH_SIZE]
+        # Повторяющиеся абзацы (в том числе из других документов) берутся из кэша эмбеддингов
+        embeddings = embedding_cache.encode([target[point_id] for point_id in batch_ids], "passage")
+        points = [
+            PointStruct(
+                id=point_id,
                 vector=emb,
                 payload={
-                    "text": chunk,
-                    "source": filename,
+                    "text": target[point_id],
+                    "source": source,
                     "department": department,
-                    "uploaded_at": uploaded_at
+                    "uploaded_at": uploaded_at,
+                    **layout[point_id],
+                    **extra_payload
                 }
-            ))
+            )
+            for point_id, emb in zip(batch_ids, embeddings)
+        ]
+        # Запись пачки идёт в фоне, пока считаются эмбеддинги следующей
+        writer.add(points, source=source)
+        lexical.add_points(points)
+        embedded += len(points)
+        _report(progress, 0.25 + 0.65 * embedded / len(new_ids), "embed")
+    stats["embedded"] = embedded
+    metrics.inc("embeddings_computed", embedded)
 
-        collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
-        ensure_collection_exists(collection)
-        client = get_qdrant_client()
-        client.upsert(collection_name=collection, points=points)
+    if vanished_ids:
+        client.delete(collection_name=collection, points_selector=PointIdsList(points=vanished_ids))
+        lexical.delete_points(vanished_ids)
+    if extra_payload and kept_ids:
+        client.set_payload(collection_name=collection, payload=extra_payload, points=kept_ids)
+    if moved:
+        _set_layout(collection, moved)
+
+    if own_writer:
+        _report(progress, 0.9, "upsert")
+        writer.flush()
+    if not new_ids:
+        # Только удаления — писателю подтверждать нечего
+        invalidate_source(source)
+
+    logger.info(
+        f"{source}: новых чанков {embedded}, без изменений {len(kept_ids)}, удалено {len(vanished_ids)}"
+    )
+    return stats
+
+def record_stage(stage: str, unit: str, count: int, seconds: float):
+    """Пропускная способность этапа индексации: ingest_<stage>_<unit>_per_sec в /api/metrics."""
+    metrics.inc(f"ingest_{stage}_{unit}", count)
+    metrics.inc(f"ingest_{stage}_seconds", seconds)
+    if seconds > 0 and count:
+        metrics.observe(f"ingest_{stage}_{unit}_per_sec", count / seconds)
 
-        logger.info(f"Проиндексировано {len(chunks)} чанков из {filename}")
-        return len(chunks)
+def extract_stage(filepath: str, filename: str,
+                  progress: Optional[ProgressCallback] = None) -> str:
+    """Этап extract: текст документа из пула процессов (app.extraction)."""
+    _report(progress, 0.05, "extract")
+    started = time.perf_counter()
+    text, pages = extract_document(filepath, filename)
+    elapsed = time.perf_counter() - started
+    record_stage("extract", "pages", pages, elapsed)
+    logger.info(f"{filename}: извлечено {pages} стр. за {elapsed:.2f}с")
+    if not text.strip():
+        raise ValueError("Пустой текст")
+    return text
+
+def _chunk(text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Чанки текста и их байтовые границы в text.encode("utf-8")."""
+    pieces = chunk_text_spans(text)
+    return [chunk for chunk, _ in pieces], byte_spans(text, [span for _, span in pieces])
 
+def _release_text(text_hash: Optional[str], keep: Optional[str] = None):
+    """Удаляет блоб текста, если на него больше не ссылается ни один документ каталога."""
+    if not text_hash or text_hash == keep:
+        return
+    try:
+        if not storage.is_text_referenced(text_hash):
+            blobs.delete(text_hash)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить текст {text_hash}: {e}")
+
+def _catalog(source: str, department: str, origin: str, chunks: int,
+             content_hash: Optional[str] = None, size: Optional[int] = None,
+             text: Optional[str] = None):
+    try:
+        text_hash = blobs.put_text(text) if text is not None else None
+        previous = storage.upsert_document(
+            source, department, origin, chunks, content_hash=content_hash, size=size, text_hash=text_hash
+        )
+        _release_text(previous, keep=text_hash)
+    except Exception as e:
+        # Документ уже в Qdrant; каталог поправится при следующей индексации
+        logger.error(f"Не удалось записать {source} в каталог документов: {e}")
+
+def index_extracted(text: str, filename: str, department: str,
+                    progress: Optional[ProgressCallback] = None,
+                    content_hash: Optional[str] = None,
+                    stats: Optional[Dict[str, int]] = None,
+                    size: Optional[int] = None) -> int:
+    """Этапы chunk -> embed -> upsert для уже извлечённого текста."""
+    _report(progress, 0.2, "chunk")
+    started = time.perf_counter()
+    chunks, positions = _chunk(text)
+    record_stage("chunk", "chunks", len(chunks), time.perf_counter() - started)
+    if not chunks:
+        raise ValueError("Нет чанков")
+
+    started = time.perf_counter()
+    result = _sync_chunks(chunks, filename, department, {"content_hash": content_hash}, progress,
+                          positions=positions)
+    record_stage("embed", "chunks", result["embedded"], time.perf_counter() - started)
+    _merge_stats(stats, result)
+    _catalog(filename, department, storage.ORIGIN_UPLOAD, result["chunks"], content_hash, size, text)
+
+    logger.info(f"Проиндексировано {result['chunks']} чанков из {filename}")
+    return result["chunks"]
+
+def index_document(filepath: str, filename: str, department: str,
+                   progress: Optional[ProgressCallback] = None,
+                   content_hash: Optional[str] = None,
+                   stats: Optional[Dict[str, int]] = None,
+                   size: Optional[int] = None):
+    """
+    Индексирует документ в Qdrant. progress(доля 0..1, этап) вызывается по ходу работы.
+    content_hash (sha256 файла) сохраняется в payload, чтобы не переиндексировать тот же файл.
+    В stats (если передан) накапливается, сколько эмбеддингов посчитано и сколько переиспользовано.
+    """
+    try:
+        text = extract_stage(filepath, filename, progress)
+        return index_extracted(text, filename, department, progress, content_hash, stats, size)
     except Exception as e:
         logger.error(f"Ошибка индексации {filename}: {e}", exc_info=True)
         raise
     
-async def index_text_content(text: str, source: str, department: str = "all"):
+def index_text(text: str, source: str, department: str = "all",
+               writer: Optional[UpsertWriter] = None,
+               origin: str = storage.ORIGIN_TEXT) -> Dict[str, int]:
     """
-    Индексирует чистый текст (без файла на диске)
+    Синхронная индексация чистого текста (без файла на диске). Возвращает статистику.
+    origin — откуда текст (confluence, bitrix24_kb, ...), для каталога документов.
     """
     if not text.strip():
         raise ValueError("Пустой текст")
 
-    chunks = chunk_text(text)
+    content_hash = chunk_hash(text)
+    doc = _catalog_unchanged(source, department, content_hash)
+    if doc is not None:
+        # Как is_document_unchanged для загрузок: тот же текст не режем и не сверяем с Qdrant
+        result = _new_stats()
+        result["chunks"] = result["reused"] = doc.get("chunks") or 0
+        result["unchanged_documents"] = 1
+        metrics.inc("embeddings_avoided", result["reused"])
+        logger.info(f"{source}: текст не изменился ({result['chunks']} чанков), пропускаем")
+        return result
+
+    chunks, positions = _chunk(text)
     if not chunks:
         raise ValueError("Нет чанков")
 
-    model = get_embedding_model()
-    embeddings = model.encode([f"passage: {chunk}" for chunk in chunks]).tolist()
+    result = _sync_chunks(chunks, source, department, writer=writer, positions=positions)
+    _catalog(source, department, origin, result["chunks"], content_hash, len(text.encode("utf-8")), text)
+    logger.info(f"Проиндексировано {result['chunks']} чанков из источника: {source}")
+    return result
 
-    points = []
-    uploaded_at = datetime.utcnow().isoformat()
-    for chunk, emb in zip(chunks, embeddings):
-        payload = {
-            "text": chunk,
-            "source": source,  # ← теперь это URL
-            "department": department,
-            "uploaded_at": uploaded_at
-        }
-        # Можно добавить метаданные, если нужно
-        points.append(PointStruct(id=str(uuid.uuid4()), vector=emb, payload=payload))
+async def index_text_content(text: str, source: str, department: str = "all",
+                             stats: Optional[Dict[str, int]] = None,
+                             writer: Optional[UpsertWriter] = None,
+                             origin: str = storage.ORIGIN_TEXT):
+    """
+    Индексирует чистый текст (без файла на диске). Эмбеддинги и запросы к Qdrant
+    выполняются в пуле потоков, event loop не блокируется.
+    С общим writer точки станут видны в поиске только после writer.flush().
+    """
+    result = await asyncio.to_thread(index_text, text, source, department, writer, origin)
+    # stats объединяем в потоке event loop — параллельные вызовы не гоняются за словарь
+    _merge_stats(stats, result)
+    return result["chunks"]
 
+
+# ======================
+# Полный текст документа
+# ======================
+def _assemble_from_points(source: str) -> Optional[bytes]:
+    """
+    Текст документа из чанков в Qdrant — для документов, проиндексированных до появления блобов.
+    """
     collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
-    ensure_collection_exists(collection)
+    if get_collection_schema(collection) is None:
+        return None
     client = get_qdrant_client()
-    
-    # Удаляем старую версию по source
-    delete_filter = Filter(
-        must=[FieldCondition(key="source", match=MatchValue(value=source))]
-    )
-    client.delete(
-        collection_name=collection,
-        points_selector=FilterSelector(filter=delete_filter)
-    )
-    
-    client.upsert(collection_name=collection, points=points)
-    logger.info(f"Проиндексировано {len(chunks)} чанков из источника: {source}")
-    return len(chunks)
\ No newline at end of file
+    payloads: List[Dict] = []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            scroll_filter=Filter(must=[FieldCondition(key="source", match=MatchValue(value=source))]),
+            limit=1000,
+            offset=offset,
+            with_payload=["text", *LAYOUT_FIELDS],
+            with_vectors=False
+        )
+        payloads.extend(point.payload for point in points)
+        if offset is None:
+            break
+    if not payloads:
+        return None
+    return _assemble_payloads(payloads)
+
+def _assemble_payloads(payloads: List[Dict]) -> bytes:
+    """
+    Чанки с байтовыми границами раскладываются по ним (перекрытия не дублируются,
+    повторы — по byte_repeats), без границ — склеиваются по порядковому номеру.
+    """
+    if all("byte_start" in payload for payload in payloads):
+        pieces = []
+        for payload in payloads:
+            chunk = payload.get("text", "").encode("utf-8")
+            pieces.append((payload["byte_start"], payload["byte_end"], chunk))
+            pieces.extend((start, end, chunk) for start, end in payload.get("byte_repeats") or ())
+        out = bytearray()
+        for start, _, chunk in sorted(pieces, key=lambda piece: (piece[0], piece[1])):
+            if start > len(out):
+                # Чанкеры оставляют между чанками только пробелы и переводы строк (разделители
+                # предложений), а повторы чанков разложены по byte_repeats. Сами пробельные
+                # символы не хранятся — восстанавливаем их пробелами той же длины в байтах
+                out += b" " * (start - len(out))
+            out += chunk[len(out) - start:]
+        return bytes(out).decode("utf-8", errors="replace").encode("utf-8")
+
+    payloads.sort(key=lambda p: p.get("chunk_index", 0))
+    return "\n\n".join(payload.get("text", "") for payload in payloads).encode("utf-8")
+
@@ -0,0 +1,220 @@
+# backend/app/jobs.py
+import os
+import uuid
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("znatok.jobs")
+
+# Очередь задач индексации в SQLite: /api/upload кладёт задачу и сразу отвечает,
+# воркер (app.worker) забирает задачи и индексирует документы.
+JOBS_DB = os.getenv("JOBS_DB", "/app/data/jobs.db")
+# Сколько раз задачу можно забрать: документ, на котором воркер падает, не должен крутиться вечно
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", 3))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    filepath TEXT NOT NULL,
+    department TEXT NOT NULL,
+    content_hash TEXT,
+    size INTEGER,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    chunks INTEGER,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+"""
+
+# Колонки, добавленные после первой версии схемы: (имя, тип)
+_MIGRATIONS = [
+    ("content_hash", "TEXT"),
+    ("size", "INTEGER"),
+]
+
+_INITIALIZED = set()
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+def _migrate(conn: sqlite3.Connection):
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column, column_type in _MIGRATIONS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+@contextmanager
+def _connect():
+    path = JOBS_DB
+    if path not in _INITIALIZED:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        if path not in _INITIALIZED:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _migrate(conn)
+            _INITIALIZED.add(path)
+        yield conn
+    finally:
+        conn.close()
+
+def discard_upload(filepath: Optional[str]):
+    """Удаляет файл загрузки, когда задача завершена окончательно (готово, без изменений или failed)."""
+    if not filepath:
+        return
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Не удалось удалить файл загрузки {filepath}: {e}")
+
+def new_job_id() -> str:
+    return str(uuid.uuid4())
+
+def enqueue_document(filename: str, filepath: str, department: str,
+                     content_hash: Optional[str] = None, size: Optional[int] = None,
+                     job_id: Optional[str] = None) -> str:
+    """job_id можно выдать заранее (new_job_id), чтобы сохранить файл под уникальным путём."""
+    job_id = job_id or new_job_id()
+    now = _now()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, filename, filepath, department, content_hash, size, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, filename, filepath, department, content_hash, size, STATUS_QUEUED, now, now)
+        )
+    logger.info(f"Задача {job_id} поставлена в очередь: {filename}")
+    return job_id
+
+def claim_next(worker_id: str) -> Optional[Dict]:
+    """Атомарно забирает самую старую задачу из очереди."""
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = _now()
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                "started_at = ?, updated_at = ?, stage = ?, progress = 0 WHERE id = ?",
+                (STATUS_RUNNING, worker_id, now, now, "started", row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    job = dict(row)
+    job["status"] = STATUS_RUNNING
+    return job
+
+def update_progress(job_id: str, progress: float, stage: str):
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET progress = ?, stage = ?, updated_at = ? WHERE id = ?",
+            (round(progress, 3), stage, _now(), job_id)
+        )
+
+def complete_job(job_id: str, chunks: Optional[int], stage: str = "done"):
+    now = _now()
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, progress = 1, stage = ?, chunks = ?, error = NULL, "
+            "finished_at = ?, updated_at = ? WHERE id = ?",
+            (STATUS_DONE, stage, chunks, now, now, job_id)
+        )
+
+def fail_job(job_id: str, error: str):
+    now = _now()
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+            (STATUS_FAILED, error, now, now, job_id)
+        )
+
+def requeue_stale(max_age_seconds: float, max_attempts: int = JOBS_MAX_ATTEMPTS) -> int:
+    """
+    Возвращает в очередь задачи, зависшие в running (например, воркер упал).
+    Задачи, исчерпавшие max_attempts попыток, вместо этого помечаются failed.
+    """
+    cutoff = (datetime.utcnow() - timedelta(seconds=max_age_seconds)).isoformat()
+    now = _now()
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            abandoned = [row["filepath"] for row in conn.execute(
+                "SELECT filepath FROM jobs WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                (STATUS_RUNNING, cutoff, max_attempts)
+            )]
+            failed = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, error = ?, finished_at = ?, updated_at = ? "
+                "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                (STATUS_FAILED, "abandoned", f"Воркер не завершил задачу за {max_attempts} попыток",
+                 now, now, STATUS_RUNNING, cutoff, max_attempts)
+            ).rowcount
+            count = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (STATUS_QUEUED, "requeued", now, STATUS_RUNNING, cutoff)
+            ).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    for filepath in abandoned:
+        discard_upload(filepath)
+    if failed:
+        logger.error(f"Зависшие задачи исчерпали попытки и помечены failed: {failed}")
+    if count:
+        logger.warning(f"Возвращено в очередь зависших задач: {count}")
+    return count
+
+def get_job(job_id: str) -> Optional[Dict]:
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _public(dict(row)) if row else None
+
+def list_jobs(status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+    with _connect() as conn:
+        if status:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                (status, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+    return [_public(dict(row)) for row in rows]
+
+def queue_stats() -> Dict[str, int]:
+    with _connect() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+    return {row["status"]: row["n"] for row in rows}
+
+def _public(job: Dict) -> Dict:
+    job.pop("filepath", None)  # не возвращаем путь наружу
+    return job
@@ -0,0 +1,290 @@
+# backend/app/lexical.py
+import os
+import re
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("znatok.lexical")
+
+# Лексический индекс чанков рядом с Qdrant: SQLite FTS5 с ранжированием bm25().
+# MiniLM плохо различает точные идентификаторы (номера форм и приказов, артикулы, фамилии),
+# поэтому retrieval ищет и по векторам, и по словам, и сливает выдачи (RRF).
+# Слова приводятся к основе (Snowball для русского), идентификаторы вида «ПР-2023/15»
+# индексируются и по частям, и целиком. Индекс обновляется теми же вызовами, что и Qdrant
+# (app.ingestion), ID записей — ID точек Qdrant; текст чанков хранится только в Qdrant.
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_DB = os.getenv("LEXICAL_INDEX_DB", "/app/data/lexical.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    point_id TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    department TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(terms, tokenize = 'unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Служебные слова не несут смысла для поиска, а с OR-запросом находили бы всё подряд
+_STOPWORDS = frozenset("""
+а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до его
+ее если есть еще же за здесь и из или им их к как какая какие каким какой какое когда кто куда ли
+либо между меня мне много может можно мой мы на над надо наш не него нее нет ни них но ну о об однако
+он она они оно от очень по под при про с со так также такой там те тем то того тоже той только том
+ты у уже хотя чего чей чем что чтобы чье чья эта эти это этого этой этом этот я
+the a an and or of to in on for is are be by with what how which
+""".split())
+
+# Слово или идентификатор: буквы/цифры, соединённые дефисом, точкой или слэшем
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_SPLIT_RE = re.compile(r"[-./_]")
+
+try:
+    import snowballstemmer
+    _RU_STEMMER = snowballstemmer.stemmer("russian")
+    _EN_STEMMER = snowballstemmer.stemmer("english")
+except ImportError:
+    _RU_STEMMER = _EN_STEMMER = None
+    logger.warning("snowballstemmer не установлен, используем упрощённый стемминг")
+
+# Упрощённый стемминг на случай отсутствия snowballstemmer: отрезаем типичные окончания
+_RU_ENDINGS = sorted("""
+иями ями ами ией ий ый ой ей ам ям ах ях ом ем ою ею ую юю ая яя ое ее ые ие ых их ым им ого его ому ему
+ться ются ется ится ятся атся утся тся ешь ишь ете ите ет ит ут ют ят ат ал ял ил ла ло ли ть ти
+ов ев ия ья ие ье а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+_VOWELS = set("аеиоуыэюяё")
+
+def _light_stem(word: str) -> str:
+    first_vowel = next((i for i, ch in enumerate(word) if ch in _VOWELS), None)
+    if first_vowel is None:
+        return word
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) > first_vowel:
+            return word[:-len(ending)]
+    return word
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    if not word.isalpha():
+        return word
+    is_cyrillic = "а" <= word[0] <= "я" or word[0] == "ё"
+    if _RU_STEMMER is not None:
+        return (_RU_STEMMER if is_cyrillic else _EN_STEMMER).stemWord(word)
+    return _light_stem(word) if is_cyrillic else word
+
+def analyze(text: str) -> List[str]:
+    """Термы для индекса и запроса: основы слов без служебных, идентификаторы целиком и по частям."""
+    terms: List[str] = []
+    for match in _TOKEN_RE.finditer(text.lower().replace("ё", "е")):
+        token = match.group()
+        parts = [part for part in _SPLIT_RE.split(token) if part]
+        if len(parts) > 1:
+            terms.append("".join(parts))
+        for part in parts:
+            if part not in _STOPWORDS:
+                terms.append(stem(part))
+    return terms
+
+def term_coverage(query: str, text: str) -> float:
+    """Доля различных термов запроса, встречающихся в тексте (0 — ни одного, 1 — все)."""
+    wanted = set(analyze(query))
+    if not wanted:
+        return 0.0
+    return len(wanted & set(analyze(text))) / len(wanted)
+
+def _match_query(terms: Iterable[str]) -> str:
+    # Каждый терм в кавычках: слова вроде OR/NOT не станут операторами FTS5
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(_SCHEMA)
+                        self._initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, chunks: Sequence[Tuple[str, str, str, str]]):
+        """chunks: (point_id, source, department, text). Уже известные point_id пропускаются."""
+        if not chunks:
+            return
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for point_id, source, department, text in chunks:
+                    cur = conn.execute(
+                        "INSERT INTO chunks (point_id, source, department) VALUES (?, ?, ?) "
+                        "ON CONFLICT(point_id) DO NOTHING",
+                        (point_id, source, department)
+                    )
+                    if cur.rowcount:
+                        conn.execute(
+                            "INSERT INTO chunks_fts (rowid, terms) VALUES (?, ?)",
+                            (cur.lastrowid, " ".join(analyze(text)))
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _delete_where(self, where: str, params: Sequence):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(f"DELETE FROM chunks_fts WHERE rowid IN (SELECT id FROM chunks WHERE {where})", params)
+                conn.execute(f"DELETE FROM chunks WHERE {where}", params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def delete_ids(self, point_ids: Sequence[str]):
+        for start in range(0, len(point_ids), 500):
+            batch = list(point_ids[start:start + 500])
+            self._delete_where(f"point_id IN ({','.join('?' * len(batch))})", batch)
+
+    def delete_source(self, source: str):
+        self._delete_where("source = ?", (source,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chunks_fts")
+            conn.execute("DELETE FROM chunks")
+            conn.execute("DELETE FROM meta")
+
+    def search(self, query: str, department: Optional[str] = None, limit: int = 20) -> List[Tuple[str, float]]:
+        """(point_id, bm25) по убыванию релевантности."""
+        terms = analyze(query)
+        if not terms:
+            return []
+        sql = (
+            "SELECT chunks.point_id, -bm25(chunks_fts) AS score FROM chunks_fts "
+            "JOIN chunks ON chunks.id = chunks_fts.rowid WHERE chunks_fts MATCH ?"
+        )
+        params: List = [_match_query(terms)]
+        if department and department != "all":
+            # Та же семантика, что у build_metadata_filter для Qdrant
+            sql += " AND chunks.department = ?"
+            params.append(department)
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [(row[0], row[1]) for row in conn.execute(sql, params)]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+_INDEX: Optional[LexicalIndex] = None
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    global _INDEX
+    if not LEXICAL_INDEX_ENABLED:
+        return None
+    if _INDEX is None:
+        _INDEX = LexicalIndex(LEXICAL_INDEX_DB)
+    return _INDEX
+
+# Обёртки для ingestion: ошибка лексического индекса не должна ронять индексацию в Qdrant
+def add_points(points):
+    index = get_lexical_index()
+    if index is None or not points:
+        return
+    try:
+        index.add([
+            (str(point.id), point.payload.get("source", ""), point.payload.get("department", "all"),
+             point.payload.get("text", ""))
+            for point in points
+        ])
+    except Exception as e:
+        logger.error(f"Ошибка записи в лексический индекс: {e}")
+
+def delete_points(point_ids: Sequence[str]):
+    index = get_lexical_index()
+    if index is None or not point_ids:
+        return
+    try:
+        index.delete_ids([str(point_id) for point_id in point_ids])
+    except Exception as e:
+        logger.error(f"Ошибка удаления из лексического индекса: {e}")
+
+def delete_source(source: str):
+    index = get_lexical_index()
+    if index is None:
+        return
+    try:
+        index.delete_source(source)
+    except Exception as e:
+        logger.error(f"Ошибка удаления {source} из лексического индекса: {e}")
+
+def clear():
+    index = get_lexical_index()
+    if index is not None:
+        index.clear()
+
+def backfill(batch_size: int = 1000) -> int:
+    """
+    Однократно заполняет индекс из уже существующей коллекции Qdrant
+    (точки, проиндексированные до появления лексического индекса).
+    """
+    from .registry import get_qdrant_client, get_collection_schema
+
+    index = get_lexical_index()
+    collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    if index is None or index.get_meta(f"backfilled:{collection}"):
+        return 0
+    if get_collection_schema(collection) is None:
+        index.set_meta(f"backfilled:{collection}", "1")
+        return 0
+
+    client = get_qdrant_client()
+    added, offset = 0, None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["text", "source", "department"],
+            with_vectors=False
+        )
+        index.add([
+            (str(point.id), point.payload.get("source", ""), point.payload.get("department", "all"),
+             point.payload.get("text", ""))
+            for point in points
+        ])
+        added += len(points)
+        if offset is None:
+            break
+    index.set_meta(f"backfilled:{collection}", "1")
+    logger.info(f"Лексический индекс заполнен из {collection}: {added} чанков")
+    return added
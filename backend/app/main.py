@@ -1,16 +1,17 @@
 # backend/app/main.py
 import os
+import json
+import time
+import hashlib
 import logging
 import asyncio
 import httpx
 from bs4 import BeautifulSoup
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from collections import defaultdict
-from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 
@@ -21,208 +22,6 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("znatok")
 
-# Простое in-memory хранилище контекста (в проде — Redis)
-_CHAT_CONTEXTS = defaultdict(list)  # conversation_id -> list of messages
-_CONTEXT_TTL = timedelta(minutes=30)
-
-def _cleanup_old_contexts():
-    """Очистка старых контекстов"""
-    now = datetime.utcnow()
-    to_delete = []
-    for conv_id, msgs in _CHAT_CONTEXTS.items():
-        if msgs and (now - msgs[-1].get("timestamp", now)) > _CONTEXT_TTL:
-            to_delete.append(conv_id)
-    for conv_id in to_delete:
-        del _CHAT_CONTEXTS[conv_id]
-
-async def sync_bitrix24_kb():
-    """Синхронизирует статьи из Битрикс24 Базы знаний"""
-    settings = load_settings()
-    kb_config = settings.knowledge_sources.get("bitrix24_kb", {})
-    
-    if not kb_config.get("enabled") or not kb_config.get("domain") or not kb_config.get("access_token"):
-        logger.warning("Bitrix24 KB sync skipped: not configured")
-        return {"status": "skipped", "reason": "not configured"}
-
-    domain = kb_config["domain"]
-    token = kb_config["access_token"]
-    last_sync = kb_config.get("last_sync")
-    
-    if not domain.startswith("https://"):
-        domain = f"https://{domain.strip('/')}"
-    
-    articles_synced = 0
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Получаем список статей
-            resp = await client.post(
-                f"{domain}/rest/crm/knowledge-base/article.list",
-                json={"auth": token}
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            
-            if "result" not in data or "articles" not in data["result"]:
-                raise ValueError(f"Unexpected Bitrix24 response: {data}")
-            
-            articles = data["result"]["articles"]
-            now = datetime.now(timezone.utc).isoformat()
-            
-            for article in articles:
-                # Пропускаем, если не изменилась с последней синхронизации
-                updated = article.get("updated")
-                if last_sync and updated and updated <= last_sync:
-                    continue
-                
-                # Получаем полный текст статьи
-                detail_resp = await client.post(
-                    f"{domain}/rest/crm/knowledge-base/article.get",
-                    json={"auth": token, "id": article["id"]}
-                )
-                detail_resp.raise_for_status()
-                detail = detail_resp.json()
-                
-                if "result" not in detail or "text" not in detail["result"]:
-                    logger.warning(f"Пропускаем статью {article['id']}: нет текста")
-                    continue
-                
-                text = detail["result"]["text"]
-                source_name = f"bitrix24_kb:{article['id']}"
-                
-                # Индексируем
-                await index_text_content(text, source_name, "all")
-                articles_synced += 1
-            
-            # Обновляем время последней синхронизации
-            kb_config["last_sync"] = now
-            settings.knowledge_sources["bitrix24_kb"] = kb_config
-            save_settings(settings)
-            
-            logger.info(f"Синхронизировано {articles_synced} статей из Bitrix24 KB")
-            return {"status": "ok", "synced": articles_synced}
-            
-    except Exception as e:
-        logger.error(f"Ошибка синхронизации Bitrix24 KB: {e}")
-        return {"status": "error", "message": str(e)}
-
-async def sync_confluence():
-    settings = load_settings()
-    ks = settings.knowledge_sources or {}
-    conf = ks.get("confluence", {})
-    
-    if not (conf.get("enabled") and conf.get("base_url") and conf.get("email") and conf.get("api_token")):
-        logger.warning("Confluence sync skipped: not configured")
-        return {"status": "skipped", "reason": "not configured"}
-
-    base_url = conf["base_url"].rstrip("/")
-    if not base_url.startswith("https://"):
-        base_url = f"https://{base_url}"
-
-    space_key = conf.get("space_key")
-    last_sync = conf.get("last_sync")
-    auth = (conf["email"], conf["api_token"])
-
-    try:
-        articles_synced = 0
-        start = 0
-        limit = 250
-        total_pages = 0
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            while True:
-                params = {
-                    "type": "page",
-                    "expand": "version,history,body.storage",
-                    "limit": limit,
-                    "start": start
-                }
-                if space_key:
-                    params["spaceKey"] = space_key
-
-                resp = await client.get(f"{base_url}/rest/api/content", auth=auth, params=params)
-                if resp.status_code == 401:
-                    raise ValueError("401: Неверные email или API token")
-                if resp.status_code == 404:
-                    raise ValueError(f"404: Проверьте Base URL и SpaceKey ({space_key})")
-                resp.raise_for_status()
-
-                data = resp.json()
-                results = data.get("results", [])
-                if not results:
-                    break
-
-                total_pages += len(results)
-                logger.info(f"Получено {len(results)} страниц (всего: {total_pages})")
-
-                for page in results:
-                    title = page.get("title", "Без названия")
-                    page_id = page["id"]
-                    base_url_clean = base_url.rstrip("/")
-                    page_link = f"{base_url_clean}/pages/viewpage.action?pageId={page_id}"
-
-                    # === ОПРЕДЕЛЕНИЕ ДАТЫ ===
-                    last_modified = None
-                    history = page.get("history") or {}
-                    last_updated = history.get("lastUpdated")
-                    if last_updated and isinstance(last_updated, dict):
-                        last_modified = last_updated.get("when")
-                    else:
-                        # Для Confluence Cloud: дата в корне страницы
-                        last_modified = page.get("version", {}).get("when")
-
-                    logger.info(f"Страница: {title} (ID: {page_id}), lastModified: {last_modified}, last_sync: {last_sync}")
-
-                    # === ФИЛЬТРАЦИЯ ===
-                    if last_sync:
-                        if not last_modified:
-                            logger.warning(f"Пропускаем страницу {page_id}: не удалось определить дату")
-                            continue
-                        if last_modified <= last_sync:
-                            logger.debug(f"Пропускаем: {title} (не изменилась)")
-                            continue
-                    # Если last_sync нет — берем ВСЁ
-
-                    # === ИЗВЛЕЧЕНИЕ ТЕКСТА ===
-                    body = page.get("body", {}).get("storage", {}).get("value", "")
-                    if not body:
-                        logger.warning(f"Пропускаем страницу {page_id}: пустое тело")
-                        continue
-
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(body, "html.parser")
-                    text = soup.get_text(separator="\n", strip=True)
-                    if not text:
-                        logger.warning(f"Пропускаем страницу {page_id}: не удалось извлечь текст")
-                        continue
-
-                    # source = f"confluence:{page_id}"
-                    await index_text_content(
-                        text=text,
-                        source=page_link,                      # ← вместо "confluence:123"
-                        department="all",
-                    )
-                    articles_synced += 1
-                    logger.info(f"✅ Индексирована: {title}")
-
-                if len(results) < limit:
-                    break
-                start += limit
-
-            # Обязательно обновляем last_sync, даже если 0 статей
-            from datetime import datetime, timezone
-            conf["last_sync"] = datetime.now(timezone.utc).isoformat()
-            settings.knowledge_sources["confluence"] = conf
-            save_settings(settings)
-
-            logger.info(f"✅ Синхронизация завершена. Всего страниц: {total_pages}, проиндексировано: {articles_synced}")
-            return {"status": "ok", "synced": articles_synced, "total": total_pages}
-
-    except Exception as e:
-        error_msg = str(e)
-        logger.error(f"❌ Ошибка синхронизации Confluence: {error_msg}")
-        return {"status": "error", "message": error_msg}
-    
-
 # Инициализация FastAPI
 app = FastAPI(title="Znatok API", version="0.1.0")
 
@@ -237,13 +36,14 @@ app.add_middleware(
 
 # Импорты модулей
 from .ingestion import (
-    index_document, 
     delete_document_from_qdrant, 
     get_qdrant_client, 
+    get_document_text,
     index_text_content  # ← добавьте эту строку
 )
-from .rag import search_qdrant, get_llm_response
-from .models import ProviderType, ProviderConfig, Settings, load_settings, save_settings
+from .rag import get_llm_response, stream_llm_response, close_llm_providers
+from . import retrieval, metrics, registry, answer_cache, jobs, worker, confluence, scheduler, lexical, reranker, storage, blobs, qdrant_config, context_store, embedding_cache
+from .models import ProviderType, ProviderConfig, Settings, load_settings, save_settings, current_settings
 
 # Глобальные переменные для интеграций
 _active_telegram_bot = None
@@ -265,6 +65,26 @@ except ImportError as e:
     logger.warning(f"Bitrix24 интеграция недоступна: {e}")
     BITRIX24_ROUTER_AVAILABLE = False
 
+# Сколько раз запрос сходил в Qdrant — заголовок X-Qdrant-Calls и метрика в /api/metrics
+_METERED_PATHS = {"/api/ask", "/api/ask/stream", "/api/documents"}
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    token = metrics.begin_request()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        counters = metrics.end_request(token)
+    if request.url.path == "/api/ask":
+        # По этой задержке планировщик синхронизаций решает, не пора ли притормозить
+        metrics.observe(scheduler.ASK_LATENCY_METRIC, (time.perf_counter() - started) * 1000)
+    qdrant_calls = int(counters.get("qdrant_calls", 0))
+    if request.url.path in _METERED_PATHS:
+        metrics.observe(f"qdrant_calls_per_request:{request.url.path}", qdrant_calls)
+    response.headers["X-Qdrant-Calls"] = str(qdrant_calls)
+    return response
+
 # Модели данных
 class AskRequest(BaseModel):
     question: str
@@ -285,8 +105,35 @@ class IntegrationUpdate(BaseModel):
 async def health():
     return {"status": "ok", "service": "znatok-backend"}
 
-@app.post("/api/ask", response_model=AskResponse)
-async def ask(request: AskRequest):
+@app.get("/api/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+NOT_FOUND_ANSWER = "Не нашёл ответа в документах компании."
+
+async def _remember_exchange(conv_id: str, question: str, answer: str):
+    try:
+        await asyncio.to_thread(context_store.get_context_store().remember, conv_id, question, answer)
+    except Exception as e:
+        # Ответ уже получен; без истории следующий вопрос просто уйдёт без контекста
+        logger.error(f"Не удалось сохранить контекст диалога {conv_id}: {e}")
+
+def _unique_sources(hits: List[dict]) -> List[dict]:
+    unique_sources = set()
+    sources = []
+    for hit in hits:
+        source_name = hit["source"]
+        if source_name not in unique_sources:
+            unique_sources.add(source_name)
+            sources.append({"source": source_name})
+    return sources
+
+def _build_prompt(hits: List[dict], context_question: str) -> str:
+    context = "\n\n".join([f"Документ: {hit['source']}\n{hit['text']}" for hit in hits])
+    return f"Контекст:\n{context}\n\nВопрос: {context_question}\n\nОтвет:"
+
+async def _prepare_ask(request: AskRequest) -> Dict[str, Any]:
+    """Общая часть /api/ask и /api/ask/stream: контекст диалога, поиск, кэш ответов."""
     question = request.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question is required")
@@ -294,59 +141,165 @@ async def ask(request: AskRequest):
     conv_id = request.conversation_id or os.urandom(8).hex()
     context_question = question
 
-    if conv_id in _CHAT_CONTEXTS and _CHAT_CONTEXTS[conv_id]:
+    try:
+        previous = await asyncio.to_thread(context_store.get_context_store().history, conv_id)
+    except Exception as e:
+        logger.error(f"Не удалось прочитать контекст диалога {conv_id}: {e}")
+        previous = []
+    if previous:
         history = "\n".join([
             f"{'Вопрос' if msg['role'] == 'user' else 'Ответ'}: {msg['content']}"
-            for msg in _CHAT_CONTEXTS[conv_id][-2:]
+            for msg in previous[-2:]
         ])
         context_question = f"История диалога:\n{history}\n\nНовый вопрос: {question}"
 
     try:
-        hits = search_qdrant(context_question, request.user_department)
+        query_vector = await retrieval.encode_query(context_question)
+        # По словам ищем только по новому вопросу: история диалога размывает точные совпадения
+        hits = await retrieval.search_by_vector(query_vector, request.user_department, question=question)
     except Exception as e:
         logger.error(f"Qdrant search error: {e}")
         raise HTTPException(status_code=500, detail="Search failed")
 
+    cache = answer_cache.get_answer_cache() if answer_cache.ANSWER_CACHE_ENABLED else None
+    chunk_ids = [hit["id"] for hit in hits]
+    cached = cache.lookup(query_vector, request.user_department, chunk_ids) if cache is not None and hits else None
+
+    return {
+        "question": question,
+        "conv_id": conv_id,
+        "context_question": context_question,
+        "query_vector": query_vector,
+        "hits": hits,
+        "chunk_ids": chunk_ids,
+        "cache": cache,
+        "cached": cached,
+    }
+
+@app.post("/api/ask", response_model=AskResponse)
+async def ask(request: AskRequest):
+    prepared = await _prepare_ask(request)
+    conv_id, hits = prepared["conv_id"], prepared["hits"]
+
     if not hits:
-        _CHAT_CONTEXTS[conv_id].append({"role": "user", "content": question, "timestamp": datetime.utcnow()})
-        _CHAT_CONTEXTS[conv_id].append({"role": "assistant", "content": "Не нашёл ответа в документах компании.", "timestamp": datetime.utcnow()})
+        await _remember_exchange(conv_id, prepared["question"], NOT_FOUND_ANSWER)
         return AskResponse(
-            answer="Не нашёл ответа в документах компании.",
+            answer=NOT_FOUND_ANSWER,
             sources=[],
             conversation_id=conv_id
         )
 
-    context = "\n\n".join([f"Документ: {hit['source']}\n{hit['text']}" for hit in hits])
-    prompt = f"Контекст:\n{context}\n\nВопрос: {context_question}\n\nОтвет:"
+    cached, cache = prepared["cached"], prepared["cache"]
+    if cached:
+        answer, sources = cached["answer"], cached["sources"]
+    else:
+        prompt = _build_prompt(hits, prepared["context_question"])
 
-    try:
-        answer = await get_llm_response(prompt)
-    except Exception as e:
-        logger.error(f"LLM error: {e}")
-        raise HTTPException(status_code=502, detail="AI service unavailable")
+        try:
+            answer = await get_llm_response(prompt)
+        except Exception as e:
+            logger.error(f"LLM error: {e}")
+            raise HTTPException(status_code=502, detail="AI service unavailable")
 
-    unique_sources = set()
-    sources = []
-    for hit in hits:
-        source_name = hit["source"]
-        if source_name not in unique_sources:
-            unique_sources.add(source_name)
-            sources.append({"source": source_name})
+        sources = _unique_sources(hits)
+        if cache is not None:
+            cache.store(prepared["query_vector"], request.user_department, prepared["chunk_ids"], answer, sources)
 
-    _CHAT_CONTEXTS[conv_id].append({"role": "user", "content": question, "timestamp": datetime.utcnow()})
-    _CHAT_CONTEXTS[conv_id].append({"role": "assistant", "content": answer, "timestamp": datetime.utcnow()})
+    await _remember_exchange(conv_id, prepared["question"], answer)
+    return AskResponse(answer=answer, sources=sources, conversation_id=conv_id)
 
-    if len(_CHAT_CONTEXTS) > 1000:
-        _cleanup_old_contexts()
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    return AskResponse(answer=answer, sources=sources, conversation_id=conv_id)
+@app.post("/api/ask/stream")
+async def ask_stream(request: AskRequest):
+    """
+    Потоковый ответ (Server-Sent Events):
+    event: sources — сразу после поиска, event: token — куски ответа по мере генерации,
+    event: done — полный ответ, event: error — ошибка LLM.
+    """
+    started = time.perf_counter()
+    prepared = await _prepare_ask(request)
+    conv_id, hits = prepared["conv_id"], prepared["hits"]
+    cached, cache = prepared["cached"], prepared["cache"]
+    sources = cached["sources"] if cached else _unique_sources(hits)
+
+    async def events():
+        yield _sse("sources", {"sources": sources, "conversation_id": conv_id})
+
+        if not hits:
+            answer = NOT_FOUND_ANSWER
+            yield _sse("token", {"text": answer})
+        elif cached:
+            answer = cached["answer"]
+            yield _sse("token", {"text": answer})
+        else:
+            parts = []
+            try:
+                async for token in stream_llm_response(_build_prompt(hits, prepared["context_question"])):
+                    if not parts:
+                        metrics.observe("ask_stream_ttft_ms", (time.perf_counter() - started) * 1000)
+                    parts.append(token)
+                    yield _sse("token", {"text": token})
+            except Exception as e:
+                logger.error(f"LLM stream error: {e}")
+                yield _sse("error", {"detail": "AI service unavailable"})
+                return
+            answer = "".join(parts).strip()
+            if cache is not None and answer:
+                cache.store(prepared["query_vector"], request.user_department, prepared["chunk_ids"], answer, sources)
+
+        await _remember_exchange(conv_id, prepared["question"], answer)
+        yield _sse("done", {"answer": answer, "conversation_id": conv_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Загрузка пишется на диск кусками, без чтения файла целиком в память
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_FILE_SIZE = int(os.getenv("MAX_UPLOAD_FILE_SIZE", 100 * 1024 * 1024))
+MAX_UPLOAD_TOTAL_SIZE = int(os.getenv("MAX_UPLOAD_TOTAL_SIZE", 500 * 1024 * 1024))
+
+async def _save_upload(file: UploadFile, filepath: str, budget: int) -> Tuple[int, str]:
+    """Потоково сохраняет файл, считая sha256 на лету. Возвращает (размер, хэш)."""
+    limit = min(MAX_UPLOAD_FILE_SIZE, budget)
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = f"{filepath}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    detail = (
+                        f"Файл {file.filename} больше {MAX_UPLOAD_FILE_SIZE // (1024 * 1024)} МБ"
+                        if size > MAX_UPLOAD_FILE_SIZE
+                        else f"Общий размер загрузки больше {MAX_UPLOAD_TOTAL_SIZE // (1024 * 1024)} МБ"
+                    )
+                    raise HTTPException(status_code=413, detail=detail)
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return size, digest.hexdigest()
 
 @app.post("/api/upload")
 async def upload_files(
     files: List[UploadFile] = File(...),
     department: str = Form("all")
 ):
+    """Сохраняет файлы и ставит их в очередь индексации. Прогресс — /api/jobs/{job_id}."""
     uploaded_files = []
+    queued_jobs = []
+    total_size = 0
     for file in files:
         if file.content_type not in [
             "application/pdf",
@@ -355,52 +308,56 @@ async def upload_files(
         ] and not file.filename.lower().endswith('.txt'):
             raise HTTPException(status_code=400, detail=f"Неподдерживаемый тип: {file.filename}")
 
-        delete_document_from_qdrant(file.filename)
-
-        safe_filename = f"{hash(file.filename)}_{file.filename}"
-        filepath = os.path.join(UPLOAD_DIR, safe_filename)
-        with open(filepath, "wb") as f:
-            f.write(await file.read())
+        # Каждая загрузка — свой файл: задача индексирует ровно те байты, чей хэш записан в ней,
+        # даже если файл с тем же именем загрузили ещё раз до её выполнения
+        job_id = jobs.new_job_id()
+        filepath = os.path.join(UPLOAD_DIR, f"{job_id}_{os.path.basename(file.filename)}")
+        size, content_hash = await _save_upload(file, filepath, MAX_UPLOAD_TOTAL_SIZE - total_size)
+        total_size += size
 
         try:
-            index_document(filepath, file.filename, department)
-            uploaded_files.append(file.filename)
-        except Exception as e:
-            logger.error(f"Пропускаем файл {file.filename} из-за ошибки: {e}")
-            continue
+            await asyncio.to_thread(
+                jobs.enqueue_document, file.filename, filepath, department,
+                content_hash=content_hash, size=size, job_id=job_id
+            )
+        except Exception:
+            # Без задачи файл никто не удалит
+            await asyncio.to_thread(jobs.discard_upload, filepath)
+            raise
+        uploaded_files.append(file.filename)
+        queued_jobs.append({"job_id": job_id, "filename": file.filename, "content_hash": content_hash})
 
-    return {"status": "ok", "uploaded_files": uploaded_files}
+    return {"status": "ok", "uploaded_files": uploaded_files, "jobs": queued_jobs}
+
+@app.get("/api/jobs")
+async def list_ingestion_jobs(status: Optional[str] = None, limit: int = 50):
+    return {
+        "jobs": await asyncio.to_thread(jobs.list_jobs, status=status, limit=min(max(limit, 1), 500)),
+        "stats": await asyncio.to_thread(jobs.queue_stats)
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    job = await asyncio.to_thread(jobs.get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
 
 @app.get("/api/documents")
-async def list_documents():
+async def list_documents(limit: int = 50, cursor: Optional[str] = None, origin: Optional[str] = None,
+                         department: Optional[str] = None, q: Optional[str] = None):
+    """Каталог документов постранично: next_cursor передаётся в cursor для следующей страницы."""
     try:
-        client = get_qdrant_client()
-        collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
-        
-        if not client.collection_exists(collection):
-            return []
-
-        response = client.scroll(
-            collection_name=collection,
-            limit=1000,
-            with_payload=True
+        page = await asyncio.to_thread(
+            storage.list_documents, min(max(limit, 1), 500), cursor, origin, department, q
         )
-        
-        sources = {}
-        for point in response[0]:
-            source = point.payload.get("source")
-            uploaded_at = point.payload.get("uploaded_at")
-            if source and source not in sources:
-                sources[source] = {
-                    "filename": source,
-                    "uploaded_at": uploaded_at
-                }
-        
-        return list(sources.values())
-
-    except Exception as e:
-        logger.error(f"Ошибка получения списка документов: {e}")
-        return []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for doc in page["documents"]:
+        # Старые поля, на которые рассчитан фронтенд
+        doc["filename"] = doc["source"]
+        doc["uploaded_at"] = doc["indexed_at"]
+    return page
 
 @app.delete("/api/documents/{filename}")
 async def delete_document_endpoint(filename: str):
@@ -408,16 +365,18 @@ async def delete_document_endpoint(filename: str):
         raise HTTPException(status_code=400, detail="Invalid filename")
     
     try:
-        delete_document_from_qdrant(filename)
-        return {"status": "ok"}
+        deleted = await asyncio.to_thread(delete_document_from_qdrant, filename)
     except Exception as e:
         logger.error(f"Ошибка удаления документа {filename}: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete document")
+    if not deleted:
+        raise HTTPException(status_code=500, detail="Failed to delete document")
+    return {"status": "ok"}
 
 # Эндпоинты для настроек AI
 @app.get("/api/settings")
 async def get_settings():
-    return load_settings()
+    return current_settings()
 
 @app.post("/api/settings")
 async def update_settings(settings: Settings):
@@ -437,7 +396,7 @@ async def get_providers():
 # Эндпоинты для интеграций
 @app.get("/api/integrations")
 async def get_integrations():
-    settings = load_settings()
+    settings = current_settings()
     integrations = settings.integrations or {}
     
     def is_configured(name: str) -> bool:
@@ -495,16 +454,62 @@ async def reset_collection():
         if client.collection_exists(collection):
             client.delete_collection(collection)
             logger.info(f"Коллекция {collection} удалена")
+        registry.forget_collection(collection)
+        lexical.clear()
+        storage.clear()
+        blobs.clear()
+        answer_cache.bump_collection_version()
         return {"status": "collection reset"}
     except Exception as e:
         logger.error(f"Ошибка сброса коллекции: {e}")
         raise HTTPException(status_code=500, detail="Failed to reset collection")
 
+async def _backfill_indexes():
+    if qdrant_config.QDRANT_MIGRATE_ON_STARTUP:
+        try:
+            # Индексы payload и настройки коллекции для уже существующих установок
+            await asyncio.to_thread(qdrant_config.migrate_collection)
+        except Exception as e:
+            logger.error(f"Ошибка обновления настроек коллекции: {e}")
+    try:
+        await asyncio.to_thread(storage.backfill)
+    except Exception as e:
+        logger.error(f"Ошибка заполнения каталога документов: {e}")
+    if lexical.LEXICAL_INDEX_ENABLED:
+        try:
+            await asyncio.to_thread(lexical.backfill)
+        except Exception as e:
+            logger.error(f"Ошибка заполнения лексического индекса: {e}")
+
 # События жизненного цикла
 @app.on_event("startup")
 async def startup_event():
     logger.info("Запуск сервиса Znatok...")
-    settings = load_settings()
+    settings = current_settings()
+
+    # Воркеры индексации внутри бэкенда; 0 — очередь разбирает отдельный сервис (python -m app.worker)
+    inprocess_workers = int(os.getenv("INGESTION_INPROCESS_WORKERS", 1))
+    if inprocess_workers > 0:
+        worker.start_inprocess_workers(inprocess_workers)
+        logger.info(f"Запущено воркеров индексации: {inprocess_workers}")
+
+    # Прогрев модели эмбеддингов до первого вопроса пользователя
+    if os.getenv("EMBEDDING_WARMUP", "true").lower() == "true":
+        try:
+            await asyncio.to_thread(registry.warmup)
+        except Exception as e:
+            logger.error(f"Ошибка прогрева модели эмбеддингов: {e}")
+    if reranker.RERANK_ENABLED and os.getenv("EMBEDDING_WARMUP", "true").lower() == "true":
+        try:
+            await asyncio.to_thread(reranker.warmup)
+        except Exception as e:
+            logger.error(f"Ошибка прогрева модели переранжирования: {e}")
+
+    # Документы и чанки, проиндексированные до появления каталога и лексического индекса, добавляем в фоне
+    asyncio.create_task(_backfill_indexes())
+
+    # Плановая синхронизация Confluence и Базы знаний Битрикс24
+    scheduler.start()
     
     # Запуск Telegram бота
     if TELEGRAM_AVAILABLE:
@@ -532,10 +537,19 @@ async def startup_event():
         else:
             logger.warning("Bitrix24 не настроен — отсутствует client_secret")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await scheduler.shutdown()
+    worker.stop_inprocess_workers()
+    await retrieval.shutdown()
+    await asyncio.to_thread(embedding_cache.flush)
+    await registry.close()
+    await close_llm_providers()
+
 @app.get("/")
 async def root():
     integrations = []
-    settings = load_settings()
+    settings = current_settings()
     
     if TELEGRAM_AVAILABLE and settings.integrations.get("telegram", {}).get("bot_token"):
         integrations.append("telegram")
@@ -570,7 +584,8 @@ async def global_exception_handler(request: Request, exc: Exception):
 # Эндпоинт для ручного запуска
 @app.post("/api/sources/bitrix24/kb/sync")
 async def trigger_bitrix24_kb_sync():
-    result = await sync_bitrix24_kb()
+    # Если синхронизация уже идёт (по расписанию или с другой вкладки) — ждём её результат
+    result = await scheduler.run("bitrix24_kb")
     if result["status"] == "error":
         raise HTTPException(status_code=500, detail=result["message"])
     return result
@@ -578,7 +593,7 @@ async def trigger_bitrix24_kb_sync():
 # Эндпоинт для получения статуса
 @app.get("/api/sources/bitrix24/kb/status")
 async def get_bitrix24_kb_status():
-    settings = load_settings()
+    settings = current_settings()
     kb = settings.knowledge_sources.get("bitrix24_kb", {})
     return {
         "enabled": kb.get("enabled", False),
@@ -587,16 +602,15 @@ async def get_bitrix24_kb_status():
         "configured": bool(kb.get("domain") and kb.get("access_token"))
     }
 
-@app.post("/api/sources/confluence/sync")
+@app.post("/api/sources/confluence/sync", status_code=202)
 async def trigger_confluence_sync():
-    result = await sync_confluence()
-    if result["status"] == "error":
-        raise HTTPException(status_code=500, detail=result["message"])
-    return result
+    """Запускает синхронизацию в фоне; прогресс — в /api/sources/confluence/status."""
+    _, started = scheduler.trigger("confluence")
+    return {"status": "started" if started else "running", "sync": confluence.sync_status()}
 
 @app.get("/api/sources/confluence/status")
 async def get_confluence_status():
-    settings = load_settings()
+    settings = current_settings()
     ks = settings.knowledge_sources or {}
     conf = ks.get("confluence", {})
     
@@ -612,9 +626,18 @@ async def get_confluence_status():
         "api_token": api_token,    # ← отдаём (фронтенд сам заменит на ••••)
         "space_key": conf.get("space_key"),
         "last_sync": conf.get("last_sync"),
-        "configured": configured
+        "configured": configured,
+        "sync": confluence.sync_status()
     }
 
+@app.get("/api/sources/sync/schedule")
+async def get_sync_schedule():
+    return scheduler.status()
+
+@app.get("/api/sources/sync/history")
+async def get_sync_history(source: Optional[str] = None, limit: int = 50):
+    return {"runs": await asyncio.to_thread(scheduler.history, source, min(max(limit, 1), 500))}
+
 @app.post("/api/sources/confluence/test")
 async def test_confluence_connection(request: Request):
     data = await request.json()
@@ -646,37 +669,44 @@ async def test_confluence_connection(request: Request):
         logger.error(f"Confluence test error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+# Страница текста документа по умолчанию и максимальная, в байтах UTF-8
+DOCUMENT_PAGE_BYTES = int(os.getenv("DOCUMENT_PAGE_BYTES", 64 * 1024))
+DOCUMENT_PAGE_MAX_BYTES = int(os.getenv("DOCUMENT_PAGE_MAX_BYTES", 1024 * 1024))
+
 @app.get("/api/documents/{source_id_or_url}")
-async def get_document_content(source_id_or_url: str):
+async def get_document_content(source_id_or_url: str, request: Request, offset: int = 0,
+                               limit: int = DOCUMENT_PAGE_BYTES):
     """
-    Возвращает содержимое документа по его source (URL или ID)
+    Возвращает содержимое документа по его source (URL или ID) страницами:
+    offset/limit — байты полного текста в UTF-8, next_offset — начало следующей страницы
+    (None на последней). Текст берётся из блоба, ETag меняется вместе с текстом.
     """
+    if offset < 0 or limit <= 0:
+        raise HTTPException(status_code=400, detail="offset должен быть >= 0, limit > 0")
+    limit = min(limit, DOCUMENT_PAGE_MAX_BYTES)
     try:
-        client = get_qdrant_client()
-        collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
-        
-        # Ищем по точному совпадению source
-        response = client.scroll(
-            collection_name=collection,
-            scroll_filter=Filter(
-                must=[FieldCondition(key="source", match=MatchValue(value=source_id_or_url))]
-            ),
-            limit=1000,
-            with_payload=True
-        )
-        
-        if not response[0]:
+        document = await asyncio.to_thread(get_document_text, source_id_or_url)
+        if document is None:
             raise HTTPException(status_code=404, detail="Документ не найден")
-        
-        # Собираем весь текст
-        full_text = "\n\n".join([point.payload["text"] for point in response[0]])
-        filename = response[0][0].payload.get("source", "документ")
-        
-        return {
+        text_hash, data = document
+        start, end = blobs.utf8_range(data, offset, limit)
+
+        etag = f'"{text_hash[:32]}-{start}-{end}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        filename = source_id_or_url
+        return JSONResponse(headers=headers, content={
             "filename": filename,
-            "content": full_text,
+            "content": data[start:end].decode("utf-8"),
+            "offset": start,
+            "next_offset": end if end < len(data) else None,
+            "total_size": len(data),
             "source_url": filename if filename.startswith("http") else None
-        }
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка получения документа: {e}")
         raise HTTPException(status_code=500, detail="Failed to load document")
\ No newline at end of file
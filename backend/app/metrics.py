@@ -0,0 +1,97 @@
+# backend/app/metrics.py
+import time
+import threading
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Простые in-process метрики: счётчики и скользящие гистограммы.
+# В проде — Prometheus, в MVP достаточно /api/metrics.
+HISTOGRAM_WINDOW = 2048
+
+_LOCK = threading.Lock()
+_COUNTERS: Dict[str, float] = defaultdict(float)
+_HISTOGRAMS: Dict[str, deque] = {}
+_TOTALS: Dict[str, list] = defaultdict(lambda: [0, 0.0])  # name -> [count, sum] за всё время
+_TIMES: Dict[str, deque] = {}  # моменты наблюдений (monotonic) — для окна по времени
+
+def inc(name: str, value: float = 1):
+    with _LOCK:
+        _COUNTERS[name] += value
+
+def observe(name: str, value: float):
+    with _LOCK:
+        window = _HISTOGRAMS.get(name)
+        if window is None:
+            window = _HISTOGRAMS[name] = deque(maxlen=HISTOGRAM_WINDOW)
+        window.append(value)
+        times = _TIMES.get(name)
+        if times is None:
+            times = _TIMES[name] = deque(maxlen=HISTOGRAM_WINDOW)
+        times.append(time.monotonic())
+        totals = _TOTALS[name]
+        totals[0] += 1
+        totals[1] += value
+
+def _percentile(ordered: list, p: float) -> float:
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+def summary(name: str) -> Dict[str, float]:
+    """Сводка по гистограмме: перцентили считаются по последним HISTOGRAM_WINDOW значениям."""
+    with _LOCK:
+        values = sorted(_HISTOGRAMS.get(name) or [])
+        count, total = _TOTALS.get(name, (0, 0.0))
+    if not values:
+        return {"count": 0}
+    return {
+        "count": count,
+        "avg": round(total / count, 3),
+        "p50": round(_percentile(values, 50), 3),
+        "p95": round(_percentile(values, 95), 3),
+        "p99": round(_percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+    }
+
+def recent_summary(name: str, seconds: float) -> Dict[str, float]:
+    """Перцентили только по значениям за последние seconds секунд (например, для SLO)."""
+    since = time.monotonic() - seconds
+    with _LOCK:
+        pairs = zip(_TIMES.get(name) or (), _HISTOGRAMS.get(name) or ())
+        values = sorted(value for moment, value in pairs if moment >= since)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(_percentile(values, 50), 3),
+        "p95": round(_percentile(values, 95), 3),
+        "max": round(values[-1], 3),
+    }
+
+def snapshot() -> Dict[str, Dict]:
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        names = list(_HISTOGRAMS.keys())
+    return {
+        "counters": counters,
+        "histograms": {name: summary(name) for name in names},
+    }
+
+# Счётчики в рамках одного HTTP-запроса (например, сколько раз сходили в Qdrant).
+# В contextvar лежит изменяемый dict — его видят и задачи, порождённые обработчиком.
+_REQUEST_COUNTERS: ContextVar[Optional[Dict[str, float]]] = ContextVar("znatok_request_counters", default=None)
+
+def begin_request():
+    return _REQUEST_COUNTERS.set(defaultdict(float))
+
+def end_request(token) -> Dict[str, float]:
+    counters = _REQUEST_COUNTERS.get() or {}
+    _REQUEST_COUNTERS.reset(token)
+    return dict(counters)
+
+def inc_request(name: str, value: float = 1):
+    """Увеличивает глобальный счётчик и счётчик текущего запроса, если он есть."""
+    inc(name, value)
+    counters = _REQUEST_COUNTERS.get()
+    if counters is not None:
+        counters[name] += value
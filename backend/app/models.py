@@ -5,6 +5,7 @@ from enum import Enum
 import json
 import os
 import logging
+import threading
 
 logger = logging.getLogger("znatok.models")
 
@@ -50,7 +51,19 @@ class Settings(BaseModel):
 
 SETTINGS_FILE = "/app/data/settings.json"
 
-def load_settings() -> Settings:
+# Разобранные настройки держим в памяти: файл перечитывается только
+# после save_settings или если его mtime изменился (правка руками, другой процесс).
+_SETTINGS_CACHE: Optional[Settings] = None
+_SETTINGS_MTIME: Optional[int] = None
+_SETTINGS_LOCK = threading.Lock()
+
+def _settings_mtime() -> Optional[int]:
+    try:
+        return os.stat(SETTINGS_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+def _read_settings() -> Settings:
     try:
         if os.path.exists(SETTINGS_FILE):
             with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
@@ -71,11 +84,49 @@ def load_settings() -> Settings:
         logger.error(f"Error loading settings: {e}")
         return Settings()
 
+def current_settings() -> Settings:
+    """
+    Общий закэшированный экземпляр настроек — только для чтения.
+    Для изменения и последующего save_settings используйте load_settings().
+    """
+    global _SETTINGS_CACHE, _SETTINGS_MTIME
+    mtime = _settings_mtime()
+    with _SETTINGS_LOCK:
+        if _SETTINGS_CACHE is None or mtime != _SETTINGS_MTIME:
+            _SETTINGS_CACHE = _read_settings()
+            _SETTINGS_MTIME = mtime
+        return _SETTINGS_CACHE
+
+def load_settings() -> Settings:
+    return current_settings().model_copy(deep=True)
+
 def save_settings(settings: Settings):
+    global _SETTINGS_CACHE, _SETTINGS_MTIME
     try:
         os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings.dict(), f, indent=2, ensure_ascii=False)
+        # Атомарная запись: пишем во временный файл рядом и переименовываем
+        tmp_path = f"{SETTINGS_FILE}.{os.getpid()}.tmp"
+        with _SETTINGS_LOCK:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(settings.dict(), f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, SETTINGS_FILE)
+            _SETTINGS_CACHE = settings.model_copy(deep=True)
+            _SETTINGS_MTIME = _settings_mtime()
     except Exception as e:
         logger.error(f"Error saving settings: {e}")
-        raise
\ No newline at end of file
+        raise
+
+# Синхронизации разных источников идут параллельно: каждая меняет только свои поля
+# поверх актуальных настроек, иначе последняя сохранившая затёрла бы last_sync соседа.
+_UPDATE_LOCK = threading.Lock()
+
+def update_knowledge_source(name: str, updates: Dict[str, Any]) -> Settings:
+    with _UPDATE_LOCK:
+        settings = load_settings()
+        source = dict(settings.knowledge_sources.get(name) or {})
+        source.update(updates)
+        settings.knowledge_sources[name] = source
+        save_settings(settings)
+        return settings
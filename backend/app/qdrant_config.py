@@ -0,0 +1,188 @@
+# backend/app/qdrant_config.py
+import os
+import logging
+from typing import Dict, List, Optional
+from qdrant_client.models import (
+    VectorParams, VectorParamsDiff, Distance, PayloadSchemaType,
+    HnswConfigDiff, OptimizersConfigDiff, CollectionParamsDiff,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, Disabled,
+    SearchParams, QuantizationSearchParams
+)
+
+logger = logging.getLogger("znatok.qdrant_config")
+
+# Параметры коллекции чанков. Без индексов payload каждый поиск с фильтром по отделу
+# и каждое удаление по source перебирают payload всех точек; с keyword-индексами Qdrant
+# оценивает мощность фильтра и для узких отделов идёт по индексу, а не по графу HNSW.
+# Для миллионов чанков — int8-квантизация: квантованные векторы в RAM, оригиналы на диске
+# (ими пересчитываются лучшие кандидаты, rescore). Значения из окружения применяются
+# и к уже существующей коллекции при старте (migrate_collection).
+VECTOR_SIZE = 384
+
+# Поля, по которым фильтруют поиск, удаление и проверку неизменности документа
+PAYLOAD_INDEXES = {
+    "source": PayloadSchemaType.KEYWORD,
+    "department": PayloadSchemaType.KEYWORD,
+    "content_hash": PayloadSchemaType.KEYWORD,
+}
+
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", 16))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", 100))
+# Ниже этого объёма векторов сегмента (КБ) поиск с фильтром идёт полным перебором
+QDRANT_FULL_SCAN_THRESHOLD = int(os.getenv("QDRANT_FULL_SCAN_THRESHOLD", 10000))
+QDRANT_HNSW_ON_DISK = os.getenv("QDRANT_HNSW_ON_DISK", "false").lower() == "true"
+# Сегменты меньше порога (КБ) не индексируются HNSW; 0 — не трогать настройку сервера
+QDRANT_INDEXING_THRESHOLD = int(os.getenv("QDRANT_INDEXING_THRESHOLD", 20000))
+QDRANT_MEMMAP_THRESHOLD = int(os.getenv("QDRANT_MEMMAP_THRESHOLD", 0))
+QDRANT_ON_DISK_PAYLOAD = os.getenv("QDRANT_ON_DISK_PAYLOAD", "true").lower() == "true"
+
+# none | int8
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_QUANTIZATION_QUANTILE = float(os.getenv("QDRANT_QUANTIZATION_QUANTILE", 0.99))
+QDRANT_QUANTIZATION_ALWAYS_RAM = os.getenv("QDRANT_QUANTIZATION_ALWAYS_RAM", "true").lower() == "true"
+# С квантизацией оригиналы векторов по умолчанию на диске
+QDRANT_VECTORS_ON_DISK = os.getenv(
+    "QDRANT_VECTORS_ON_DISK", "true" if QDRANT_QUANTIZATION == "int8" else "false"
+).lower() == "true"
+
+# Параметры поиска: ef (0 — по умолчанию сервера); с квантизацией — oversampling и rescore
+QDRANT_SEARCH_HNSW_EF = int(os.getenv("QDRANT_SEARCH_HNSW_EF", 0))
+QDRANT_SEARCH_OVERSAMPLING = float(os.getenv("QDRANT_SEARCH_OVERSAMPLING", 2.0))
+QDRANT_SEARCH_RESCORE = os.getenv("QDRANT_SEARCH_RESCORE", "true").lower() == "true"
+
+QDRANT_MIGRATE_ON_STARTUP = os.getenv("QDRANT_MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+def hnsw_config() -> HnswConfigDiff:
+    return HnswConfigDiff(
+        m=QDRANT_HNSW_M,
+        ef_construct=QDRANT_HNSW_EF_CONSTRUCT,
+        full_scan_threshold=QDRANT_FULL_SCAN_THRESHOLD,
+        on_disk=QDRANT_HNSW_ON_DISK
+    )
+
+def _optimizer_params() -> Dict[str, int]:
+    params = {}
+    if QDRANT_INDEXING_THRESHOLD > 0:
+        params["indexing_threshold"] = QDRANT_INDEXING_THRESHOLD
+    if QDRANT_MEMMAP_THRESHOLD > 0:
+        params["memmap_threshold"] = QDRANT_MEMMAP_THRESHOLD
+    return params
+
+def optimizers_config() -> Optional[OptimizersConfigDiff]:
+    params = _optimizer_params()
+    return OptimizersConfigDiff(**params) if params else None
+
+def quantization_config(mode: str = QDRANT_QUANTIZATION) -> Optional[ScalarQuantization]:
+    if mode == "none":
+        return None
+    if mode != "int8":
+        raise ValueError(f"Неизвестный режим квантизации: {mode}")
+    return ScalarQuantization(scalar=ScalarQuantizationConfig(
+        type=ScalarType.INT8,
+        quantile=QDRANT_QUANTIZATION_QUANTILE,
+        always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM
+    ))
+
+def search_params() -> Optional[SearchParams]:
+    """Параметры для client.search; None — значения сервера по умолчанию."""
+    quantization = None
+    if QDRANT_QUANTIZATION != "none":
+        quantization = QuantizationSearchParams(
+            rescore=QDRANT_SEARCH_RESCORE,
+            oversampling=QDRANT_SEARCH_OVERSAMPLING
+        )
+    if not QDRANT_SEARCH_HNSW_EF and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=QDRANT_SEARCH_HNSW_EF or None, quantization=quantization)
+
+def ensure_payload_indexes(client, name: str, existing: Optional[Dict] = None) -> List[str]:
+    """Создаёт недостающие индексы payload; возвращает имена созданных."""
+    created = []
+    for field, schema in PAYLOAD_INDEXES.items():
+        if existing is not None and field in existing:
+            continue
+        client.create_payload_index(collection_name=name, field_name=field, field_schema=schema, wait=True)
+        created.append(field)
+    return created
+
+def create_collection(client, name: str, quantization: str = QDRANT_QUANTIZATION,
+                      payload_indexes: bool = True):
+    """
+    Создаёт коллекцию с настройками из окружения. Индексы payload создаются сразу,
+    до загрузки точек: тогда HNSW строится с учётом фильтров по этим полям.
+    """
+    quantized = quantization_config(quantization)
+    client.create_collection(
+        collection_name=name,
+        vectors_config=VectorParams(
+            size=VECTOR_SIZE,
+            distance=Distance.COSINE,
+            on_disk=QDRANT_VECTORS_ON_DISK
+        ),
+        on_disk_payload=QDRANT_ON_DISK_PAYLOAD,
+        hnsw_config=hnsw_config(),
+        optimizers_config=optimizers_config(),
+        quantization_config=quantized
+    )
+    if payload_indexes:
+        ensure_payload_indexes(client, name, existing={})
+
+def _quantization_matches(current, desired: Optional[ScalarQuantization]) -> bool:
+    if desired is None:
+        return current is None
+    scalar = getattr(current, "scalar", None)
+    if scalar is None:
+        return False
+    return (
+        str(getattr(scalar.type, "value", scalar.type)) == ScalarType.INT8.value
+        and scalar.quantile == desired.scalar.quantile
+        and bool(scalar.always_ram) == bool(desired.scalar.always_ram)
+    )
+
+def migrate_collection(name: Optional[str] = None) -> List[str]:
+    """
+    Приводит существующую коллекцию к настройкам из окружения: создаёт недостающие индексы
+    payload, обновляет HNSW, оптимизатор, квантизацию и хранение векторов/payload.
+    Идемпотентна; перестройку сегментов Qdrant выполняет в фоне. Возвращает список изменений.
+    """
+    from .registry import get_qdrant_client, get_collection_schema
+
+    name = name or os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    if get_collection_schema(name) is None:
+        return []
+    client = get_qdrant_client()
+    info = client.get_collection(name)
+    changes = [f"индекс payload {field}" for field in ensure_payload_indexes(client, name, info.payload_schema or {})]
+
+    diff = {}
+    hnsw = info.config.hnsw_config
+    if (hnsw.m, hnsw.ef_construct, hnsw.full_scan_threshold, bool(hnsw.on_disk)) != \
+            (QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT, QDRANT_FULL_SCAN_THRESHOLD, QDRANT_HNSW_ON_DISK):
+        diff["hnsw_config"] = hnsw_config()
+        changes.append("HNSW")
+
+    current = info.config.optimizer_config
+    if any(getattr(current, field, None) != value for field, value in _optimizer_params().items()):
+        diff["optimizers_config"] = optimizers_config()
+        changes.append("оптимизатор")
+
+    desired = quantization_config()
+    if not _quantization_matches(info.config.quantization_config, desired):
+        diff["quantization_config"] = desired if desired is not None else Disabled.DISABLED
+        changes.append(f"квантизация {QDRANT_QUANTIZATION}")
+
+    vectors = info.config.params.vectors
+    if bool(getattr(vectors, "on_disk", False)) != QDRANT_VECTORS_ON_DISK:
+        # "" — безымянный вектор коллекции
+        diff["vectors_config"] = {"": VectorParamsDiff(on_disk=QDRANT_VECTORS_ON_DISK)}
+        changes.append("векторы на диске" if QDRANT_VECTORS_ON_DISK else "векторы в памяти")
+
+    if bool(info.config.params.on_disk_payload) != QDRANT_ON_DISK_PAYLOAD:
+        diff["collection_params"] = CollectionParamsDiff(on_disk_payload=QDRANT_ON_DISK_PAYLOAD)
+        changes.append("payload на диске" if QDRANT_ON_DISK_PAYLOAD else "payload в памяти")
+
+    if diff:
+        client.update_collection(collection_name=name, **diff)
+    if changes:
+        logger.info(f"Коллекция {name} обновлена: {', '.join(changes)} (сегменты перестраиваются в фоне)")
+    return changes
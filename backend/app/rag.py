@@ -1,37 +1,142 @@
 # backend/app/rag.py
 import os
+import json
+import time
+import asyncio
 import logging
 import httpx
 import uuid
-from typing import List, Optional, Tuple
-from qdrant_client import QdrantClient
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from qdrant_client.models import Filter, FieldCondition, MatchValue
-from sentence_transformers import SentenceTransformer
-from .models import load_settings, ProviderType
+from .models import current_settings, ProviderType
+from .registry import get_qdrant_client, get_collection_schema, forget_collection, is_not_found
+from . import embedding_cache, qdrant_config
 
 logger = logging.getLogger("znatok.rag")
 
-# Кэшируем
-_EMBEDDING_MODEL = None
-_QDRANT_CLIENT = None
-
 # ======================
 # Provider Implementations
 # ======================
 
+# Пул соединений к LLM API: провайдеры живут всё время работы приложения
+# и переиспользуют TCP/TLS-соединения (keep-alive) между вопросами.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+
 class LLMProvider:
+    verify_ssl = True
+
     def __init__(self, config):
         self.config = config
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                verify=self.verify_ssl,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     async def generate_response(self, prompt: str) -> str:
         raise NotImplementedError
 
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Отдаёт ответ по частям. По умолчанию — одним куском из generate_response."""
+        yield await self.generate_response(prompt)
+
+GIGACHAT_SYSTEM_PROMPT = "Ты — корпоративный ассистент «Знаток». Отвечай кратко, по делу, на русском языке. Если информации нет — скажи: «Не нашёл ответа в документах компании.»"
+YANDEX_SYSTEM_PROMPT = "Ты — корпоративный ассистент. Отвечай кратко и по делу на русском языке."
+
 class GigaChatProvider(LLMProvider):
+    verify_ssl = False
+    AUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+    API_URL = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+    # Токен живёт ~30 минут; обновляем заранее, за TOKEN_REFRESH_MARGIN секунд до истечения
+    TOKEN_REFRESH_MARGIN = 300
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
     async def generate_response(self, prompt: str) -> str:
         token = await self._get_token()
         return await self._call_api(prompt, token)
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        token = await self._get_token()
+        client = self.client
+        try:
+            async with client.stream(
+                "POST",
+                self.API_URL,
+                headers=self._headers(token),
+                json=self._payload(prompt, stream=True),
+                timeout=30.0
+            ) as resp:
+                self._check_auth(resp)
+                resp.raise_for_status()
+                # Ответ приходит как SSE: "data: {...}" и финальный "data: [DONE]"
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        except Exception as e:
+            logger.error(f"GigaChat API error: {e}")
+            raise
     
     async def _get_token(self) -> str:
+        now = time.time()
+        if self._token and now < self._token_expires_at - self.TOKEN_REFRESH_MARGIN:
+            return self._token
+
+        if self._token and now < self._token_expires_at:
+            # Токен ещё действует — отдаём его, а новый получаем в фоне (один раз на всех)
+            if not self._token_lock.locked() and (self._refresh_task is None or self._refresh_task.done()):
+                self._refresh_task = asyncio.create_task(self._refresh_token())
+                self._refresh_task.add_done_callback(self._log_refresh_failure)
+            return self._token
+
+        return await self._refresh_token()
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        # Ошибку фонового обновления никто не ждёт: забираем её здесь, иначе asyncio
+        # выведет "Task exception was never retrieved". Токен ещё действует, а если
+        # обновить его так и не удастся, запрос после истечения получит ошибку сам.
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.warning(f"GigaChat: не удалось обновить токен в фоне: {error}")
+
+    async def _refresh_token(self) -> str:
+        async with self._token_lock:
+            # Пока ждали блокировку, токен мог обновить другой запрос
+            if self._token and time.time() < self._token_expires_at - self.TOKEN_REFRESH_MARGIN:
+                return self._token
+            self._token, self._token_expires_at = await self._fetch_token()
+            return self._token
+
+    async def _fetch_token(self) -> Tuple[str, float]:
         auth_key = self.config.api_key
         if not auth_key:
             raise ValueError("GIGACHAT_API_KEY не задан в настройках")
@@ -39,136 +144,182 @@ class GigaChatProvider(LLMProvider):
         scope = "GIGACHAT_API_PERS"
         rq_uid = str(uuid.uuid4())
         
-        async with httpx.AsyncClient(verify=False) as client:
-            try:
-                resp = await client.post(
-                    "https://ngw.devices.sberbank.ru:9443/api/v2/oauth",
-                    headers={
-                        "Authorization": f"Basic {auth_key}",
-                        "RqUID": rq_uid,
-                        "Content-Type": "application/x-www-form-urlencoded",
-                        "Accept": "application/json"
-                    },
-                    data={"scope": scope},
-                    timeout=10.0
-                )
-                resp.raise_for_status()
-                return resp.json()["access_token"]
-            except Exception as e:
-                logger.error(f"GigaChat auth error: {e}")
-                raise
+        client = self.client
+        try:
+            resp = await client.post(
+                self.AUTH_URL,
+                headers={
+                    "Authorization": f"Basic {auth_key}",
+                    "RqUID": rq_uid,
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "Accept": "application/json"
+                },
+                data={"scope": scope},
+                timeout=10.0
+            )
+            resp.raise_for_status()
+            data = resp.json()
+            # expires_at приходит в миллисекундах; если его нет — считаем, что токен живёт 30 минут
+            expires_at = data.get("expires_at")
+            expires_at = expires_at / 1000 if expires_at else time.time() + 1800
+            return data["access_token"], expires_at
+        except Exception as e:
+            logger.error(f"GigaChat auth error: {e}")
+            raise
+
+    def _check_auth(self, resp: httpx.Response):
+        if resp.status_code == 401:
+            # Токен отозван раньше срока — следующий запрос получит новый
+            self._token = None
+
+    def _headers(self, token: str) -> dict:
+        return {
+            "Authorization": f"Bearer {token}",
+            "RqUID": str(uuid.uuid4()),
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+
+    def _payload(self, prompt: str, stream: bool = False) -> dict:
+        return {
+            "model": self.config.model or "GigaChat",
+            "messages": [
+                {"role": "system", "content": GIGACHAT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.config.temperature,
+            "max_tokens": self.config.max_tokens,
+            "stream": stream
+        }
     
     async def _call_api(self, prompt: str, token: str) -> str:
-        rq_uid = str(uuid.uuid4())
-        
-        async with httpx.AsyncClient(verify=False) as client:
-            try:
-                resp = await client.post(
-                    "https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "RqUID": rq_uid,
-                        "Content-Type": "application/json",
-                        "Accept": "application/json"
-                    },
-                    json={
-                        "model": self.config.model or "GigaChat",
-                        "messages": [
-                            {
-                                "role": "system", 
-                                "content": "Ты — корпоративный ассистент «Знаток». Отвечай кратко, по делу, на русском языке. Если информации нет — скажи: «Не нашёл ответа в документах компании.»"
-                            },
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": self.config.temperature,
-                        "max_tokens": self.config.max_tokens
-                    },
-                    timeout=30.0
-                )
-                resp.raise_for_status()
-                return resp.json()["choices"][0]["message"]["content"].strip()
-            except Exception as e:
-                logger.error(f"GigaChat API error: {e}")
-                raise
+        client = self.client
+        try:
+            resp = await client.post(
+                self.API_URL,
+                headers=self._headers(token),
+                json=self._payload(prompt),
+                timeout=30.0
+            )
+            self._check_auth(resp)
+            resp.raise_for_status()
+            return resp.json()["choices"][0]["message"]["content"].strip()
+        except Exception as e:
+            logger.error(f"GigaChat API error: {e}")
+            raise
 
 class YandexGPTProvider(LLMProvider):
-    async def generate_response(self, prompt: str) -> str:
+    def _request(self, prompt: str, stream: bool = False) -> dict:
         api_key = self.config.api_key
         if not api_key:
             raise ValueError("YANDEX_API_KEY не задан в настройках")
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.post(
-                    "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
-                    headers={
-                        "Authorization": f"Api-Key {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "modelUri": f"gpt://{self.config.model or 'yandexgpt/latest'}",
-                        "completionOptions": {
-                            "stream": False,
-                            "temperature": self.config.temperature,
-                            "maxTokens": self.config.max_tokens
-                        },
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "Ты — корпоративный ассистент. Отвечай кратко и по делу на русском языке."
-                            },
-                            {"role": "user", "content": prompt}
-                        ]
-                    },
-                    timeout=30.0
-                )
+        return {
+            "url": "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
+            "headers": {
+                "Authorization": f"Api-Key {api_key}",
+                "Content-Type": "application/json"
+            },
+            "json": {
+                "modelUri": f"gpt://{self.config.model or 'yandexgpt/latest'}",
+                "completionOptions": {
+                    "stream": stream,
+                    "temperature": self.config.temperature,
+                    "maxTokens": self.config.max_tokens
+                },
+                "messages": [
+                    {"role": "system", "content": YANDEX_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ]
+            },
+            "timeout": 30.0
+        }
+
+    async def generate_response(self, prompt: str) -> str:
+        request = self._request(prompt)
+        client = self.client
+        try:
+            resp = await client.post(**request)
+            resp.raise_for_status()
+            result = resp.json()
+            return result["result"]["alternatives"][0]["message"]["text"].strip()
+        except Exception as e:
+            logger.error(f"Yandex GPT API error: {e}")
+            raise
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        request = self._request(prompt, stream=True)
+        client = self.client
+        try:
+            async with client.stream("POST", **request) as resp:
                 resp.raise_for_status()
-                result = resp.json()
-                return result["result"]["alternatives"][0]["message"]["text"].strip()
-            except Exception as e:
-                logger.error(f"Yandex GPT API error: {e}")
-                raise
+                # Каждая строка — JSON с накопленным текстом, отдаём только прирост
+                sent = ""
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    text = json.loads(line)["result"]["alternatives"][0]["message"]["text"]
+                    if len(text) > len(sent):
+                        yield text[len(sent):]
+                        sent = text
+        except Exception as e:
+            logger.error(f"Yandex GPT API error: {e}")
+            raise
 
 class OllamaProvider(LLMProvider):
-    async def generate_response(self, prompt: str) -> str:
+    def _request(self, prompt: str, stream: bool = False) -> dict:
         base_url = self.config.base_url or "http://localhost:11434"
-        model = self.config.model or "mistral"
-        temperature = self.config.temperature
-        max_tokens = self.config.max_tokens
-
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.post(
-                    f"{base_url.rstrip('/')}/api/generate",
-                    json={
-                        "model": model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": temperature,
-                            "num_predict": max_tokens
-                        }
-                    },
-                    timeout=60.0
-                )
+        return {
+            "url": f"{base_url.rstrip('/')}/api/generate",
+            "json": {
+                "model": self.config.model or "mistral",
+                "prompt": prompt,
+                "stream": stream,
+                "options": {
+                    "temperature": self.config.temperature,
+                    "num_predict": self.config.max_tokens
+                }
+            },
+            "timeout": 60.0
+        }
+
+    async def generate_response(self, prompt: str) -> str:
+        client = self.client
+        try:
+            resp = await client.post(**self._request(prompt))
+            resp.raise_for_status()
+            return resp.json()["response"].strip()
+        except Exception as e:
+            logger.error(f"Ollama API error: {e}")
+            raise
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        client = self.client
+        try:
+            async with client.stream("POST", **self._request(prompt, stream=True)) as resp:
                 resp.raise_for_status()
-                return resp.json()["response"].strip()
-            except Exception as e:
-                logger.error(f"Ollama API error: {e}")
-                raise
+                # NDJSON: {"response": "...", "done": false}
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+        except Exception as e:
+            logger.error(f"Ollama API error: {e}")
+            raise
 
 # ======================
 # Provider Factory
 # ======================
 
-def get_llm_provider():
-    settings = load_settings()
-    provider_type = settings.current_provider
-    provider_config = settings.providers.get(provider_type)
-    
-    if not provider_config:
-        raise ValueError(f"Провайдер {provider_type} не настроен")
-    
+# provider_type -> (отпечаток конфигурации, экземпляр, объект конфигурации)
+_PROVIDERS: Dict[ProviderType, Tuple[str, LLMProvider, Any]] = {}
+# Старый экземпляр закрываем не сразу: на нём могут доигрывать потоковые ответы
+PROVIDER_CLOSE_DELAY = 120
+
+def _create_provider(provider_type: ProviderType, provider_config) -> LLMProvider:
     if provider_type == ProviderType.GIGACHAT:
         return GigaChatProvider(provider_config)
     elif provider_type == ProviderType.YANDEX_GPT:
@@ -179,6 +330,45 @@ def get_llm_provider():
         return OllamaProvider(provider_config)
     else:
         raise ValueError(f"Неизвестный провайдер: {provider_type}")
+
+def _close_later(provider: LLMProvider):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.call_later(PROVIDER_CLOSE_DELAY, lambda: loop.create_task(provider.aclose()))
+
+def get_llm_provider():
+    """Возвращает долгоживущий экземпляр провайдера; пересоздаёт его только при смене конфигурации."""
+    settings = current_settings()
+    provider_type = settings.current_provider
+    provider_config = settings.providers.get(provider_type)
+    
+    if not provider_config:
+        raise ValueError(f"Провайдер {provider_type} не настроен")
+
+    cached = _PROVIDERS.get(provider_type)
+    # Настройки не перечитывались — тот же объект конфигурации, сравнивать нечего
+    if cached and cached[2] is provider_config:
+        return cached[1]
+
+    fingerprint = provider_config.model_dump_json()
+    if cached and cached[0] == fingerprint:
+        _PROVIDERS[provider_type] = (fingerprint, cached[1], provider_config)
+        return cached[1]
+
+    provider = _create_provider(provider_type, provider_config)
+    _PROVIDERS[provider_type] = (fingerprint, provider, provider_config)
+    if cached:
+        logger.info(f"Конфигурация провайдера {provider_type.value} изменилась, пересоздаём клиента")
+        _close_later(cached[1])
+    return provider
+
+async def close_llm_providers():
+    for _, provider, _ in list(_PROVIDERS.values()):
+        await provider.aclose()
+    _PROVIDERS.clear()
+
 # ======================
 # Updated RAG functions
 # ======================
@@ -191,59 +381,58 @@ async def get_llm_response(prompt: str) -> str:
         logger.error(f"LLM provider error: {e}")
         raise
 
-def get_embedding_model():
-    global _EMBEDDING_MODEL
-    if _EMBEDDING_MODEL is None:
-        logger.info("Загрузка модели эмбеддингов...")
-        _EMBEDDING_MODEL = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        logger.info("Модель загружена.")
-    return _EMBEDDING_MODEL
-
-def get_qdrant_client():
-    global _QDRANT_CLIENT
-    if _QDRANT_CLIENT is None:
-        host = os.getenv("QDRANT_HOST", "qdrant")
-        port = int(os.getenv("QDRANT_PORT", 6333))
-        _QDRANT_CLIENT = QdrantClient(host=host, port=port)
-    return _QDRANT_CLIENT
+async def stream_llm_response(prompt: str) -> AsyncIterator[str]:
+    provider = get_llm_provider()
+    async for token in provider.generate_stream(prompt):
+        yield token
 
 def build_metadata_filter(department: Optional[str] = None) -> Optional[Filter]:
     if not department or department == "all":
         return None
     return Filter(must=[FieldCondition(key="department", match=MatchValue(value=department))])
 
+# Отсечка по косинусу для векторной выдачи (было 0.6, потом 0.3)
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", 0.3))
+
+def format_hits(search_result) -> List[dict]:
+    return [
+        {
+            "id": str(hit.id),
+            "text": hit.payload.get("text", ""),
+            "source": hit.payload.get("source", "неизвестный источник"),
+            "score": hit.score
+        }
+        for hit in search_result
+        if hit.score > SEARCH_MIN_SCORE
+    ]
+
 def search_qdrant(question: str, department: Optional[str] = None) -> List[dict]:
     try:
         client = get_qdrant_client()
         collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
 
-        collections = client.get_collections().collections
-        collection_names = [c.name for c in collections]
-        if collection not in collection_names:
+        if get_collection_schema(collection) is None:
             logger.info(f"Коллекция {collection} не найдена. Возвращаем пустой результат.")
             return []
 
-        model = get_embedding_model()
-        query_vector = model.encode(f"query: {question}").tolist()
-
-        search_result = client.search(
-            collection_name=collection,
-            query_vector=query_vector,
-            query_filter=build_metadata_filter(department),
-            limit=4
-        )
-
-        # ФИЛЬТРАЦИЯ ПО SCORE > 0.3
-        filtered_hits = [
-            {
-                "text": hit.payload.get("text", ""),
-                "source": hit.payload.get("source", "неизвестный источник"),
-                "score": hit.score
-            }
-            for hit in search_result
-            if hit.score > 0.3  # ← было 0.6, теперь 0.3
-        ]
-        return filtered_hits
+        query_vector = embedding_cache.encode([question], "query")[0]
+
+        try:
+            search_result = client.search(
+                collection_name=collection,
+                query_vector=query_vector,
+                query_filter=build_metadata_filter(department),
+                search_params=qdrant_config.search_params(),
+                limit=4
+            )
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+            # Коллекцию удалили после того, как мы её закэшировали
+            forget_collection(collection)
+            return []
+
+        return format_hits(search_result)
 
     except Exception as e:
         logger.error(f"Ошибка поиска в Qdrant: {e}", exc_info=True)
@@ -0,0 +1,175 @@
+# backend/app/registry.py
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.http.exceptions import UnexpectedResponse
+from . import metrics
+
+logger = logging.getLogger("znatok.registry")
+
+# Единый реестр тяжёлых объектов процесса: модель эмбеддингов и клиенты Qdrant.
+# rag.py и ingestion.py берут их отсюда, чтобы модель не грузилась дважды.
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+# none | int8 | onnx
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none").lower()
+
+# Cross-encoder для переранжирования кандидатов (app.reranker)
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 256))
+
+_EMBEDDING_MODEL = None
+_RERANK_MODEL = None
+_QDRANT_CLIENT = None
+_ASYNC_QDRANT_CLIENT = None
+_MODEL_LOCK = threading.Lock()
+
+class _CountingClient:
+    """Обёртка над клиентом Qdrant: каждый вызов API попадает в метрику qdrant_calls."""
+
+    _NOT_COUNTED = {"close"}
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or name in self._NOT_COUNTED or not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            metrics.inc_request("qdrant_calls")
+            return attr(*args, **kwargs)
+        return counted
+
+def _load_embedding_model():
+    from sentence_transformers import SentenceTransformer
+
+    if EMBEDDING_QUANTIZATION == "onnx":
+        try:
+            return SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+        except TypeError:
+            # backend= появился в sentence-transformers 3.2
+            logger.warning("ONNX-бэкенд не поддерживается установленной версией sentence-transformers, грузим обычную модель")
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить ONNX-модель ({e}), грузим обычную модель")
+
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    if EMBEDDING_QUANTIZATION == "int8":
+        import torch
+        # Динамическая int8-квантизация линейных слоёв: меньше памяти и быстрее на CPU
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        logger.info("Модель эмбеддингов квантизована в int8")
+    return model
+
+def get_embedding_model():
+    global _EMBEDDING_MODEL
+    if _EMBEDDING_MODEL is None:
+        with _MODEL_LOCK:
+            if _EMBEDDING_MODEL is None:
+                logger.info(f"Загрузка модели эмбеддингов {EMBEDDING_MODEL_NAME}...")
+                _EMBEDDING_MODEL = _load_embedding_model()
+                logger.info("Модель загружена.")
+    return _EMBEDDING_MODEL
+
+def get_rerank_model():
+    global _RERANK_MODEL
+    if _RERANK_MODEL is None:
+        with _MODEL_LOCK:
+            if _RERANK_MODEL is None:
+                from sentence_transformers import CrossEncoder
+                logger.info(f"Загрузка модели переранжирования {RERANK_MODEL_NAME}...")
+                _RERANK_MODEL = CrossEncoder(RERANK_MODEL_NAME, max_length=RERANK_MAX_LENGTH, device="cpu")
+                logger.info("Модель переранжирования загружена.")
+    return _RERANK_MODEL
+
+def get_qdrant_client():
+    global _QDRANT_CLIENT
+    if _QDRANT_CLIENT is None:
+        host = os.getenv("QDRANT_HOST", "qdrant")
+        port = int(os.getenv("QDRANT_PORT", 6333))
+        _QDRANT_CLIENT = _CountingClient(QdrantClient(host=host, port=port))
+    return _QDRANT_CLIENT
+
+def get_async_qdrant_client():
+    global _ASYNC_QDRANT_CLIENT
+    if _ASYNC_QDRANT_CLIENT is None:
+        host = os.getenv("QDRANT_HOST", "qdrant")
+        port = int(os.getenv("QDRANT_PORT", 6333))
+        _ASYNC_QDRANT_CLIENT = _CountingClient(AsyncQdrantClient(host=host, port=port))
+    return _ASYNC_QDRANT_CLIENT
+
+# ======================
+# Кэш схемы коллекций
+# ======================
+# Существование коллекции и параметры векторов узнаём один раз, а не перед каждым поиском.
+# Кэш обновляет сторона индексации (ensure_collection_exists, сброс коллекции);
+# отсутствие коллекции кэшируем ненадолго — её может создать другой процесс (воркер).
+COLLECTION_MISSING_TTL = float(os.getenv("COLLECTION_MISSING_TTL", 30))
+
+# name -> (схема или None, когда проверяли)
+_COLLECTION_SCHEMA: Dict[str, Tuple[Optional[dict], float]] = {}
+
+def _schema_from_info(info) -> dict:
+    vectors = info.config.params.vectors
+    return {"vector_size": vectors.size, "distance": str(vectors.distance.value)}
+
+def _cached_schema(name: str) -> Tuple[bool, Optional[dict]]:
+    entry = _COLLECTION_SCHEMA.get(name)
+    if entry is None:
+        return False, None
+    schema, checked_at = entry
+    if schema is None and time.monotonic() - checked_at > COLLECTION_MISSING_TTL:
+        return False, None
+    return True, schema
+
+def set_collection_schema(name: str, schema: Optional[dict]):
+    _COLLECTION_SCHEMA[name] = (schema, time.monotonic())
+
+def forget_collection(name: str):
+    _COLLECTION_SCHEMA.pop(name, None)
+
+def is_not_found(error: Exception) -> bool:
+    return isinstance(error, UnexpectedResponse) and error.status_code == 404
+
+def get_collection_schema(name: str) -> Optional[dict]:
+    """Схема коллекции {vector_size, distance} или None, если коллекции нет."""
+    known, schema = _cached_schema(name)
+    if known:
+        return schema
+    try:
+        schema = _schema_from_info(get_qdrant_client().get_collection(name))
+    except Exception as e:
+        if not is_not_found(e):
+            raise
+        schema = None
+    set_collection_schema(name, schema)
+    return schema
+
+async def aget_collection_schema(name: str) -> Optional[dict]:
+    known, schema = _cached_schema(name)
+    if known:
+        return schema
+    try:
+        schema = _schema_from_info(await get_async_qdrant_client().get_collection(name))
+    except Exception as e:
+        if not is_not_found(e):
+            raise
+        schema = None
+    set_collection_schema(name, schema)
+    return schema
+
+def warmup():
+    """Загружает модель и прогоняет пробный запрос, чтобы первый вопрос пользователя не ждал."""
+    model = get_embedding_model()
+    model.encode(["query: прогрев", "passage: прогрев"])
+    logger.info("Модель эмбеддингов прогрета")
+
+async def close():
+    global _ASYNC_QDRANT_CLIENT
+    if _ASYNC_QDRANT_CLIENT is not None:
+        await _ASYNC_QDRANT_CLIENT.close()
+        _ASYNC_QDRANT_CLIENT = None
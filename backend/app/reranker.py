@@ -0,0 +1,77 @@
+# backend/app/reranker.py
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from .registry import get_rerank_model
+from . import metrics
+
+logger = logging.getLogger("znatok.reranker")
+
+# Двухэтапный поиск: из Qdrant (или гибридной выдачи) берём RERANK_CANDIDATES кандидатов,
+# cross-encoder оценивает пары (вопрос, чанк) одним батчем на CPU, в LLM уходят лучшие.
+# Если переранжирование не уложилось в RERANK_BUDGET_MS, отвечаем в порядке первого этапа.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 40))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 64))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 300))
+# Модель считает одну пачку за раз: параллельные пачки на CPU только мешают друг другу
+RERANK_CONCURRENCY = int(os.getenv("RERANK_CONCURRENCY", 1))
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+def get_rerank_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=max(1, RERANK_CONCURRENCY), thread_name_prefix="znatok-rerank")
+    return _EXECUTOR
+
+def score_sync(question: str, texts: List[str]) -> List[float]:
+    model = get_rerank_model()
+    scores = model.predict(
+        [(question, text) for text in texts],
+        batch_size=max(1, RERANK_BATCH_SIZE),
+        show_progress_bar=False
+    )
+    return [float(score) for score in scores]
+
+async def rerank(question: str, hits: List[dict], limit: int,
+                 budget_ms: Optional[float] = None) -> List[dict]:
+    """
+    Переупорядочивает hits по оценке cross-encoder и возвращает первые limit.
+    При превышении бюджета или ошибке — первые limit в исходном порядке.
+    """
+    if len(hits) <= 1:
+        return hits[:limit]
+    budget = RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    future = loop.run_in_executor(get_rerank_executor(), score_sync, question, [hit["text"] for hit in hits])
+    try:
+        scores = await asyncio.wait_for(asyncio.shield(future), budget / 1000 if budget > 0 else None)
+    except asyncio.TimeoutError:
+        # Пачка досчитается в фоне, результат не нужен; модель прогреется и для следующих вопросов
+        metrics.inc("rerank_fallback_budget")
+        logger.warning(f"Переранжирование не уложилось в {budget:.0f} мс, порядок первого этапа")
+        return hits[:limit]
+    except Exception as e:
+        metrics.inc("rerank_fallback_error")
+        logger.error(f"Ошибка переранжирования: {e}")
+        return hits[:limit]
+    finally:
+        metrics.observe("rerank_ms", (time.perf_counter() - started) * 1000)
+
+    ranked = sorted(zip(hits, scores), key=lambda item: item[1], reverse=True)[:limit]
+    return [{**hit, "score": score, "retrieval_score": hit.get("score")} for hit, score in ranked]
+
+def warmup():
+    score_sync("прогрев", ["прогрев"])
+    logger.info("Модель переранжирования прогрета")
+
+def shutdown():
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False)
+        _EXECUTOR = None
@@ -0,0 +1,228 @@
+# backend/app/retrieval.py
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from .rag import build_metadata_filter, format_hits
+from .registry import (
+    get_async_qdrant_client,
+    aget_collection_schema,
+    forget_collection,
+    is_not_found
+)
+from .batching import EmbeddingBatcher
+from . import embedding_cache, lexical, metrics, qdrant_config, reranker
+
+logger = logging.getLogger("znatok.retrieval")
+
+# Асинхронный поиск: эмбеддинг считается в отдельном пуле потоков,
+# Qdrant опрашивается через AsyncQdrantClient — event loop не блокируется.
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 2))
+# Микробатчинг запросов: пачка до N вопросов или до M миллисекунд ожидания.
+# EMBEDDING_BATCH_MAX_SIZE=1 отключает батчинг.
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 32))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", 5))
+
+# Гибридный поиск: векторная выдача Qdrant и лексическая (app.lexical, BM25) сливаются
+# через reciprocal rank fusion: score = sum 1 / (RRF_K + ранг). Точные совпадения
+# идентификаторов поднимаются, даже если косинус чанка ниже отсечки 0.3.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # dense | sparse | hybrid
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+RRF_K = int(os.getenv("RRF_K", 60))
+# Чанки, найденные только по словам, не проходят отсечку SEARCH_MIN_SCORE по косинусу.
+# Чтобы случайное совпадение одного частого слова не подменяло ответ «не найдено»,
+# такой чанк должен содержать не меньше HYBRID_SPARSE_MIN_COVERAGE термов вопроса
+# и (если задано) иметь BM25 не ниже HYBRID_SPARSE_MIN_BM25.
+HYBRID_SPARSE_MIN_COVERAGE = float(os.getenv("HYBRID_SPARSE_MIN_COVERAGE", 0.5))
+HYBRID_SPARSE_MIN_BM25 = float(os.getenv("HYBRID_SPARSE_MIN_BM25", 0))
+SEARCH_LIMIT = 4
+
+_EMBEDDING_EXECUTOR = None
+_QUERY_BATCHER = None
+
+def get_embedding_executor() -> ThreadPoolExecutor:
+    global _EMBEDDING_EXECUTOR
+    if _EMBEDDING_EXECUTOR is None:
+        _EMBEDDING_EXECUTOR = ThreadPoolExecutor(
+            max_workers=EMBEDDING_CONCURRENCY,
+            thread_name_prefix="znatok-embed"
+        )
+    return _EMBEDDING_EXECUTOR
+
+def _encode_query_sync(question: str) -> List[float]:
+    return embedding_cache.encode([question], "query")[0]
+
+def _encode_queries_sync(questions: List[str]) -> List[List[float]]:
+    return embedding_cache.encode(questions, "query", batch_size=len(questions))
+
+def get_query_batcher() -> EmbeddingBatcher:
+    global _QUERY_BATCHER
+    if _QUERY_BATCHER is None:
+        _QUERY_BATCHER = EmbeddingBatcher(
+            _encode_queries_sync,
+            executor=get_embedding_executor(),
+            max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
+            max_inflight=EMBEDDING_CONCURRENCY,
+            name="query_embedding_batch"
+        )
+    return _QUERY_BATCHER
+
+async def encode_query(question: str) -> List[float]:
+    """Считает эмбеддинг вопроса вне event loop (через батчер, если он включён)."""
+    if EMBEDDING_BATCH_MAX_SIZE > 1:
+        return await get_query_batcher().encode(question)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_embedding_executor(), _encode_query_sync, question)
+
+async def _dense_search(query_vector: List[float], department: Optional[str], limit: int) -> List[dict]:
+    client = get_async_qdrant_client()
+    collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    try:
+        search_result = await client.search(
+            collection_name=collection,
+            query_vector=query_vector,
+            query_filter=build_metadata_filter(department),
+            search_params=qdrant_config.search_params(),
+            limit=limit
+        )
+    except Exception as e:
+        if not is_not_found(e):
+            raise
+        # Коллекцию удалили после того, как мы её закэшировали
+        forget_collection(collection)
+        return []
+    return format_hits(search_result)
+
+async def _sparse_search(question: str, department: Optional[str], limit: int) -> List[Tuple[str, float]]:
+    index = lexical.get_lexical_index()
+    if index is None:
+        return []
+    try:
+        return await asyncio.to_thread(index.search, question, department, limit)
+    except Exception as e:
+        # Без лексического индекса отвечаем по векторам
+        logger.error(f"Ошибка лексического поиска: {e}")
+        return []
+
+async def _fetch_hits(point_ids: List[str]) -> Dict[str, dict]:
+    """Payload чанков, найденных только лексически."""
+    if not point_ids:
+        return {}
+    client = get_async_qdrant_client()
+    collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    points = await client.retrieve(collection_name=collection, ids=point_ids, with_payload=True, with_vectors=False)
+    return {
+        str(point.id): {
+            "id": str(point.id),
+            "text": point.payload.get("text", ""),
+            "source": point.payload.get("source", "неизвестный источник"),
+        }
+        for point in points
+    }
+
+def sparse_hit_is_relevant(question: str, text: str, bm25: float) -> bool:
+    """Отсечка для чанков без подтверждения векторным поиском."""
+    if bm25 < HYBRID_SPARSE_MIN_BM25:
+        return False
+    return lexical.term_coverage(question, text) >= HYBRID_SPARSE_MIN_COVERAGE
+
+def rrf_fuse(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, point_id in enumerate(ranking, start=1):
+            scores[point_id] = scores.get(point_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+async def search_by_vector(query_vector: List[float], department: Optional[str] = None,
+                           question: Optional[str] = None, mode: Optional[str] = None,
+                           limit: int = SEARCH_LIMIT, rerank: Optional[bool] = None,
+                           candidates: Optional[int] = None) -> List[dict]:
+    """
+    Поиск чанков по эмбеддингу вопроса; если передан текст вопроса — ещё и по словам.
+    mode: dense | sparse | hybrid (по умолчанию RETRIEVAL_MODE).
+    С rerank (по умолчанию RERANK_ENABLED) первый этап отдаёт candidates кандидатов
+    (RERANK_CANDIDATES), а до limit их сокращает cross-encoder.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if question is None or not question.strip():
+        # Без текста вопроса нет ни лексического поиска, ни пар для cross-encoder
+        mode, rerank = "dense", False
+    rerank = reranker.RERANK_ENABLED if rerank is None else rerank
+    if not rerank:
+        return await _first_stage(query_vector, department, question, mode, limit)
+
+    pool = max(limit, candidates or reranker.RERANK_CANDIDATES)
+    hits = await _first_stage(query_vector, department, question, mode, pool)
+    if len(hits) <= limit:
+        return hits
+    return await reranker.rerank(question, hits, limit)
+
+async def _first_stage(query_vector: List[float], department: Optional[str], question: Optional[str],
+                       mode: str, limit: int) -> List[dict]:
+    try:
+        collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+        if await aget_collection_schema(collection) is None:
+            logger.info(f"Коллекция {collection} не найдена. Возвращаем пустой результат.")
+            return []
+
+        if mode == "dense":
+            return await _dense_search(query_vector, department, limit)
+
+        started = time.perf_counter()
+        if mode == "sparse":
+            dense_hits, sparse = [], await _sparse_search(question, department, limit)
+        else:
+            per_list = max(limit, HYBRID_CANDIDATES)
+            dense_hits, sparse = await asyncio.gather(
+                _dense_search(query_vector, department, per_list),
+                _sparse_search(question, department, per_list)
+            )
+        metrics.observe("retrieval_hybrid_ms", (time.perf_counter() - started) * 1000)
+
+        by_id = {hit["id"]: hit for hit in dense_hits}
+        bm25 = dict(sparse)
+        fused = rrf_fuse([[hit["id"] for hit in dense_hits], [point_id for point_id, _ in sparse]])[:limit]
+        missing = [point_id for point_id, _ in fused if point_id not in by_id]
+        sparse_only = await _fetch_hits(missing)
+        rejected = 0
+        for point_id, hit in sparse_only.items():
+            if sparse_hit_is_relevant(question, hit["text"], bm25.get(point_id, 0.0)):
+                by_id[point_id] = hit
+            else:
+                rejected += 1
+        if len(sparse_only) - rejected:
+            metrics.inc("retrieval_sparse_only_hits", len(sparse_only) - rejected)
+        if rejected:
+            metrics.inc("retrieval_sparse_only_rejected", rejected)
+
+        hits = []
+        for point_id, score in fused:
+            hit = by_id.get(point_id)
+            if hit is None:
+                # Точка уже удалена из Qdrant (лексический индекс ещё не обновлён) или не прошла отсечку
+                continue
+            hits.append({**hit, "score": score})
+        return hits
+
+    except Exception as e:
+        logger.error(f"Ошибка поиска в Qdrant: {e}", exc_info=True)
+        raise
+
+async def search(question: str, department: Optional[str] = None, mode: Optional[str] = None) -> List[dict]:
+    """Асинхронный аналог rag.search_qdrant (с гибридным поиском)."""
+    query_vector = await encode_query(question)
+    return await search_by_vector(query_vector, department, question=question, mode=mode)
+
+async def shutdown():
+    """Останавливает батчер, пул эмбеддингов и переранжирования при остановке приложения."""
+    global _EMBEDDING_EXECUTOR, _QUERY_BATCHER
+    reranker.shutdown()
+    if _QUERY_BATCHER is not None:
+        await _QUERY_BATCHER.close()
+        _QUERY_BATCHER = None
+    if _EMBEDDING_EXECUTOR is not None:
+        _EMBEDDING_EXECUTOR.shutdown(wait=False)
+        _EMBEDDING_EXECUTOR = None
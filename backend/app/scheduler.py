@@ -0,0 +1,310 @@
+# backend/app/scheduler.py
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from . import metrics, confluence, bitrix24_kb
+
+logger = logging.getLogger("znatok.scheduler")
+
+# Плановая синхронизация источников знаний внутри процесса бэкенда.
+# - У каждого источника свой интервал (0 — только вручную) со случайным разбросом ±SYNC_JITTER:
+#   запуски не совпадают друг с другом и не выстраиваются в одно время после рестарта.
+# - Single-flight: пока синхронизация источника идёт, повторный запуск (по расписанию или
+#   кнопкой в админке) новую не стартует, а присоединяется к текущей.
+# - История запусков (длительность, просмотрено, проиндексировано, ошибки) — в SQLite;
+#   пишется в потоке (asyncio.to_thread), не блокируя event loop.
+# - Плановые запуски откладываются, пока p95 задержки /api/ask за последние
+#   SYNC_SLO_WINDOW_SECONDS выше SYNC_SLO_ASK_P95_MS: индексация не должна отнимать
+#   CPU и Qdrant у пользователей. Ручной запуск выполняется всегда.
+# По умолчанию расписание выключено: после обновления полные синхронизации
+# не должны стартовать сами, их включают явно (SYNC_SCHEDULER_ENABLED=true).
+SYNC_SCHEDULER_ENABLED = os.getenv("SYNC_SCHEDULER_ENABLED", "false").lower() == "true"
+SYNC_CONFLUENCE_INTERVAL_MINUTES = float(os.getenv("SYNC_CONFLUENCE_INTERVAL_MINUTES", 60))
+SYNC_BITRIX24_KB_INTERVAL_MINUTES = float(os.getenv("SYNC_BITRIX24_KB_INTERVAL_MINUTES", 60))
+SYNC_JITTER = min(0.5, max(0.0, float(os.getenv("SYNC_JITTER", 0.1))))
+SYNC_HISTORY_DB = os.getenv("SYNC_HISTORY_DB", "/app/data/sync_history.db")
+SYNC_HISTORY_KEEP = int(os.getenv("SYNC_HISTORY_KEEP", 500))  # записей на источник
+SYNC_SLO_ASK_P95_MS = float(os.getenv("SYNC_SLO_ASK_P95_MS", 10000))  # 0 — не следить
+SYNC_SLO_WINDOW_SECONDS = int(os.getenv("SYNC_SLO_WINDOW_SECONDS", 300))
+SYNC_SLO_MIN_SAMPLES = int(os.getenv("SYNC_SLO_MIN_SAMPLES", 20))
+SYNC_SLO_RECHECK_SECONDS = int(os.getenv("SYNC_SLO_RECHECK_SECONDS", 60))
+
+# Задержка /api/ask пишется в эту гистограмму middleware из main.py
+ASK_LATENCY_METRIC = "ask_latency_ms"
+
+TRIGGER_MANUAL = "manual"
+TRIGGER_SCHEDULE = "schedule"
+
+SyncFn = Callable[[], Awaitable[Dict]]
+
+class SyncSource:
+    def __init__(self, name: str, run: SyncFn, interval_minutes: float,
+                 on_start: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.run = run
+        self.interval = max(0.0, interval_minutes) * 60
+        self.on_start = on_start
+        self.task: Optional[asyncio.Task] = None
+        # Сколько запусков присоединилось к текущему (пишется в историю по завершении)
+        self.coalesced = 0
+        self.next_run_at: Optional[float] = None  # time.time()
+        self.paused: Optional[str] = None
+
+    def is_running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def schedule_next(self, after: float):
+        if self.interval > 0:
+            self.next_run_at = after + self.interval * (1 + random.uniform(-SYNC_JITTER, SYNC_JITTER))
+
+_SOURCES: Dict[str, SyncSource] = {
+    "confluence": SyncSource(
+        "confluence", confluence.sync_confluence, SYNC_CONFLUENCE_INTERVAL_MINUTES,
+        on_start=confluence.reset_progress
+    ),
+    "bitrix24_kb": SyncSource("bitrix24_kb", bitrix24_kb.sync_bitrix24_kb, SYNC_BITRIX24_KB_INTERVAL_MINUTES),
+}
+_LOOPS: List[asyncio.Task] = []
+
+# ======================
+# История запусков
+# ======================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    trigger TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    duration_seconds REAL,
+    pages_scanned INTEGER,
+    pages_indexed INTEGER,
+    errors INTEGER,
+    coalesced INTEGER NOT NULL DEFAULT 0,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sync_runs_source ON sync_runs(source, id);
+"""
+
+_INITIALIZED = set()
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+@contextmanager
+def _connect():
+    path = SYNC_HISTORY_DB
+    if path not in _INITIALIZED:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        if path not in _INITIALIZED:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            # Запуски, прерванные рестартом процесса, так и остались бы «running»
+            conn.execute(
+                "UPDATE sync_runs SET status = 'interrupted', finished_at = ? WHERE status = 'running'",
+                (_now(),)
+            )
+            _INITIALIZED.add(path)
+        yield conn
+    finally:
+        conn.close()
+
+def _record_start(source: str, reason: str) -> int:
+    with _connect() as conn:
+        cur = conn.execute(
+            "INSERT INTO sync_runs (source, trigger, status, started_at) VALUES (?, ?, 'running', ?)",
+            (source, reason, _now())
+        )
+        return cur.lastrowid
+
+def _record_finish(run_id: int, source: str, status: str, duration: float, result: Dict, coalesced: int = 0):
+    with _connect() as conn:
+        conn.execute(
+            """
+            UPDATE sync_runs
+            SET status = ?, finished_at = ?, duration_seconds = ?,
+                pages_scanned = ?, pages_indexed = ?, errors = ?, message = ?, coalesced = ?
+            WHERE id = ?
+            """,
+            (
+                status, _now(), round(duration, 3),
+                result.get("total"), result.get("synced"), result.get("failed"),
+                result.get("message") or result.get("reason"), coalesced, run_id
+            )
+        )
+        conn.execute(
+            """
+            DELETE FROM sync_runs WHERE source = ? AND id <= (
+                SELECT id FROM sync_runs WHERE source = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+            """,
+            (source, source, SYNC_HISTORY_KEEP)
+        )
+
+def _last_finished(source: str) -> Optional[float]:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT finished_at FROM sync_runs WHERE source = ? AND finished_at IS NOT NULL "
+            "ORDER BY id DESC LIMIT 1",
+            (source,)
+        ).fetchone()
+    if row is None:
+        return None
+    return datetime.fromisoformat(row["finished_at"]).timestamp()
+
+def history(source: Optional[str] = None, limit: int = 50) -> List[Dict]:
+    with _connect() as conn:
+        if source:
+            rows = conn.execute(
+                "SELECT * FROM sync_runs WHERE source = ? ORDER BY id DESC LIMIT ?", (source, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM sync_runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+# ======================
+# Запуск синхронизации
+# ======================
+async def _run(source: SyncSource, reason: str) -> Dict:
+    started = time.monotonic()
+    status, result = "error", {}
+    run_id = None
+    try:
+        try:
+            run_id = await asyncio.to_thread(_record_start, source.name, reason)
+        except Exception as e:
+            logger.error(f"Не удалось записать историю синхронизации {source.name}: {e}")
+        result = await source.run()
+        status = result.get("status", "ok")
+        return result
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception as e:
+        logger.error(f"Синхронизация {source.name} упала: {e}")
+        result = {"status": "error", "message": str(e)}
+        return result
+    finally:
+        duration = time.monotonic() - started
+        metrics.observe(f"sync_duration_seconds:{source.name}", duration)
+        metrics.inc(f"sync_runs:{source.name}:{status}")
+        if run_id is not None:
+            try:
+                await asyncio.to_thread(
+                    _record_finish, run_id, source.name, status, duration, result, source.coalesced
+                )
+            except Exception as e:
+                logger.error(f"Не удалось записать историю синхронизации {source.name}: {e}")
+        source.schedule_next(time.time())
+        logger.info(f"Синхронизация {source.name} ({reason}): {status} за {duration:.1f}с")
+
+def trigger(name: str, reason: str = TRIGGER_MANUAL) -> Tuple[asyncio.Task, bool]:
+    """
+    Запускает синхронизацию источника, если она ещё не идёт.
+    Возвращает (задача, запущена ли новая): при повторном запуске — текущую задачу.
+    Проверка и запуск — без await, поэтому две одновременные попытки не стартуют две синхронизации.
+    """
+    source = _SOURCES[name]
+    if source.is_running():
+        metrics.inc(f"sync_coalesced:{name}")
+        source.coalesced += 1
+        return source.task, False
+    if source.on_start is not None:
+        source.on_start()
+    source.coalesced = 0
+    source.task = asyncio.create_task(_run(source, reason))
+    return source.task, True
+
+async def run(name: str, reason: str = TRIGGER_MANUAL) -> Dict:
+    """Запускает синхронизацию (или присоединяется к идущей) и ждёт результата."""
+    task, _ = trigger(name, reason)
+    # shield: отмена запроса, который ждёт результат, не должна прерывать саму синхронизацию
+    return await asyncio.shield(task)
+
+# ======================
+# Расписание
+# ======================
+def slo_violation() -> Optional[str]:
+    """Причина паузы, если задержка /api/ask сейчас выше SLO, иначе None."""
+    if SYNC_SLO_ASK_P95_MS <= 0:
+        return None
+    recent = metrics.recent_summary(ASK_LATENCY_METRIC, SYNC_SLO_WINDOW_SECONDS)
+    if recent["count"] < SYNC_SLO_MIN_SAMPLES or recent["p95"] <= SYNC_SLO_ASK_P95_MS:
+        return None
+    return f"p95 /api/ask {recent['p95']:.0f} мс > {SYNC_SLO_ASK_P95_MS:.0f} мс"
+
+async def _schedule_loop(source: SyncSource):
+    last = await asyncio.to_thread(_last_finished, source.name)
+    if last is not None:
+        source.schedule_next(last)
+    else:
+        # Первый запуск: тоже с разбросом, чтобы источники не стартовали одновременно
+        source.next_run_at = time.time() + source.interval * random.uniform(0, SYNC_JITTER)
+
+    while True:
+        wait = source.next_run_at - time.time()
+        if wait > 0:
+            await asyncio.sleep(min(wait, SYNC_SLO_RECHECK_SECONDS))
+            continue
+        if source.is_running():
+            # Идёт ручной запуск: следующий плановый отсчитается от его завершения
+            await asyncio.wait({source.task})
+            continue
+
+        reason = slo_violation()
+        if reason:
+            if source.paused is None:
+                logger.warning(f"Плановая синхронизация {source.name} отложена: {reason}")
+            source.paused = reason
+            metrics.inc(f"sync_deferred:{source.name}")
+            source.next_run_at = time.time() + SYNC_SLO_RECHECK_SECONDS
+            continue
+        if source.paused is not None:
+            logger.info(f"Задержка /api/ask в норме, возобновляем синхронизацию {source.name}")
+            source.paused = None
+
+        task, _ = trigger(source.name, TRIGGER_SCHEDULE)
+        await asyncio.wait({task})
+
+def start():
+    if not SYNC_SCHEDULER_ENABLED or _LOOPS:
+        return
+    for source in _SOURCES.values():
+        if source.interval > 0:
+            _LOOPS.append(asyncio.create_task(_schedule_loop(source)))
+            logger.info(f"Синхронизация {source.name}: каждые {source.interval / 60:.0f} мин ±{SYNC_JITTER:.0%}")
+
+def status() -> Dict[str, Dict]:
+    return {
+        name: {
+            "running": source.is_running(),
+            "interval_minutes": source.interval / 60 if source.interval else None,
+            "next_run_at": (
+                datetime.fromtimestamp(source.next_run_at, timezone.utc).isoformat()
+                if source.next_run_at and source.interval and _LOOPS else None
+            ),
+            "paused": source.paused,
+        }
+        for name, source in _SOURCES.items()
+    }
+
+async def shutdown():
+    tasks = _LOOPS + [source.task for source in _SOURCES.values() if source.is_running()]
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    _LOOPS.clear()
@@ -1,40 +1,251 @@
 # backend/app/storage.py
-from typing import List, Dict, Optional
-import uuid
+import os
+import json
+import base64
+import sqlite3
+import logging
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, Optional, Tuple
 
-# В MVP — in-memory. В продакшене — БД.
-DOCUMENTS: List[Dict] = []
-
-def add_document(filename: str, department: str, filepath: str) -> str:
-    global DOCUMENTS
-    # Удаляем старую версию
-    DOCUMENTS = [d for d in DOCUMENTS if d["filename"] != filename]
-    
-    doc_id = str(uuid.uuid4())
-    DOCUMENTS.append({
-        "id": doc_id,
-        "filename": filename,
-        "department": department,
-        "filepath": filepath,
-        "uploaded_at": datetime.utcnow().isoformat()
-    })
-    return doc_id
-
-def get_documents() -> List[Dict]:
-    return [
-        {k: v for k, v in doc.items() if k != "filepath"}  # не возвращаем путь наружу
-        for doc in DOCUMENTS
-    ]
-
-def delete_document(doc_id: str) -> bool:
-    global DOCUMENTS
-    before = len(DOCUMENTS)
-    DOCUMENTS = [d for d in DOCUMENTS if d["id"] != doc_id]
-    return len(DOCUMENTS) < before
-
-def get_document_by_id(doc_id: str) -> Optional[Dict]:
-    for doc in DOCUMENTS:
-        if doc["id"] == doc_id:
-            return doc
-    return None
\ No newline at end of file
+logger = logging.getLogger("znatok.storage")
+
+# Каталог документов в SQLite: что проиндексировано, откуда и когда.
+# Его ведёт индексация (app.ingestion), а /api/documents читает только его —
+# без обхода точек Qdrant. Ключ — source: имя файла или URL страницы.
+DOCUMENTS_DB = os.getenv("DOCUMENTS_DB", "/app/data/documents.db")
+
+# Откуда документ: загрузка файла, синхронизация источника или текст через API
+ORIGIN_UPLOAD = "upload"
+ORIGIN_CONFLUENCE = "confluence"
+ORIGIN_BITRIX24_KB = "bitrix24_kb"
+ORIGIN_TEXT = "text"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    source TEXT PRIMARY KEY,
+    department TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    content_hash TEXT,
+    text_hash TEXT,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    size INTEGER,
+    indexed_at TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_indexed ON documents(indexed_at DESC, source);
+CREATE INDEX IF NOT EXISTS idx_documents_origin ON documents(origin, indexed_at DESC, source);
+CREATE INDEX IF NOT EXISTS idx_documents_department ON documents(department, indexed_at DESC, source);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Колонки, добавленные после первой версии каталога
+_MIGRATIONS = {
+    "text_hash": "ALTER TABLE documents ADD COLUMN text_hash TEXT",
+}
+
+_INITIALIZED = set()
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+@contextmanager
+def _connect():
+    path = DOCUMENTS_DB
+    if path not in _INITIALIZED:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        if path not in _INITIALIZED:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+            for column, ddl in _MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(ddl)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_text_hash ON documents(text_hash)")
+            _INITIALIZED.add(path)
+        yield conn
+    finally:
+        conn.close()
+
+def upsert_document(source: str, department: str, origin: str, chunks: int,
+                    content_hash: Optional[str] = None, size: Optional[int] = None,
+                    text_hash: Optional[str] = None) -> Optional[str]:
+    """Записывает документ; возвращает прежний text_hash (чтобы вызывающий мог убрать старый блоб)."""
+    now = _now()
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT text_hash FROM documents WHERE source = ?", (source,)).fetchone()
+            conn.execute(
+                """
+                INSERT INTO documents
+                    (source, department, origin, content_hash, text_hash, chunks, size, indexed_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET
+                    department = excluded.department,
+                    origin = excluded.origin,
+                    content_hash = COALESCE(excluded.content_hash, documents.content_hash),
+                    text_hash = COALESCE(excluded.text_hash, documents.text_hash),
+                    chunks = excluded.chunks,
+                    size = COALESCE(excluded.size, documents.size),
+                    indexed_at = excluded.indexed_at
+                """,
+                (source, department, origin, content_hash, text_hash, chunks, size, now, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return row["text_hash"] if row else None
+
+def set_text_hash(source: str, text_hash: str) -> bool:
+    with _connect() as conn:
+        return conn.execute(
+            "UPDATE documents SET text_hash = ? WHERE source = ?", (text_hash, source)
+        ).rowcount > 0
+
+def is_text_referenced(text_hash: str) -> bool:
+    """Ссылается ли на блоб с этим текстом хоть один документ каталога."""
+    with _connect() as conn:
+        return conn.execute(
+            "SELECT 1 FROM documents WHERE text_hash = ? LIMIT 1", (text_hash,)
+        ).fetchone() is not None
+
+def delete_document(source: str) -> Optional[Dict]:
+    """Удаляет документ из каталога и возвращает удалённую запись."""
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM documents WHERE source = ?", (source,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM documents WHERE source = ?", (source,))
+    return dict(row) if row else None
+
+def get_document(source: str) -> Optional[Dict]:
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM documents WHERE source = ?", (source,)).fetchone()
+    return dict(row) if row else None
+
+def clear():
+    with _connect() as conn:
+        conn.execute("DELETE FROM documents")
+        conn.execute("DELETE FROM meta")
+
+# ======================
+# Постраничная выдача
+# ======================
+# Порядок — от новых к старым: (indexed_at DESC, source ASC). Курсор — последняя
+# выданная пара, закодированная в base64, поэтому вставки не сдвигают страницы.
+def _encode_cursor(row: Dict) -> str:
+    raw = json.dumps([row["indexed_at"], row["source"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        indexed_at, source = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(indexed_at), str(source)
+    except Exception:
+        raise ValueError("Некорректный курсор")
+
+def list_documents(limit: int = 50, cursor: Optional[str] = None, origin: Optional[str] = None,
+                   department: Optional[str] = None, query: Optional[str] = None) -> Dict:
+    where, params = [], []
+    if origin:
+        where.append("origin = ?")
+        params.append(origin)
+    if department:
+        where.append("department = ?")
+        params.append(department)
+    if query:
+        where.append("source LIKE ? ESCAPE '\\'")
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+    if cursor:
+        indexed_at, source = _decode_cursor(cursor)
+        where.append("(indexed_at < ? OR (indexed_at = ? AND source > ?))")
+        params.extend([indexed_at, indexed_at, source])
+
+    sql = "SELECT * FROM documents"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY indexed_at DESC, source ASC LIMIT ?"
+    params.append(limit + 1)
+
+    with _connect() as conn:
+        rows = [dict(row) for row in conn.execute(sql, params)]
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"documents": rows[:limit], "next_cursor": next_cursor}
+
+# ======================
+# Заполнение из Qdrant
+# ======================
+def _origin_of(source: str) -> str:
+    if "/pages/viewpage.action" in source:
+        return ORIGIN_CONFLUENCE
+    if source.startswith("bitrix24_kb:"):
+        return ORIGIN_BITRIX24_KB
+    return ORIGIN_UPLOAD
+
+def backfill(batch_size: int = 1000) -> int:
+    """
+    Однократно строит каталог по точкам существующей коллекции Qdrant
+    (документы, проиндексированные до появления каталога).
+    """
+    from .registry import get_qdrant_client, get_collection_schema
+
+    collection = os.getenv("QDRANT_COLLECTION", "znatok_chunks")
+    key = f"backfilled:{collection}"
+    with _connect() as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+            return 0
+
+    documents: Dict[str, Dict] = {}
+    if get_collection_schema(collection) is not None:
+        client = get_qdrant_client()
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["source", "department", "content_hash", "uploaded_at"],
+                with_vectors=False
+            )
+            for point in points:
+                source = point.payload.get("source")
+                if not source:
+                    continue
+                doc = documents.setdefault(source, {
+                    "department": point.payload.get("department", "all"),
+                    "content_hash": point.payload.get("content_hash"),
+                    "indexed_at": point.payload.get("uploaded_at") or _now(),
+                    "chunks": 0,
+                })
+                doc["chunks"] += 1
+                doc["indexed_at"] = max(doc["indexed_at"], point.payload.get("uploaded_at") or "")
+            if offset is None:
+                break
+
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for source, doc in documents.items():
+                # Документы, уже записанные индексацией, не трогаем
+                conn.execute(
+                    """
+                    INSERT OR IGNORE INTO documents
+                        (source, department, origin, content_hash, chunks, size, indexed_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, NULL, ?, ?)
+                    """,
+                    (source, doc["department"], _origin_of(source), doc["content_hash"],
+                     doc["chunks"], doc["indexed_at"], doc["indexed_at"])
+                )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, _now()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    if documents:
+        logger.info(f"Каталог документов заполнен из {collection}: {len(documents)} документов")
+    return len(documents)
@@ -1,15 +1,20 @@
 # backend/app/telegram.py
 
 import os
+import json
 import asyncio
 import logging
 import aiohttp
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
 logger = logging.getLogger("znatok.telegram")
 
 class ZnatokTelegramBot:
+    MAX_LENGTH = 4096
+    EDIT_INTERVAL = 1.0  # секунд между правками сообщения
+
     def __init__(self, backend_url: str, bot_token: str):
         if not bot_token:
             raise ValueError("Telegram bot token is required")
@@ -81,30 +86,84 @@ class ZnatokTelegramBot:
         logger.info(f"Telegram вопрос от {update.effective_user.id}: {user_question}")
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.backend_url}/api/ask",
-                    json={"question": user_question, "user_department": "all"},
-                    timeout=30.0
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        answer = data.get("answer", "Не удалось получить ответ.")
-                        sources = data.get("sources", [])
-                        
-                        response_text = f"*Ответ:*\n{answer}"
-                        if sources:
-                            unique_sources = list({src["source"] for src in sources})
-                            sources_text = "\n".join([f"• {src}" for src in unique_sources])
-                            response_text += f"\n\n*Источники:*\n{sources_text}"
-                        
-                        await self.send_long_message(update, response_text)
-                    else:
-                        await update.message.reply_text("❌ Ошибка обработки запроса.")
+            await self._stream_answer(update, user_question)
         except Exception as e:
             logger.error(f"Ошибка Telegram: {e}")
             await update.message.reply_text("❌ Внутренняя ошибка.")
 
+    async def _stream_answer(self, update: Update, user_question: str):
+        """
+        Читает SSE из /api/ask/stream и по мере генерации редактирует одно сообщение.
+        Правки не чаще EDIT_INTERVAL — Telegram ограничивает частоту editMessageText.
+        """
+        reply = None
+        sources = []
+        parts = []
+        last_edit = 0.0
+        event = None
+        loop = asyncio.get_running_loop()
+
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{self.backend_url}/api/ask/stream",
+                json={"question": user_question, "user_department": "all"},
+                timeout=aiohttp.ClientTimeout(total=120)
+            ) as response:
+                if response.status != 200:
+                    await update.message.reply_text("❌ Ошибка обработки запроса.")
+                    return None, []
+
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").rstrip("\n")
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                        continue
+                    if not line.startswith("data:"):
+                        continue
+                    data = json.loads(line[len("data:"):])
+
+                    if event == "sources":
+                        sources = data.get("sources", [])
+                    elif event == "token":
+                        parts.append(data.get("text", ""))
+                        text = "".join(parts)
+                        if reply is None:
+                            reply = await update.message.reply_text(text[:self.MAX_LENGTH])
+                            last_edit = loop.time()
+                        elif loop.time() - last_edit >= self.EDIT_INTERVAL and len(text) <= self.MAX_LENGTH:
+                            await self._safe_edit(reply, text)
+                            last_edit = loop.time()
+                    elif event == "error":
+                        await update.message.reply_text("❌ Ошибка обработки запроса.")
+                        return None, []
+                    elif event == "done":
+                        break
+
+        answer = "".join(parts).strip() or "Не удалось получить ответ."
+        response_text = f"*Ответ:*\n{answer}"
+        if sources:
+            unique_sources = list({src["source"] for src in sources})
+            sources_text = "\n".join([f"• {src}" for src in unique_sources])
+            response_text += f"\n\n*Источники:*\n{sources_text}"
+
+        if reply is not None and len(response_text) <= self.MAX_LENGTH:
+            await self._safe_edit(reply, response_text, parse_mode='Markdown')
+        else:
+            if reply is not None:
+                await reply.delete()
+            await self.send_long_message(update, response_text)
+        return answer, sources
+
+    async def _safe_edit(self, message, text: str, parse_mode: str = None):
+        try:
+            await message.edit_text(text, parse_mode=parse_mode)
+        except BadRequest as e:
+            if parse_mode and "not modified" not in str(e).lower():
+                # Битая Markdown-разметка в ответе LLM — показываем как обычный текст
+                await message.edit_text(text)
+            else:
+                logger.debug(f"Telegram edit skipped: {e}")
+
     async def send_long_message(self, update: Update, text: str, max_length: int = 4096):
         if len(text) <= max_length:
             await update.message.reply_text(text, parse_mode='Markdown')
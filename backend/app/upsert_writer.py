@@ -0,0 +1,181 @@
+# backend/app/upsert_writer.py
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Set
+from qdrant_client.models import PointStruct
+from . import metrics
+
+logger = logging.getLogger("znatok.upsert_writer")
+
+# Запись точек в Qdrant пачками фиксированного размера. Пачки уходят с wait=False
+# (Qdrant отвечает после записи в WAL) из пула потоков, одновременно до UPSERT_MAX_INFLIGHT.
+# Каждая UPSERT_CONFIRM_EVERY-я пачка идёт с wait=True — это лишь ограничивает отставание
+# индекса и ничего не говорит о пачках, одновременно отправленных из других потоков.
+# Видимость гарантирует только flush(): он дожидается ответа на все отправленные пачки
+# (все они уже приняты в WAL) и лишь затем шлёт операцию с wait=True; на одной ноде Qdrant
+# применяет операции коллекции в порядке приёма, поэтому её подтверждение покрывает и их.
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", 256))
+UPSERT_MAX_INFLIGHT = int(os.getenv("UPSERT_MAX_INFLIGHT", 4))
+UPSERT_CONFIRM_EVERY = int(os.getenv("UPSERT_CONFIRM_EVERY", 16))
+UPSERT_WAIT = os.getenv("UPSERT_WAIT", "false").lower() == "true"
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=max(1, UPSERT_MAX_INFLIGHT) * 2,
+                    thread_name_prefix="znatok-upsert"
+                )
+    return _EXECUTOR
+
+class UpsertWriter:
+    """
+    Буферизующий писатель точек для одной сессии индексации (документ или синхронизация).
+
+    add() не ждёт Qdrant, пока в полёте меньше max_inflight пачек, — эмбеддинги следующей
+    пачки считаются параллельно с записью предыдущей. flush() дописывает остаток, дожидается
+    подтверждения и вызывает on_confirmed для источников, чьи точки стали видны в поиске.
+    """
+
+    def __init__(self, client, collection: str,
+                 batch_size: int = UPSERT_BATCH_SIZE,
+                 max_inflight: int = UPSERT_MAX_INFLIGHT,
+                 confirm_every: int = UPSERT_CONFIRM_EVERY,
+                 wait: bool = UPSERT_WAIT,
+                 on_confirmed: Optional[Callable[[str], None]] = None):
+        self.client = client
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.confirm_every = max(1, confirm_every)
+        self.wait = wait
+        self.on_confirmed = on_confirmed
+        self._slots = threading.Semaphore(max(1, max_inflight))
+        self._lock = threading.Lock()
+        # Пачки, которые add() уже снял с буфера, но ещё не отправил: flush() их дожидается
+        self._sends_done = threading.Condition(self._lock)
+        self._pending_sends = 0
+        self._buffer: List[PointStruct] = []
+        self._inflight: List[Future] = []
+        self._sent_batches = 0
+        self._last_point: Optional[PointStruct] = None
+        self._unconfirmed_sources: Set[str] = set()
+        self._error: Optional[BaseException] = None
+        self.points_written = 0
+
+    def add(self, points: List[PointStruct], source: Optional[str] = None):
+        if self._error is not None:
+            raise self._error
+        with self._lock:
+            self._buffer.extend(points)
+            if source:
+                self._unconfirmed_sources.add(source)
+            ready = []
+            while len(self._buffer) >= self.batch_size:
+                ready.append(self._buffer[:self.batch_size])
+                self._buffer = self._buffer[self.batch_size:]
+            self._pending_sends += len(ready)
+        for batch in ready:
+            try:
+                self._send(batch)
+            finally:
+                with self._lock:
+                    self._pending_sends -= 1
+                    self._sends_done.notify_all()
+
+    def _send(self, batch: List[PointStruct], wait: Optional[bool] = None):
+        # Писатель общий для нескольких потоков индексации (Confluence, Битрикс24)
+        with self._lock:
+            self._sent_batches += 1
+            if wait is None:
+                wait = self.wait or self._sent_batches % self.confirm_every == 0
+            self._last_point = batch[-1]
+        # Ждём свободный слот: не больше max_inflight пачек одновременно (backpressure)
+        self._slots.acquire()
+        try:
+            future = _get_executor().submit(self._upsert, batch, wait)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._inflight = [f for f in self._inflight if not f.done()]
+            self._inflight.append(future)
+
+    def _upsert(self, batch: List[PointStruct], wait: bool):
+        started = time.perf_counter()
+        try:
+            self.client.upsert(collection_name=self.collection, points=batch, wait=wait)
+            elapsed = time.perf_counter() - started
+            metrics.inc("ingest_upsert_points", len(batch))
+            metrics.inc("ingest_upsert_batches")
+            metrics.observe("ingest_upsert_batch_ms", elapsed * 1000)
+            if elapsed > 0:
+                metrics.observe("ingest_upsert_points_per_sec", len(batch) / elapsed)
+            with self._lock:
+                self.points_written += len(batch)
+        except BaseException as e:
+            logger.error(f"Ошибка записи пачки из {len(batch)} точек в Qdrant: {e}")
+            self._error = self._error or e
+            raise
+        finally:
+            self._slots.release()
+
+    def flush(self):
+        """Отправляет остаток буфера и ждёт, пока все точки будут применены в Qdrant."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._sends_done.wait_for(lambda: self._pending_sends == 0)
+            # Подтверждаем только источники, чьи точки уже отправлены или лежат в batch
+            sources, self._unconfirmed_sources = self._unconfirmed_sources, set()
+            last_point, self._last_point = self._last_point, None
+        if batch:
+            # Последняя пачка — после ответа на все остальные и с wait=True
+            self._drain()
+            self._send(batch, wait=True)
+            self._drain()
+        else:
+            self._drain()
+            if last_point is not None and not self.wait:
+                # Буфер пуст, но последние пачки ушли с wait=False — повторная запись
+                # последней точки (идемпотентна) с wait=True после ответа на все пачки
+                self.client.upsert(collection_name=self.collection, points=[last_point], wait=True)
+        if self._error is not None:
+            with self._lock:
+                self._unconfirmed_sources |= sources
+            raise self._error
+
+        if self.on_confirmed is not None:
+            for source in sources:
+                self.on_confirmed(source)
+
+    def _drain(self):
+        with self._lock:
+            inflight, self._inflight = self._inflight, []
+        for future in inflight:
+            try:
+                future.result()
+            except BaseException:
+                pass  # ошибка уже сохранена в self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self._drain()
+        return False
+
+def shutdown():
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=True)
+        _EXECUTOR = None
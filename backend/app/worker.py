@@ -0,0 +1,205 @@
+# backend/app/worker.py
+"""
+Воркер индексации: забирает задачи из очереди (app.jobs) и индексирует документы.
+
+Конвейер из двух ступеней, связанных ограниченной очередью:
+  extract — потоки забирают задачи и извлекают текст в пуле процессов (app.extraction);
+  index   — потоки режут текст на чанки, считают эмбеддинги и пишут в Qdrant.
+Пока один документ эмбеддится, следующие уже парсятся; если индексация не успевает,
+очередь заполняется и экстракторы перестают брать новые задачи.
+
+Запуск отдельным процессом (сервис ingestion в docker-compose):
+    python -m app.worker
+или внутри бэкенда потоками — см. start_inprocess_workers().
+"""
+import os
+import queue
+import signal
+import socket
+import time
+import logging
+import threading
+from typing import List, Optional
+from . import jobs, extraction, embedding_cache
+from .ingestion import extract_stage, index_extracted, is_document_unchanged
+
+logger = logging.getLogger("znatok.worker")
+
+# Потоки ступени extract (сам разбор идёт в EXTRACTION_PROCESSES процессах)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+# Потоки ступени index (эмбеддинги + Qdrant)
+INGESTION_INDEXERS = int(os.getenv("INGESTION_INDEXERS", 1))
+# Сколько извлечённых документов может ждать индексации
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", 4))
+INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", 1.0))
+# Задача, которая дольше этого не обновляла прогресс, считается брошенной
+INGESTION_STALE_AFTER = float(os.getenv("INGESTION_STALE_AFTER", 900))
+# Как часто экстракторы ищут задачи, брошенные упавшими воркерами
+INGESTION_REQUEUE_INTERVAL = float(os.getenv("INGESTION_REQUEUE_INTERVAL", 60))
+
+_REQUEUE_LOCK = threading.Lock()
+_last_requeue = 0.0
+
+def requeue_stale_if_due(now: Optional[float] = None) -> bool:
+    """
+    Возвращает в очередь задачи, чья аренда (INGESTION_STALE_AFTER без обновления прогресса)
+    истекла. Не чаще раза в INGESTION_REQUEUE_INTERVAL на процесс, сколько бы потоков ни звало.
+    """
+    global _last_requeue
+    now = time.monotonic() if now is None else now
+    with _REQUEUE_LOCK:
+        if _last_requeue and now - _last_requeue < INGESTION_REQUEUE_INTERVAL:
+            return False
+        _last_requeue = now
+    try:
+        jobs.requeue_stale(INGESTION_STALE_AFTER)
+    except Exception as e:
+        logger.error(f"Не удалось вернуть в очередь зависшие задачи: {e}")
+    return True
+
+def _progress(job_id: str):
+    return lambda value, stage: jobs.update_progress(job_id, value, stage)
+
+def extract_job(job: dict) -> Optional[str]:
+    """Ступень extract. Возвращает текст или None, если задача уже завершена."""
+    job_id = job["id"]
+    logger.info(f"Задача {job_id}: индексация {job['filename']}")
+    try:
+        content_hash = job.get("content_hash")
+        if content_hash and is_document_unchanged(job["filename"], job["department"], content_hash):
+            logger.info(f"Задача {job_id}: {job['filename']} не изменился, пропускаем")
+            jobs.complete_job(job_id, None, stage="unchanged")
+            jobs.discard_upload(job.get("filepath"))
+            return None
+        return extract_stage(job["filepath"], job["filename"], progress=_progress(job_id))
+    except Exception as e:
+        logger.error(f"Задача {job_id}: ошибка извлечения текста: {e}")
+        jobs.fail_job(job_id, str(e))
+        jobs.discard_upload(job.get("filepath"))
+        return None
+
+def index_job(job: dict, text: str):
+    """Ступень index: чанки, эмбеддинги, запись в Qdrant."""
+    job_id = job["id"]
+    try:
+        jobs.update_progress(job_id, 0.2, "queued_for_index")
+        chunks = index_extracted(
+            text,
+            job["filename"],
+            job["department"],
+            progress=_progress(job_id),
+            content_hash=job.get("content_hash"),
+            size=job.get("size")
+        )
+        jobs.complete_job(job_id, chunks)
+        logger.info(f"Задача {job_id} выполнена: {chunks} чанков")
+    except Exception as e:
+        logger.error(f"Задача {job_id} завершилась ошибкой: {e}")
+        jobs.fail_job(job_id, str(e))
+    # Текст уже извлечён, а failed-задачи не перезапускаются: файл больше не нужен
+    jobs.discard_upload(job.get("filepath"))
+
+def process_job(job: dict):
+    """Обработка задачи целиком в текущем потоке (без конвейера)."""
+    text = extract_job(job)
+    if text is not None:
+        index_job(job, text)
+
+def extract_loop(worker_id: str, stop: threading.Event, extracted: "queue.Queue"):
+    logger.info(f"Экстрактор {worker_id} запущен")
+    while not stop.is_set():
+        requeue_stale_if_due()
+        try:
+            job = jobs.claim_next(worker_id)
+        except Exception as e:
+            logger.error(f"Воркер {worker_id}: ошибка очереди: {e}")
+            stop.wait(INGESTION_POLL_INTERVAL)
+            continue
+        if job is None:
+            stop.wait(INGESTION_POLL_INTERVAL)
+            continue
+        text = extract_job(job)
+        if text is None:
+            continue
+        # put блокируется, пока индексаторы не разгрузят очередь (backpressure)
+        while True:
+            try:
+                extracted.put((job, text), timeout=INGESTION_POLL_INTERVAL)
+                break
+            except queue.Full:
+                if stop.is_set():
+                    # Задача останется running и вернётся в очередь через requeue_stale
+                    logger.warning(f"Задача {job['id']} не проиндексирована из-за остановки воркера")
+                    return
+    logger.info(f"Экстрактор {worker_id} остановлен")
+
+def index_loop(worker_id: str, stop: threading.Event, extracted: "queue.Queue"):
+    logger.info(f"Индексатор {worker_id} запущен")
+    while True:
+        try:
+            job, text = extracted.get(timeout=INGESTION_POLL_INTERVAL)
+        except queue.Empty:
+            if stop.is_set():
+                break
+            continue
+        index_job(job, text)
+    logger.info(f"Индексатор {worker_id} остановлен")
+
+def start_workers(parallelism: int, stop: threading.Event, prefix: Optional[str] = None,
+                  indexers: Optional[int] = None) -> List[threading.Thread]:
+    prefix = prefix or f"{socket.gethostname()}-{os.getpid()}"
+    extracted: "queue.Queue" = queue.Queue(maxsize=max(1, INGESTION_QUEUE_SIZE))
+    threads = []
+    for i in range(parallelism):
+        threads.append(threading.Thread(
+            target=extract_loop,
+            args=(f"{prefix}-{i}", stop, extracted),
+            name=f"znatok-extract-{i}",
+            daemon=True
+        ))
+    for i in range(max(1, indexers or INGESTION_INDEXERS)):
+        threads.append(threading.Thread(
+            target=index_loop,
+            args=(f"{prefix}-index-{i}", stop, extracted),
+            name=f"znatok-index-{i}",
+            daemon=True
+        ))
+    for thread in threads:
+        thread.start()
+    return threads
+
+# Воркеры внутри процесса бэкенда (INGESTION_INPROCESS_WORKERS > 0)
+_INPROCESS_STOP = threading.Event()
+
+def start_inprocess_workers(parallelism: int) -> List[threading.Thread]:
+    _INPROCESS_STOP.clear()
+    return start_workers(parallelism, _INPROCESS_STOP, prefix=f"inprocess-{os.getpid()}")
+
+def stop_inprocess_workers():
+    _INPROCESS_STOP.set()
+    extraction.shutdown()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    stop = threading.Event()
+
+    def _handle_signal(signum, frame):
+        logger.info(f"Получен сигнал {signum}, завершаем текущие задачи...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+
+    logger.info(
+        f"Ingestion worker: extract {INGESTION_WORKERS} потоков / {extraction.EXTRACTION_PROCESSES} процессов, "
+        f"index {INGESTION_INDEXERS} потоков, очередь {jobs.JOBS_DB}"
+    )
+    threads = start_workers(INGESTION_WORKERS, stop)
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1.0)
+    extraction.shutdown()
+    embedding_cache.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# backend/benchmarks/bench_ask.py
+"""
+Нагрузочный тест /api/ask: p50/p99 латентности при 1, 16 и 64 одновременных клиентах.
+
+Параллельно с нагрузкой раз в 100 мс опрашивается /api/health — если event loop
+блокируется эмбеддингом или синхронным Qdrant, это сразу видно по его p99.
+
+Сравнение «до/после»: запустить на старой и новой версии бэкенда с разными --label
+и сравнить сохранённые JSON-отчёты.
+
+    python benchmarks/bench_ask.py --url http://localhost:8000 --label after --out after.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+import httpx
+
+QUESTIONS = [
+    "Как оформить отпуск?",
+    "Политика удалённой работы",
+    "Правила ИТ безопасности",
+    "Какие документы нужны для командировки?",
+    "Как получить доступ к VPN?",
+    "Кто согласует закупку оборудования?",
+]
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+async def _client_loop(client: httpx.AsyncClient, url: str, n: int, offset: int,
+                       latencies: List[float], errors: List[str]):
+    for i in range(n):
+        question = QUESTIONS[(offset + i) % len(QUESTIONS)]
+        started = time.perf_counter()
+        try:
+            resp = await client.post(f"{url}/api/ask", json={"question": question, "user_department": "all"})
+            if resp.status_code != 200:
+                errors.append(str(resp.status_code))
+                continue
+        except Exception as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+async def _health_probe(client: httpx.AsyncClient, url: str, stop: asyncio.Event, latencies: List[float]):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get(f"{url}/api/health")
+            latencies.append((time.perf_counter() - started) * 1000)
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+
+async def run_level(url: str, concurrency: int, requests_per_client: int, timeout: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 1, max_keepalive_connections=concurrency + 1)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        latencies: List[float] = []
+        health: List[float] = []
+        errors: List[str] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_health_probe(client, url, stop, health))
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            _client_loop(client, url, requests_per_client, i, latencies, errors)
+            for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "mean_ms": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        "health_p50_ms": round(percentile(health, 50), 1),
+        "health_p99_ms": round(percentile(health, 99), 1),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /api/ask")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=8, help="запросов на одного клиента")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out", default=None, help="куда сохранить JSON-отчёт")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'clients':>8} {'reqs':>6} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p99 ms':>9} {'health p99':>11}")
+    for concurrency in args.concurrency:
+        r = await run_level(args.url.rstrip("/"), concurrency, args.requests, args.timeout)
+        results.append(r)
+        print(f"{r['concurrency']:>8} {r['requests']:>6} {r['errors']:>5} {r['rps']:>8} "
+              f"{r['p50_ms']:>9} {r['p99_ms']:>9} {r['health_p99_ms']:>11}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"label": args.label, "results": results}, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+# backend/benchmarks/bench_bitrix24_sync.py
+"""
+Синхронизация Базы знаний Битрикс24 на локальном mock-сервере.
+
+Mock отдаёт article.list постранично (start/next, по 50), article.get и batch, и держит
+лимит как настоящий Битрикс24: «дырявое ведро» (--rate запросов/с, запас --burst),
+сверх лимита — HTTP 503 QUERY_LIMIT_EXCEEDED.
+
+Сравниваются:
+  naive — как было: один article.list без пагинации и article.get по одной статье подряд;
+  sync  — app.bitrix24_kb.run_sync: пагинация, batch, токен-бакет, параллельная индексация.
+
+    cd backend && python -m benchmarks.bench_bitrix24_sync --articles 500 --rate 2 --burst 50
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+import httpx
+from aiohttp import web
+
+from app.bitrix24_kb import Bitrix24Client, TokenBucket, run_sync
+
+PAGE_SIZE = 50
+
+def make_mock_app(n_articles: int, rate: float, burst: int) -> web.Application:
+    stats = {"requests": 0, "rejected": 0, "level": 0.0, "updated": time.monotonic()}
+    articles = [{"id": i, "title": f"Статья {i}", "updated": "2026-01-01T00:00:00+00:00"} for i in range(1, n_articles + 1)]
+
+    def admit() -> bool:
+        # Ведро вытекает со скоростью rate, каждый запрос добавляет единицу
+        now = time.monotonic()
+        stats["level"] = max(0.0, stats["level"] - (now - stats["updated"]) * rate)
+        stats["updated"] = now
+        stats["requests"] += 1
+        if stats["level"] + 1 > burst:
+            stats["rejected"] += 1
+            return False
+        stats["level"] += 1
+        return True
+
+    def article_get(article_id: int):
+        if not 1 <= article_id <= n_articles:
+            return None
+        return {"id": article_id, "text": f"Статья {article_id}. Порядок действий номер {article_id}."}
+
+    def article_list(start: int):
+        page = articles[start:start + PAGE_SIZE]
+        data = {"result": {"articles": page}, "total": n_articles}
+        if start + PAGE_SIZE < n_articles:
+            data["next"] = start + PAGE_SIZE
+        return data
+
+    async def handle(request: web.Request):
+        if not admit():
+            return web.json_response(
+                {"error": "QUERY_LIMIT_EXCEEDED", "error_description": "Too many requests"}, status=503
+            )
+        method = request.match_info["method"]
+        body = await request.json()
+        if method == "crm/knowledge-base/article.list":
+            return web.json_response(article_list(int(body.get("start", 0))))
+        if method == "crm/knowledge-base/article.get":
+            return web.json_response({"result": article_get(int(body["id"]))})
+        if method == "batch":
+            results, errors = {}, {}
+            for key, command in body["cmd"].items():
+                name, _, query = command.partition("?")
+                params = {k: v[0] for k, v in parse_qs(query).items()}
+                if name != "crm/knowledge-base/article.get":
+                    errors[key] = {"error": "ERROR_METHOD_NOT_FOUND"}
+                    continue
+                results[key] = article_get(int(params["id"]))
+            return web.json_response({"result": {"result": results, "result_error": errors}})
+        return web.json_response({"error": "ERROR_METHOD_NOT_FOUND"}, status=404)
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/rest/{method:.+}", handle)
+    return app
+
+async def run_naive(base_url: str) -> dict:
+    """Прежний алгоритм: без пагинации, лимитов и batch."""
+    synced = failed = 0
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        resp = await client.post(f"{base_url}/rest/crm/knowledge-base/article.list", json={"auth": "t"})
+        articles = resp.json()["result"]["articles"]
+        for article in articles:
+            detail = await client.post(
+                f"{base_url}/rest/crm/knowledge-base/article.get", json={"auth": "t", "id": article["id"]}
+            )
+            if detail.status_code != 200:
+                failed += 1
+                continue
+            synced += 1
+    return {"synced": synced, "failed": failed}
+
+async def run_new(base_url: str, rate: float, burst: int, index_delay: float) -> dict:
+    async def index_article(source: str, text: str):
+        await asyncio.sleep(index_delay)  # имитация эмбеддингов и записи в Qdrant
+
+    async with httpx.AsyncClient(timeout=30.0) as http:
+        api = Bitrix24Client(base_url, "t", http, TokenBucket(rate, burst))
+        stats = await run_sync(api, None, index_article)
+    return {"synced": stats["synced"], "failed": stats["failed"], "client_rate_limited": api.rate_limited}
+
+async def main_async(args):
+    for mode in ("naive", "sync"):
+        app = make_mock_app(args.articles, args.rate, args.burst)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", args.port)
+        await site.start()
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            started = time.perf_counter()
+            if mode == "naive":
+                result = await run_naive(base_url)
+            else:
+                result = await run_new(base_url, args.rate, args.burst, args.index_delay_ms / 1000)
+            elapsed = time.perf_counter() - started
+        finally:
+            await runner.cleanup()
+        stats = app["stats"]
+        print(
+            f"{mode:<6} статей {result['synced']:>5}/{args.articles} ошибок {result['failed']:>4} "
+            f"запросов {stats['requests']:>5} отклонено лимитом {stats['rejected']:>4} "
+            f"время {elapsed:>6.2f}с"
+        )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=2.0, help="лимит mock-сервера, запросов/с")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--index-delay-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
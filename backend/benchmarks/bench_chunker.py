@@ -0,0 +1,121 @@
+# backend/benchmarks/bench_chunker.py
+"""
+Символьная нарезка (chunk_text_legacy) против нарезки по токенам (TokenChunker).
+
+На корпусе считает:
+  - скорость нарезки (МБ/с) и число чанков;
+  - сколько токенов уходит за окно модели и обрезается при эмбеддинге;
+  - hit@k: для вопросов к фактам из корпуса — есть ли чанк с фактом среди top-k по косинусу.
+
+Корпус — каталог .txt (--corpus) или синтетический: регламенты, где факты спрятаны в середине
+длинных абзацев, а вопросы к ним известны заранее. Нужна модель эмбеддингов (sentence-transformers):
+    cd backend && python -m benchmarks.bench_chunker --docs 40 --k 4
+"""
+import argparse
+import glob
+import os
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from app.chunking import PASSAGE_PREFIX, TokenChunker, chunk_text_legacy, model_token_budget
+from app.registry import get_embedding_model
+
+_FILLER = [
+    "Сотрудник обязан ознакомиться с настоящим регламентом до начала работы",
+    "Положения документа распространяются на все подразделения компании",
+    "Контроль за исполнением возлагается на руководителя структурного подразделения",
+    "Изменения в регламент вносятся приказом генерального директора",
+    "Нарушение требований регламента влечёт дисциплинарную ответственность",
+    "Документ пересматривается не реже одного раза в год",
+]
+_TOPICS = ["склада", "серверной", "архива", "лаборатории", "переговорной", "гаража", "бухгалтерии", "кассы"]
+
+def synthetic_corpus(n_docs: int, seed: int = 7) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Документы и пары (вопрос, факт). Факт стоит в середине длинного абзаца."""
+    rng = random.Random(seed)
+    docs, questions = [], []
+    for d in range(n_docs):
+        paragraphs = []
+        for p in range(6):
+            sentences = [rng.choice(_FILLER) + "." for _ in range(rng.randint(8, 16))]
+            topic = rng.choice(_TOPICS)
+            code = rng.randint(1000, 9999)
+            fact = f"Код доступа в помещение {topic} корпуса {d}-{p} — {code}."
+            sentences.insert(len(sentences) // 2 + rng.randint(0, 3), fact)
+            questions.append((f"Какой код доступа в помещение {topic} корпуса {d}-{p}?", fact))
+            paragraphs.append(" ".join(sentences))
+        docs.append("\n\n".join(paragraphs))
+    return docs, questions
+
+def load_corpus(path: str) -> List[str]:
+    docs = []
+    for name in sorted(glob.glob(os.path.join(path, "**", "*.txt"), recursive=True)):
+        with open(name, encoding="utf-8", errors="replace") as f:
+            docs.append(f.read())
+    return docs
+
+def truncation_stats(tokenizer, chunks: List[str], budget: int) -> Dict[str, float]:
+    lengths = [len(ids) for ids in tokenizer(chunks, add_special_tokens=False)["input_ids"]]
+    lost = sum(max(0, n - budget) for n in lengths)
+    return {
+        "avg_tokens": float(np.mean(lengths)) if lengths else 0.0,
+        "truncated_chunks": sum(1 for n in lengths if n > budget) / max(1, len(lengths)),
+        "lost_tokens": lost / max(1, sum(lengths)),
+    }
+
+def hit_at_k(model, chunks: List[str], questions: List[Tuple[str, str]], k: int) -> float:
+    passages = model.encode([PASSAGE_PREFIX + c for c in chunks], batch_size=64, normalize_embeddings=True)
+    queries = model.encode([f"query: {q}" for q, _ in questions], batch_size=64, normalize_embeddings=True)
+    top = np.argsort(-queries @ passages.T, axis=1)[:, :k]
+    hits = sum(
+        1 for (_, fact), row in zip(questions, top)
+        if any(fact in chunks[i] for i in row)
+    )
+    return hits / max(1, len(questions))
+
+def run(name: str, splitter: Callable[[str], List[str]], docs: List[str], tokenizer, budget: int,
+        model, questions, k: int):
+    started = time.perf_counter()
+    chunks = [chunk for doc in docs for chunk in splitter(doc)]
+    elapsed = time.perf_counter() - started
+    megabytes = sum(len(doc.encode("utf-8")) for doc in docs) / 1e6
+    stats = truncation_stats(tokenizer, chunks, budget)
+    line = (
+        f"{name:<8} {len(chunks):>7} {megabytes / elapsed:>8.1f} {stats['avg_tokens']:>8.1f} "
+        f"{stats['truncated_chunks'] * 100:>9.1f}% {stats['lost_tokens'] * 100:>8.1f}%"
+    )
+    if questions:
+        line += f" {hit_at_k(model, chunks, questions, k) * 100:>7.1f}%"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None, help="каталог с .txt; без него — синтетический корпус")
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--overlap", type=int, default=32)
+    args = parser.parse_args()
+
+    model = get_embedding_model()
+    tokenizer = model.tokenizer
+    budget = model_token_budget(model)
+
+    if args.corpus:
+        docs, questions = load_corpus(args.corpus), []
+    else:
+        docs, questions = synthetic_corpus(args.docs)
+    print(f"Документов: {len(docs)}, вопросов: {len(questions)}, окно модели: {budget} токенов текста")
+
+    header = f"{'splitter':<8} {'chunks':>7} {'MB/s':>8} {'avg_tok':>8} {'truncated':>10} {'lost_tok':>9}"
+    if questions:
+        header += f" {'hit@' + str(args.k):>8}"
+    print(header)
+    run("legacy", chunk_text_legacy, docs, tokenizer, budget, model, questions, args.k)
+    chunker = TokenChunker(tokenizer, budget, args.overlap)
+    run("tokens", chunker.split, docs, tokenizer, budget, model, questions, args.k)
+
+if __name__ == "__main__":
+    main()
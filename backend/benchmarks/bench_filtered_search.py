@@ -0,0 +1,198 @@
+# backend/benchmarks/bench_filtered_search.py
+"""
+Латентность поиска с фильтром по отделу и удаления по source на больших коллекциях.
+
+Сравнивает конфигурации коллекции:
+  baseline — как раньше: только VectorParams(384, COSINE), без индексов payload;
+  indexed  — app.qdrant_config.create_collection: keyword-индексы source/department/content_hash,
+             HNSW и оптимизатор из окружения;
+  int8     — то же плюс скалярная int8-квантизация (оригиналы на диске, rescore).
+
+Отделы распределены неравномерно (Zipf): у «узкого» отдела доли процента точек,
+у «широкого» — десятки процентов; с фильтром по узкому отделу без индекса payload
+Qdrant обходит граф HNSW, отбрасывая почти все кандидаты. Для int8 печатается ещё
+recall@k относительно точного поиска (exact=True) по тем же запросам.
+
+Нужен Qdrant-сервер (docker compose up qdrant); встроенный режим (--location :memory:)
+индексы payload и квантизацию игнорирует и годится только для проверки скрипта:
+    cd backend && python -m benchmarks.bench_filtered_search --points 100000,1000000
+    cd backend && python -m benchmarks.bench_filtered_search --points 100000 --configs baseline,indexed
+"""
+import argparse
+import time
+import uuid
+from typing import Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Distance, FieldCondition, Filter, FilterSelector, MatchValue, PointStruct,
+    QuantizationSearchParams, SearchParams, VectorParams
+)
+
+from app import qdrant_config
+
+CONFIGS = ("baseline", "indexed", "int8")
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))]
+
+def department_weights(n_departments: int) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n_departments + 1)
+    return weights / weights.sum()
+
+def recreate(client: QdrantClient, name: str, config: str):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    if config == "baseline":
+        client.create_collection(name, vectors_config=VectorParams(size=qdrant_config.VECTOR_SIZE, distance=Distance.COSINE))
+    else:
+        qdrant_config.create_collection(client, name, quantization="int8" if config == "int8" else "none")
+
+def load(client: QdrantClient, name: str, n_points: int, n_departments: int, doc_size: int,
+         batch_size: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    weights = department_weights(n_departments)
+    for start in range(0, n_points, batch_size):
+        count = min(batch_size, n_points - start)
+        vectors = rng.standard_normal((count, qdrant_config.VECTOR_SIZE), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        departments = rng.choice(n_departments, size=count, p=weights)
+        client.upsert(
+            collection_name=name,
+            points=[
+                PointStruct(
+                    id=str(uuid.UUID(int=start + i + 1)),
+                    vector=vectors[i].tolist(),
+                    payload={
+                        "text": f"chunk {start + i}",
+                        "source": f"doc-{(start + i) // doc_size}",
+                        "department": f"dept-{departments[i]}",
+                    }
+                )
+                for i in range(count)
+            ],
+            wait=False
+        )
+
+def wait_green(client: QdrantClient, name: str, timeout: float) -> float:
+    """Ждёт, пока оптимизатор достроит индексы; возвращает секунды ожидания."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        info = client.get_collection(name)
+        if str(getattr(info.status, "value", info.status)) == "green":
+            break
+        time.sleep(1)
+    return time.perf_counter() - started
+
+def timed_search(client: QdrantClient, name: str, queries: np.ndarray, department: str, k: int,
+                 params) -> List[float]:
+    query_filter = Filter(must=[FieldCondition(key="department", match=MatchValue(value=department))]) \
+        if department else None
+    latencies = []
+    for vector in queries:
+        started = time.perf_counter()
+        client.search(collection_name=name, query_vector=vector.tolist(), query_filter=query_filter,
+                      search_params=params, limit=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+def recall_vs_exact(client: QdrantClient, name: str, queries: np.ndarray, department: str, k: int,
+                    params) -> float:
+    query_filter = Filter(must=[FieldCondition(key="department", match=MatchValue(value=department))])
+    found = total = 0
+    for vector in queries:
+        exact = client.search(collection_name=name, query_vector=vector.tolist(), query_filter=query_filter,
+                              search_params=SearchParams(exact=True), limit=k)
+        approx = client.search(collection_name=name, query_vector=vector.tolist(), query_filter=query_filter,
+                               search_params=params, limit=k)
+        truth = {hit.id for hit in exact}
+        found += len(truth & {hit.id for hit in approx})
+        total += len(truth)
+    return found / max(1, total)
+
+def timed_deletes(client: QdrantClient, name: str, sources: List[str]) -> List[float]:
+    latencies = []
+    for source in sources:
+        started = time.perf_counter()
+        client.delete(
+            collection_name=name,
+            points_selector=FilterSelector(filter=Filter(must=[FieldCondition(key="source", match=MatchValue(value=source))])),
+            wait=True
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+def run(client: QdrantClient, args, n_points: int, config: str) -> Dict[str, float]:
+    name = f"{args.collection}_{config}"
+    recreate(client, name, config)
+    started = time.perf_counter()
+    load(client, name, n_points, args.departments, args.doc_size, args.batch_size)
+    loaded = time.perf_counter() - started
+    indexed = wait_green(client, name, args.index_timeout)
+
+    rng = np.random.default_rng(99)
+    queries = rng.standard_normal((args.queries, qdrant_config.VECTOR_SIZE), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    params = SearchParams(quantization=QuantizationSearchParams(
+        rescore=True, oversampling=qdrant_config.QDRANT_SEARCH_OVERSAMPLING
+    )) if config == "int8" else None
+
+    narrow, wide = f"dept-{args.departments - 1}", "dept-0"
+    n_sources = max(1, n_points // args.doc_size)
+    sources = [f"doc-{i}" for i in range(0, n_sources, max(1, n_sources // 20))]
+    timed_search(client, name, queries[:10], wide, args.k, params)  # прогрев
+    result = {
+        "load_s": loaded,
+        "index_s": indexed,
+        "none": timed_search(client, name, queries, "", args.k, params),
+        "wide": timed_search(client, name, queries, wide, args.k, params),
+        "narrow": timed_search(client, name, queries, narrow, args.k, params),
+        "delete": timed_deletes(client, name, sources),
+        "recall": recall_vs_exact(client, name, queries[:50], wide, args.k, params) if config == "int8" else 1.0,
+    }
+    if not args.keep:
+        client.delete_collection(name)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--location", default=None, help=":memory: — встроенный режим без сервера (цифры не показательны)")
+    parser.add_argument("--collection", default="znatok_bench_filtered")
+    parser.add_argument("--points", default="100000,1000000")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--departments", type=int, default=200)
+    parser.add_argument("--doc-size", type=int, default=40, help="точек на документ (source)")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--index-timeout", type=float, default=3600, help="сколько ждать построения индексов, с")
+    parser.add_argument("--keep", action="store_true", help="не удалять коллекции после прогона")
+    args = parser.parse_args()
+
+    if args.location:
+        client = QdrantClient(location=args.location)
+    else:
+        client = QdrantClient(host=args.host, port=args.port, timeout=300)
+    weights = department_weights(args.departments)
+    print(f"Доля точек: широкий отдел {weights[0] * 100:.1f}%, узкий {weights[-1] * 100:.2f}%")
+    print(f"{'points':>8} {'config':<9} {'load, с':>8} {'index, с':>9} "
+          f"{'none p50':>9} {'wide p50':>9} {'wide p95':>9} {'narrow p50':>11} {'narrow p95':>11} "
+          f"{'delete p50':>11} {'recall':>7}")
+    for n_points in [int(n) for n in args.points.split(",") if n]:
+        for config in [c for c in args.configs.split(",") if c]:
+            r = run(client, args, n_points, config)
+            print(
+                f"{n_points:>8} {config:<9} {r['load_s']:>8.1f} {r['index_s']:>9.1f} "
+                f"{percentile(r['none'], 50):>9.2f} {percentile(r['wide'], 50):>9.2f} {percentile(r['wide'], 95):>9.2f} "
+                f"{percentile(r['narrow'], 50):>11.2f} {percentile(r['narrow'], 95):>11.2f} "
+                f"{percentile(r['delete'], 50):>11.2f} {r['recall'] * 100:>6.1f}%"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# backend/benchmarks/bench_llm_provider.py
+"""
+Сколько стоит «новый клиент + OAuth на каждый вопрос» против долгоживущего провайдера.
+
+Поднимает локальный mock GigaChat (OAuth + chat/completions) и гоняет запросы двумя способами:
+  fresh  — как раньше: новый экземпляр провайдера (новое соединение и токен) на каждый запрос;
+  pooled — один экземпляр на всё время: keep-alive соединения и закэшированный токен.
+
+    cd backend && python -m benchmarks.bench_llm_provider --requests 200 --auth-delay-ms 80
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from aiohttp import web
+
+from app.models import ProviderConfig, ProviderType
+from app.rag import GigaChatProvider
+
+def make_mock_app(auth_delay: float, completion_delay: float) -> web.Application:
+    stats = {"auth_calls": 0}
+
+    async def oauth(request: web.Request):
+        stats["auth_calls"] += 1
+        await asyncio.sleep(auth_delay)
+        return web.json_response({
+            "access_token": "mock-token",
+            "expires_at": int((time.time() + 1800) * 1000)
+        })
+
+    async def completions(request: web.Request):
+        await asyncio.sleep(completion_delay)
+        return web.json_response({"choices": [{"message": {"content": "ok"}}]})
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/api/v2/oauth", oauth)
+    app.router.add_post("/api/v1/chat/completions", completions)
+    return app
+
+def make_provider_class(base_url: str):
+    class MockGigaChatProvider(GigaChatProvider):
+        AUTH_URL = f"{base_url}/api/v2/oauth"
+        API_URL = f"{base_url}/api/v1/chat/completions"
+    return MockGigaChatProvider
+
+async def _timed(coro) -> float:
+    started = time.perf_counter()
+    await coro
+    return (time.perf_counter() - started) * 1000
+
+async def run_fresh(provider_cls, config, n: int, concurrency: int) -> List[float]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            provider = provider_cls(config)
+            try:
+                return await _timed(provider.generate_response("вопрос"))
+            finally:
+                await provider.aclose()
+
+    return await asyncio.gather(*[one() for _ in range(n)])
+
+async def run_pooled(provider_cls, config, n: int, concurrency: int) -> List[float]:
+    sem = asyncio.Semaphore(concurrency)
+    provider = provider_cls(config)
+
+    async def one():
+        async with sem:
+            return await _timed(provider.generate_response("вопрос"))
+
+    try:
+        return await asyncio.gather(*[one() for _ in range(n)])
+    finally:
+        await provider.aclose()
+
+def _report(name: str, latencies: List[float], auth_calls: int):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * (len(ordered) - 1)))]
+    print(f"{name:>7}: mean {statistics.mean(ordered):7.2f} ms  p50 {statistics.median(ordered):7.2f} ms  "
+          f"p99 {p99:7.2f} ms  oauth calls {auth_calls}")
+    return statistics.mean(ordered)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пула соединений и кэша токена LLM-провайдера")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--auth-delay-ms", type=float, default=80.0, help="имитация задержки OAuth")
+    parser.add_argument("--completion-delay-ms", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=18443)
+    args = parser.parse_args()
+
+    app = make_mock_app(args.auth_delay_ms / 1000, args.completion_delay_ms / 1000)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    provider_cls = make_provider_class(f"http://127.0.0.1:{args.port}")
+    config = ProviderConfig(provider=ProviderType.GIGACHAT, api_key="mock")
+    try:
+        fresh = await run_fresh(provider_cls, config, args.requests, args.concurrency)
+        fresh_auth = app["stats"]["auth_calls"]
+        app["stats"]["auth_calls"] = 0
+        pooled = await run_pooled(provider_cls, config, args.requests, args.concurrency)
+        pooled_auth = app["stats"]["auth_calls"]
+    finally:
+        await runner.cleanup()
+
+    fresh_mean = _report("fresh", fresh, fresh_auth)
+    pooled_mean = _report("pooled", pooled, pooled_auth)
+    print(f"Экономия на запрос: {fresh_mean - pooled_mean:.2f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+# backend/benchmarks/bench_upsert.py
+"""
+Пропускная способность записи в Qdrant (точек/с) в зависимости от размера пачки.
+
+Сравнивает:
+  single — как раньше: один upsert на весь документ с wait=True;
+  writer — UpsertWriter: пачки по --batch-sizes, wait=False, до --inflight пачек одновременно.
+
+Нужен локальный Qdrant (docker compose up qdrant):
+    cd backend && python -m benchmarks.bench_upsert --points 20000 --batch-sizes 64,256,1024
+Без сервера можно прогнать на встроенном режиме (цифры не показательны):
+    cd backend && python -m benchmarks.bench_upsert --location :memory: --points 2000 --inflight 1
+(встроенный режим не потокобезопасен, поэтому только --inflight 1)
+"""
+import argparse
+import time
+import uuid
+from typing import List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from app.upsert_writer import UpsertWriter
+
+def make_points(n: int, dim: int) -> List[PointStruct]:
+    rng = np.random.default_rng(42)
+    vectors = rng.random((n, dim), dtype=np.float32)
+    return [
+        PointStruct(
+            id=str(uuid.uuid4()),
+            vector=vectors[i].tolist(),
+            payload={"text": f"chunk {i}", "source": f"doc-{i // 50}", "department": "all"}
+        )
+        for i in range(n)
+    ]
+
+def recreate(client: QdrantClient, name: str, dim: int):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(name, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+
+def run_single(client: QdrantClient, name: str, points: List[PointStruct]) -> float:
+    started = time.perf_counter()
+    client.upsert(collection_name=name, points=points, wait=True)
+    return time.perf_counter() - started
+
+def run_writer(client: QdrantClient, name: str, points: List[PointStruct],
+               batch_size: int, inflight: int, doc_size: int) -> float:
+    started = time.perf_counter()
+    writer = UpsertWriter(client, name, batch_size=batch_size, max_inflight=inflight, wait=False)
+    # Точки приходят порциями размером с документ, как из _sync_chunks
+    for start in range(0, len(points), doc_size):
+        writer.add(points[start:start + doc_size])
+    writer.flush()
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--location", default=None, help=":memory: — встроенный режим без сервера")
+    parser.add_argument("--collection", default="znatok_bench_upsert")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--doc-size", type=int, default=40, help="точек на документ")
+    parser.add_argument("--batch-sizes", default="32,64,128,256,512,1024")
+    parser.add_argument("--inflight", default="1,4")
+    args = parser.parse_args()
+
+    if args.location:
+        client = QdrantClient(location=args.location)
+    else:
+        client = QdrantClient(host=args.host, port=args.port)
+    points = make_points(args.points, args.dim)
+
+    print(f"{'mode':<8} {'batch':>6} {'inflight':>8} {'seconds':>9} {'points/s':>10}")
+    recreate(client, args.collection, args.dim)
+    elapsed = run_single(client, args.collection, points)
+    print(f"{'single':<8} {args.points:>6} {1:>8} {elapsed:>9.2f} {args.points / elapsed:>10.0f}")
+
+    for inflight in [int(x) for x in args.inflight.split(",")]:
+        for batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+            recreate(client, args.collection, args.dim)
+            elapsed = run_writer(client, args.collection, points, batch_size, inflight, args.doc_size)
+            count = client.count(args.collection, exact=True).count
+            assert count == args.points, f"записано {count} из {args.points}"
+            print(f"{'writer':<8} {batch_size:>6} {inflight:>8} {elapsed:>9.2f} {args.points / elapsed:>10.0f}")
+
+    client.delete_collection(args.collection)
+
+if __name__ == "__main__":
+    main()
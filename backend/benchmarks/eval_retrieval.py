@@ -0,0 +1,192 @@
+# backend/benchmarks/eval_retrieval.py
+"""
+Качество и скорость поиска: recall@k и латентность для режимов dense, sparse и hybrid,
+а с --rerank-candidates — ещё и с переранжированием cross-encoder (сколько recall
+даёт переранжирование и сколько миллисекунд оно добавляет к тому же режиму без него).
+
+Корпус индексируется обычным путём (app.ingestion.index_text) в отдельную коллекцию
+и отдельный лексический индекс, затем каждый вопрос прогоняется через
+app.retrieval.search_by_vector в каждом режиме. Попадание — в top-k есть чанк,
+содержащий ожидаемый фрагмент.
+
+Набор вопросов — JSONL (--dataset) со строками {"question": ..., "expected": ..., "kind": ...}
+и каталог .txt (--corpus), либо синтетический корпус: регламенты, где факты различаются
+только номерами форм и приказов (kind=identifier), плюс вопросы своими словами (kind=semantic).
+
+Нужны модель эмбеддингов и Qdrant (docker compose up qdrant):
+    cd backend && QDRANT_HOST=localhost python -m benchmarks.eval_retrieval --docs 30 --k 4
+    cd backend && QDRANT_HOST=localhost python -m benchmarks.eval_retrieval --rerank-candidates 10,20,40
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+EVAL_COLLECTION = "znatok_eval_retrieval"
+os.environ["QDRANT_COLLECTION"] = EVAL_COLLECTION
+os.environ.setdefault("LEXICAL_INDEX_DB", os.path.join(tempfile.mkdtemp(prefix="znatok_eval_"), "lexical.db"))
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+from app import lexical, retrieval, reranker  # noqa: E402
+from app.ingestion import index_text  # noqa: E402
+from app.registry import get_qdrant_client, forget_collection  # noqa: E402
+
+MODES = ("dense", "sparse", "hybrid")
+
+_TOPICS = [
+    ("отпуск", "заявление на ежегодный оплачиваемый отпуск"),
+    ("командировк", "авансовый отчёт по командировке"),
+    ("закупк", "заявку на закупку оборудования"),
+    ("доступ", "запрос доступа к информационным системам"),
+    ("увольнени", "обходной лист при увольнении"),
+    ("пропуск", "заявку на временный пропуск посетителя"),
+]
+_FILLER = [
+    "Документ согласуется с непосредственным руководителем",
+    "Срок рассмотрения составляет три рабочих дня",
+    "Копия передаётся в отдел кадров",
+    "Оригинал хранится в архиве подразделения",
+]
+
+def synthetic_corpus(n_docs: int, seed: int = 11) -> Tuple[Dict[str, str], List[Dict]]:
+    rng = random.Random(seed)
+    docs, questions = {}, []
+    for d in range(n_docs):
+        sentences = []
+        for p in range(4):
+            _, what = rng.choice(_TOPICS)
+            form = f"Ф-{rng.randint(100, 999)}/{d}{p}"
+            order = f"{rng.randint(10, 99)}-ОД"
+            fact = f"Форма {form} используется, чтобы оформить {what}, основание — приказ № {order}."
+            sentences.extend(rng.choice(_FILLER) + "." for _ in range(3))
+            sentences.append(fact)
+            questions.append({"question": f"Для чего нужна форма {form}?", "expected": fact, "kind": "identifier"})
+            questions.append({"question": f"Какой приказ действует для формы {form}?", "expected": fact, "kind": "identifier"})
+        docs[f"eval://regulation-{d}"] = " ".join(sentences)
+    docs["eval://vacation"] = (
+        "Ежегодный отпуск оформляется не позднее чем за две недели до начала. "
+        "Сотрудник подаёт заявление через портал, руководитель согласует даты."
+    )
+    questions.append({
+        "question": "Как заранее нужно просить о времени отдыха?",
+        "expected": "за две недели до начала", "kind": "semantic"
+    })
+    docs["eval://remote"] = (
+        "Удалённая работа разрешается по согласованию с руководителем подразделения. "
+        "Сотрудник обязан быть на связи в рабочие часы и использовать корпоративный VPN."
+    )
+    questions.append({
+        "question": "Можно ли трудиться из дома?",
+        "expected": "Удалённая работа разрешается", "kind": "semantic"
+    })
+    return docs, questions
+
+def load_dataset(corpus: str, dataset: str) -> Tuple[Dict[str, str], List[Dict]]:
+    docs = {}
+    for name in sorted(glob.glob(os.path.join(corpus, "**", "*.txt"), recursive=True)):
+        with open(name, encoding="utf-8", errors="replace") as f:
+            docs[os.path.relpath(name, corpus)] = f.read()
+    with open(dataset, encoding="utf-8") as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+    return docs, questions
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))]
+
+def build_index(docs: Dict[str, str]):
+    client = get_qdrant_client()
+    if client.collection_exists(EVAL_COLLECTION):
+        client.delete_collection(EVAL_COLLECTION)
+    forget_collection(EVAL_COLLECTION)
+    lexical.clear()
+    started = time.perf_counter()
+    for source, text in docs.items():
+        index_text(text, source)
+    print(f"Проиндексировано документов: {len(docs)} за {time.perf_counter() - started:.1f}с")
+
+async def evaluate(questions: List[Dict], k: int, configs: List[Tuple[str, int]],
+                   budget_ms: float) -> Dict[str, Dict]:
+    """configs: (режим, кандидатов для переранжирования; 0 — без него)."""
+    vectors = [await retrieval.encode_query(q["question"]) for q in questions]
+    if any(candidates for _, candidates in configs):
+        await asyncio.to_thread(reranker.warmup)
+    report = {}
+    for mode, candidates in configs:
+        hits_by_kind, total_by_kind = defaultdict(int), defaultdict(int)
+        latencies = []
+        for q, vector in zip(questions, vectors):
+            started = time.perf_counter()
+            if candidates:
+                first = await retrieval.search_by_vector(
+                    vector, q.get("department"), question=q["question"], mode=mode, limit=candidates, rerank=False
+                )
+                hits = await reranker.rerank(q["question"], first, k, budget_ms=budget_ms)
+            else:
+                hits = await retrieval.search_by_vector(
+                    vector, q.get("department"), question=q["question"], mode=mode, limit=k, rerank=False
+                )
+            latencies.append((time.perf_counter() - started) * 1000)
+            kind = q.get("kind", "all")
+            total_by_kind[kind] += 1
+            if any(q["expected"] in hit["text"] for hit in hits):
+                hits_by_kind[kind] += 1
+        label = f"{mode}+rerank@{candidates}" if candidates else mode
+        report[label] = {
+            "mode": mode,
+            "recall": sum(hits_by_kind.values()) / max(1, len(questions)),
+            "by_kind": {kind: hits_by_kind[kind] / total for kind, total in total_by_kind.items()},
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None, help="каталог с .txt (вместе с --dataset)")
+    parser.add_argument("--dataset", default=None, help="JSONL: question, expected, kind, department")
+    parser.add_argument("--docs", type=int, default=30)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--rerank-candidates", default="", help="например 10,20,40; пусто — без переранжирования")
+    parser.add_argument("--rerank-budget-ms", type=float, default=0, help="0 — без бюджета (честное время модели)")
+    parser.add_argument("--keep", action="store_true", help="не удалять коллекцию после прогона")
+    args = parser.parse_args()
+
+    if args.dataset:
+        docs, questions = load_dataset(args.corpus or ".", args.dataset)
+    else:
+        docs, questions = synthetic_corpus(args.docs)
+    build_index(docs)
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    rerank_candidates = [int(n) for n in args.rerank_candidates.split(",") if n]
+    configs = [(mode, 0) for mode in modes] + [(mode, n) for mode in modes for n in rerank_candidates]
+    report = asyncio.run(evaluate(questions, args.k, configs, args.rerank_budget_ms))
+
+    kinds = sorted({kind for row in report.values() for kind in row["by_kind"]})
+    print(f"Вопросов: {len(questions)}, k={args.k}")
+    print(f"{'config':<20} {'recall@' + str(args.k):>9} " + " ".join(f"{kind:>11}" for kind in kinds)
+          + f" {'p50, мс':>9} {'p95, мс':>9} {'+p50, мс':>9}")
+    for label, row in report.items():
+        added = row["p50_ms"] - report[row["mode"]]["p50_ms"] if row["mode"] in report else 0.0
+        print(
+            f"{label:<20} {row['recall'] * 100:>8.1f}% "
+            + " ".join(f"{row['by_kind'].get(kind, 0) * 100:>10.1f}%" for kind in kinds)
+            + f" {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {added:>9.1f}"
+        )
+
+    if not args.keep:
+        get_qdrant_client().delete_collection(EVAL_COLLECTION)
+        forget_collection(EVAL_COLLECTION)
+
+if __name__ == "__main__":
+    main()
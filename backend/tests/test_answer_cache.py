@@ -0,0 +1,44 @@
+# backend/tests/test_answer_cache.py
+import numpy as np
+
+from app.answer_cache import InvalidationLog, SemanticAnswerCache
+
+VECTOR = np.ones(4)
+
+def _cache(log=None):
+    return SemanticAnswerCache(10, 3600, 0.9, log=log, sync_seconds=3600)
+
+def test_hit_requires_same_department_and_chunks():
+    cache = _cache()
+    cache.store(VECTOR, "hr", ["a", "b"], "ответ", [{"source": "doc"}])
+    assert cache.lookup(VECTOR, "hr", ["b", "a"])["answer"] == "ответ"
+    assert cache.lookup(VECTOR, "it", ["a", "b"]) is None
+    assert cache.lookup(VECTOR, "hr", ["a"]) is None
+
+def test_invalidate_source_drops_citing_answers():
+    cache = _cache()
+    cache.store(VECTOR, None, ["a"], "ответ", [{"source": "doc"}])
+    cache.invalidate_source("doc")
+    assert cache.lookup(VECTOR, None, ["a"]) is None
+
+def test_invalidation_from_other_process(tmp_path):
+    path = str(tmp_path / "answer_cache.db")
+    backend = _cache(InvalidationLog(path, 3600, origin="backend"))
+    worker = _cache(InvalidationLog(path, 3600, origin="worker"))
+    assert backend.sync()
+    backend.store(VECTOR, None, ["a"], "ответ", [{"source": "doc"}])
+    assert backend.lookup(VECTOR, None, ["a"]) is not None
+
+    worker.invalidate_source("doc")
+    assert worker.sync()
+    assert backend.sync()
+    assert backend.lookup(VECTOR, None, ["a"]) is None
+
+def test_unreadable_log_disables_cache(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    cache = _cache(InvalidationLog(str(blocker / "answer_cache.db"), 3600))
+    assert not cache.sync()
+    cache.store(VECTOR, None, ["a"], "ответ", [{"source": "doc"}])
+    # Журнал ни разу не прочитан — ответам не верим
+    assert cache.lookup(VECTOR, None, ["a"]) is None
@@ -0,0 +1,37 @@
+# backend/tests/test_bitrix24_sync.py
+import asyncio
+
+from app import bitrix24_kb
+
+class FakeApi:
+    def __init__(self, articles, texts, errors):
+        self.articles = articles
+        self.texts = texts
+        self.errors = errors
+
+    async def call(self, method, params=None):
+        assert method == bitrix24_kb.LIST_METHOD
+        return {"result": {"articles": self.articles}}
+
+    async def batch(self, commands):
+        results = {key: {"text": self.texts[key]} for key in commands if key in self.texts}
+        errors = {key: "ACCESS_DENIED" for key in commands if key in self.errors}
+        return results, errors
+
+def test_batch_errors_are_counted_as_failed(monkeypatch):
+    monkeypatch.setattr(bitrix24_kb, "BITRIX24_USE_BATCH", True)
+    api = FakeApi(
+        articles=[{"id": 1}, {"id": 2}, {"id": 3}],
+        texts={"1": "первая статья", "3": ""},
+        errors={"2"},
+    )
+    indexed = []
+
+    async def index_article(source, text):
+        indexed.append(source)
+
+    stats = asyncio.run(bitrix24_kb.run_sync(api, None, index_article))
+    assert indexed == ["bitrix24_kb:1"]
+    assert stats["synced"] == 1
+    assert stats["failed"] == 1
+    assert stats["skipped"] == 1
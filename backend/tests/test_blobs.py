@@ -0,0 +1,48 @@
+# backend/tests/test_blobs.py
+import pytest
+
+from app import blobs
+
+TEXT = "Привет, мир! Hello 🙂 ёж".encode("utf-8")
+
+def _decodes(data: bytes, start: int, end: int) -> bool:
+    try:
+        data[start:end].decode("utf-8")
+        return True
+    except UnicodeDecodeError:
+        return False
+
+@pytest.mark.parametrize("offset", range(len(TEXT) + 2))
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 8])
+def test_utf8_range_never_splits_characters(offset, limit):
+    start, end = blobs.utf8_range(TEXT, offset, limit)
+    assert 0 <= start <= end <= len(TEXT)
+    assert _decodes(TEXT, start, end)
+
+def test_utf8_range_backs_off_to_character_start():
+    # "П" — два байта: смещение 1 попадает в середину символа
+    assert blobs.utf8_range(TEXT, 1, 10)[0] == 0
+
+def test_utf8_range_returns_whole_character_for_tiny_limit():
+    emoji = TEXT.index("🙂".encode("utf-8"))
+    assert blobs.utf8_range(TEXT, emoji, 1) == (emoji, emoji + 4)
+
+def test_utf8_range_pages_tile_the_text():
+    pages, offset = [], 0
+    while offset < len(TEXT):
+        start, end = blobs.utf8_range(TEXT, offset, 7)
+        pages.append(TEXT[start:end])
+        offset = end
+    assert b"".join(pages) == TEXT
+
+def test_utf8_range_past_end_is_empty():
+    assert blobs.utf8_range(TEXT, len(TEXT) + 10, 5) == (len(TEXT), len(TEXT))
+
+def test_put_get_roundtrip_is_content_addressed(tmp_path, monkeypatch):
+    monkeypatch.setattr(blobs, "DOCUMENT_BLOB_DIR", str(tmp_path))
+    blobs._load.cache_clear()
+    digest = blobs.put_text("текст")
+    assert blobs.put_text("текст") == digest
+    assert blobs.get(digest) == "текст".encode("utf-8")
+    blobs.delete(digest)
+    assert blobs.get(digest) is None
@@ -0,0 +1,65 @@
+# backend/tests/test_chunking.py
+import re
+
+import pytest
+
+from app.chunking import TokenChunker, chunk_text_legacy, chunk_text_legacy_spans
+from app.ingestion import byte_spans
+
+TEXT = (
+    "  Первое предложение.  Второе предложение!\n\nТретье? "
+    + "Очень длинное предложение без точки " * 12
+    + ". Последнее."
+)
+
+class WhitespaceTokenizer:
+    """Токен — непробельная последовательность; offset_mapping как у быстрых токенизаторов."""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=True):
+        return {"offset_mapping": [[m.span() for m in re.finditer(r"\S+", t)] for t in texts]}
+
+@pytest.mark.parametrize("max_length", [20, 80, 200, 1024])
+def test_legacy_chunk_equals_its_span(max_length):
+    for chunk, (start, end) in chunk_text_legacy_spans(TEXT, max_length):
+        assert chunk == TEXT[start:end]
+        assert chunk == chunk.strip()
+
+def test_legacy_spans_are_ordered_and_disjoint():
+    spans = [span for _, span in chunk_text_legacy_spans(TEXT, 80)]
+    assert all(a[1] <= b[0] for a, b in zip(spans, spans[1:]))
+
+def test_legacy_keeps_all_sentences():
+    chunks = chunk_text_legacy(TEXT, 80)
+    assert " ".join(chunks).split() == TEXT.split()
+
+def test_legacy_empty_text():
+    assert chunk_text_legacy_spans("  \n ") == []
+
+def test_token_chunker_spans_match_text_and_budget():
+    chunker = TokenChunker(WhitespaceTokenizer(), max_tokens=8)
+    spans = chunker.split_spans(TEXT)
+    assert spans
+    for start, end in spans:
+        assert len(TEXT[start:end].split()) <= 8
+    covered = " ".join(TEXT[start:end] for start, end in spans).split()
+    assert covered == TEXT.split()
+
+def test_byte_spans_match_utf8_slices():
+    pieces = chunk_text_legacy_spans(TEXT, 80)
+    data = TEXT.encode("utf-8")
+    for (chunk, _), (start, end) in zip(pieces, byte_spans(TEXT, [span for _, span in pieces])):
+        assert data[start:end].decode("utf-8") == chunk
+
+def test_document_with_repeated_chunk_is_reassembled():
+    from app.ingestion import _assemble_payloads
+    text = "Раздел один. Подпись. Раздел два. Подпись."
+    pieces = chunk_text_legacy_spans(text, 14)
+    spans = byte_spans(text, [span for _, span in pieces])
+    payloads = {}
+    for ordinal, ((chunk, _), (start, end)) in enumerate(zip(pieces, spans)):
+        if chunk in payloads:
+            payloads[chunk].setdefault("byte_repeats", []).append([start, end])
+        else:
+            payloads[chunk] = {"text": chunk, "chunk_index": ordinal, "byte_start": start, "byte_end": end}
+    assert len(payloads) < len(pieces)
+    assert _assemble_payloads(list(payloads.values())).decode("utf-8") == text
@@ -0,0 +1,97 @@
+# backend/tests/test_context_store.py
+import pytest
+
+from app import context_store
+from app.context_store import MemoryContextStore, SQLiteContextStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(context_store, "time", fake)
+    return fake
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(ttl_seconds=60, max_messages=2, max_conversations=100, max_bytes=10_000):
+        params = dict(ttl_seconds=ttl_seconds, max_messages=max_messages,
+                      max_conversations=max_conversations, max_bytes=max_bytes)
+        if request.param == "sqlite":
+            return SQLiteContextStore(str(tmp_path / "contexts.db"), **params)
+        return MemoryContextStore(**params)
+    return make
+
+def test_history_keeps_last_messages(make_store, clock):
+    store = make_store(max_messages=2)
+    store.remember("c", "вопрос 1", "ответ 1")
+    store.remember("c", "вопрос 2", "ответ 2")
+    assert [m["content"] for m in store.history("c")] == ["вопрос 2", "ответ 2"]
+
+def test_conversation_expires_after_ttl(make_store, clock):
+    store = make_store(ttl_seconds=60)
+    store.remember("c", "q", "a")
+    clock.now += 59
+    assert store.history("c")
+    clock.now += 2
+    assert store.history("c") == []
+
+def test_new_message_extends_ttl(make_store, clock):
+    store = make_store(ttl_seconds=60)
+    store.remember("c", "q1", "a1")
+    clock.now += 50
+    store.remember("c", "q2", "a2")
+    clock.now += 50
+    assert store.history("c")
+
+def test_evicts_least_recent_over_conversation_limit(make_store, clock):
+    store = make_store(max_conversations=2)
+    for conv_id in ("a", "b"):
+        store.remember(conv_id, "q", "a")
+        clock.now += 1
+    store.remember("a", "q", "a")  # «a» продолжен и теперь свежее «b»
+    clock.now += 1
+    store.remember("c", "q", "a")
+    assert len(store) == 2
+    assert store.history("b") == []
+    assert store.history("a") and store.history("c")
+
+def test_evicts_over_byte_limit(make_store, clock):
+    store = make_store(max_bytes=30)
+    store.remember("a", "x" * 10, "y" * 10)
+    clock.now += 1
+    store.remember("b", "x" * 10, "y" * 10)
+    assert store.history("a") == []
+    assert len(store) == 1
+
+def test_delete(make_store, clock):
+    store = make_store()
+    store.remember("c", "q", "a")
+    store.delete("c")
+    assert store.history("c") == []
+    assert len(store) == 0
+
+def test_memory_store_tracks_bytes(clock):
+    store = MemoryContextStore(ttl_seconds=60, max_messages=2, max_conversations=10, max_bytes=1000)
+    store.remember("a", "абв", "г")
+    store.remember("a", "д", "е")
+    assert store._bytes == len("де".encode("utf-8"))
+    clock.now += 61
+    store.history("a")
+    assert store._bytes == 0
+
+def test_incomplete_store_cannot_be_instantiated():
+    class AppendOnly(context_store.ContextStore):
+        def append(self, conv_id, messages):
+            pass
+
+    with pytest.raises(TypeError):
+        AppendOnly()
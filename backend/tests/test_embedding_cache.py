@@ -0,0 +1,30 @@
+# backend/tests/test_embedding_cache.py
+import sqlite3
+
+import numpy as np
+
+from app import embedding_cache
+
+class BrokenCache:
+    def __init__(self):
+        self.stored = []
+
+    def get_many(self, prefix, texts):
+        raise sqlite3.OperationalError("database is locked")
+
+    def put_many(self, prefix, texts, vectors):
+        self.stored.extend(texts)
+
+class FakeModel:
+    def encode(self, texts, batch_size):
+        return [np.full(3, len(text), dtype=np.float32) for text in texts]
+
+def test_cache_read_failure_is_treated_as_miss(monkeypatch):
+    cache = BrokenCache()
+    monkeypatch.setattr(embedding_cache, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(embedding_cache, "get_embedding_model", lambda: FakeModel())
+
+    vectors = embedding_cache.encode(["аб", "вгд"], "passage")
+
+    assert vectors == [[11.0] * 3, [12.0] * 3]  # len("passage: ...")
+    assert cache.stored == ["аб", "вгд"]
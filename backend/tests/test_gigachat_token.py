@@ -0,0 +1,32 @@
+# backend/tests/test_gigachat_token.py
+import asyncio
+import logging
+import time
+
+from app.rag import GigaChatProvider
+
+class FailingRefresh(GigaChatProvider):
+    def __init__(self):
+        super().__init__(config=None)
+        self._token = "old"
+        # Токен ещё действует, но уже в окне обновления
+        self._token_expires_at = time.time() + self.TOKEN_REFRESH_MARGIN / 2
+
+    async def _fetch_token(self):
+        raise RuntimeError("auth 503")
+
+def test_background_refresh_failure_is_logged_and_token_kept(caplog):
+    provider = FailingRefresh()
+
+    async def scenario():
+        token = await provider._get_token()
+        task = provider._refresh_task
+        await asyncio.gather(task, return_exceptions=True)
+        return token, task
+
+    with caplog.at_level(logging.WARNING, logger="znatok.rag"):
+        token, task = asyncio.run(scenario())
+
+    assert token == "old"
+    assert task is not None and task.done()
+    assert "auth 503" in caplog.text
@@ -0,0 +1,38 @@
+# backend/tests/test_index_text.py
+import pytest
+
+from app import ingestion, storage
+
+TEXT = "Регламент отпусков.  Заявление подаётся за две недели."
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DOCUMENTS_DB", str(tmp_path / "documents.db"))
+    return storage
+
+def _fail(*args, **kwargs):
+    raise AssertionError("неизменный текст не должен доходить до чанкинга")
+
+def test_unchanged_text_returns_before_chunking(catalog, monkeypatch):
+    catalog.upsert_document("confluence:42", "all", "confluence", 7, content_hash=ingestion.chunk_hash(TEXT))
+    monkeypatch.setattr(ingestion, "_chunk", _fail)
+    monkeypatch.setattr(ingestion, "_sync_chunks", _fail)
+
+    result = ingestion.index_text(TEXT, "confluence:42", "all", origin="confluence")
+
+    assert result["chunks"] == result["reused"] == 7
+    assert result["unchanged_documents"] == 1
+    assert result["embedded"] == 0
+
+@pytest.mark.parametrize("department, text", [("sales", TEXT), ("all", TEXT + " Новый абзац.")])
+def test_changed_text_or_department_is_reindexed(catalog, monkeypatch, department, text):
+    catalog.upsert_document("confluence:42", "all", "confluence", 7, content_hash=ingestion.chunk_hash(TEXT))
+    calls = []
+    monkeypatch.setattr(ingestion, "_chunk", lambda t: ([t], [(0, len(t.encode("utf-8")))]))
+    monkeypatch.setattr(ingestion, "_sync_chunks", lambda chunks, *a, **kw: calls.append(chunks) or
+                        {**ingestion._new_stats(), "chunks": len(chunks), "embedded": len(chunks)})
+    monkeypatch.setattr(ingestion, "_catalog", lambda *a, **kw: None)
+
+    result = ingestion.index_text(text, "confluence:42", department, origin="confluence")
+
+    assert calls and result["embedded"] == len(calls[0])
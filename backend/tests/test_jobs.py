@@ -0,0 +1,38 @@
+# backend/tests/test_jobs.py
+import pytest
+
+from app import jobs
+
+@pytest.fixture
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DB", str(tmp_path / "jobs.db"))
+    return tmp_path
+
+def test_stale_job_is_requeued_then_failed_after_max_attempts(queue_db):
+    upload = queue_db / "upload.txt"
+    upload.write_text("текст")
+    job_id = jobs.enqueue_document("upload.txt", str(upload), "all")
+
+    for attempt in range(1, 3):
+        assert jobs.claim_next("w")["id"] == job_id
+        assert jobs.requeue_stale(-1, max_attempts=2) == (1 if attempt < 2 else 0)
+    job = jobs.get_job(job_id)
+    assert job["status"] == jobs.STATUS_FAILED
+    assert job["stage"] == "abandoned"
+    assert not upload.exists()
+
+def test_discard_upload_ignores_missing_file(queue_db):
+    jobs.discard_upload(str(queue_db / "missing.txt"))
+    jobs.discard_upload(None)
+
+def test_worker_requeues_stale_jobs_at_most_once_per_interval(queue_db, monkeypatch):
+    from app import worker
+    calls = []
+    monkeypatch.setattr(worker.jobs, "requeue_stale", lambda max_age: calls.append(max_age))
+    monkeypatch.setattr(worker, "_last_requeue", 0.0)
+    monkeypatch.setattr(worker, "INGESTION_REQUEUE_INTERVAL", 60)
+
+    assert worker.requeue_stale_if_due(now=1000.0)
+    assert not worker.requeue_stale_if_due(now=1059.0)
+    assert worker.requeue_stale_if_due(now=1060.0)
+    assert calls == [worker.INGESTION_STALE_AFTER] * 2
@@ -0,0 +1,44 @@
+# backend/tests/test_retrieval_fusion.py
+import pytest
+
+from app import lexical, retrieval
+from app.retrieval import rrf_fuse
+
+def test_rrf_fuse_sums_reciprocal_ranks():
+    fused = dict(rrf_fuse([["a", "b"], ["b", "c"]], k=60))
+    assert fused["a"] == pytest.approx(1 / 61)
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused["c"] == pytest.approx(1 / 62)
+
+def test_rrf_fuse_ranks_agreement_first():
+    fused = rrf_fuse([["a", "b", "c"], ["b"]], k=60)
+    assert [point_id for point_id, _ in fused] == ["b", "a", "c"]
+
+def test_rrf_fuse_empty():
+    assert rrf_fuse([[], []]) == []
+
+def test_analyze_drops_stopwords():
+    terms = lexical.analyze("Как и где это найти")
+    assert "как" not in terms and "и" not in terms and "где" not in terms
+    assert terms == [lexical.stem("найти")]
+
+def test_analyze_keeps_identifier_whole_and_in_parts():
+    terms = lexical.analyze("Приказ ПР-2023/15")
+    assert "пр202315" in terms
+    assert {"2023", "15"} <= set(terms)
+
+def test_analyze_normalizes_case_and_yo():
+    assert lexical.analyze("ЁЛКА") == lexical.analyze("елка")
+
+def test_term_coverage():
+    assert lexical.term_coverage("ошибка E-1042", "Код E-1042: ошибка сервера") == 1.0
+    assert lexical.term_coverage("VPN офис", "В офисе есть кухня") == pytest.approx(0.5)
+    assert lexical.term_coverage("и или", "что угодно") == 0.0
+
+def test_sparse_hit_thresholds(monkeypatch):
+    monkeypatch.setattr(retrieval, "HYBRID_SPARSE_MIN_COVERAGE", 0.5)
+    monkeypatch.setattr(retrieval, "HYBRID_SPARSE_MIN_BM25", 0.0)
+    assert retrieval.sparse_hit_is_relevant("ошибка E-1042", "Код E-1042", bm25=1.0)
+    assert not retrieval.sparse_hit_is_relevant("VPN для офиса и склада", "Склад закрыт", bm25=1.0)
+    monkeypatch.setattr(retrieval, "HYBRID_SPARSE_MIN_BM25", 5.0)
+    assert not retrieval.sparse_hit_is_relevant("ошибка E-1042", "Код E-1042", bm25=1.0)
@@ -0,0 +1,56 @@
+# backend/tests/test_storage_pagination.py
+import pytest
+
+from app import storage
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DOCUMENTS_DB", str(tmp_path / "documents.db"))
+    return storage
+
+def test_cursor_roundtrip():
+    row = {"indexed_at": "2024-05-01T10:00:00.123456", "source": "Отчёт Q1.pdf"}
+    assert storage._decode_cursor(storage._encode_cursor(row)) == (row["indexed_at"], row["source"])
+
+def test_cursor_is_url_safe():
+    cursor = storage._encode_cursor({"indexed_at": "2024-05-01T10:00:00", "source": "a/b?c=d&e"})
+    assert all(ch.isalnum() or ch in "-_=" for ch in cursor)
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "W10=", "eyJhIjogMX0="])
+def test_bad_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        storage._decode_cursor(cursor)
+
+def test_pages_cover_catalog_once_with_equal_timestamps(catalog, monkeypatch):
+    monkeypatch.setattr(catalog, "_now", lambda: "2024-05-01T10:00:00")
+    for i in range(5):
+        catalog.upsert_document(f"doc-{i}.txt", "all", catalog.ORIGIN_UPLOAD, chunks=1)
+    monkeypatch.setattr(catalog, "_now", lambda: "2024-05-02T10:00:00")
+    catalog.upsert_document("newest.txt", "all", catalog.ORIGIN_UPLOAD, chunks=1)
+
+    seen, cursor = [], None
+    while True:
+        page = catalog.list_documents(limit=2, cursor=cursor)
+        seen.extend(doc["source"] for doc in page["documents"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["newest.txt"] + [f"doc-{i}.txt" for i in range(5)]
+
+def test_insert_does_not_shift_next_page(catalog, monkeypatch):
+    monkeypatch.setattr(catalog, "_now", lambda: "2024-05-01T10:00:00")
+    for i in range(4):
+        catalog.upsert_document(f"doc-{i}.txt", "all", catalog.ORIGIN_UPLOAD, chunks=1)
+    first = catalog.list_documents(limit=2)
+    monkeypatch.setattr(catalog, "_now", lambda: "2024-05-02T10:00:00")
+    catalog.upsert_document("late.txt", "all", catalog.ORIGIN_UPLOAD, chunks=1)
+    second = catalog.list_documents(limit=2, cursor=first["next_cursor"])
+    assert [doc["source"] for doc in second["documents"]] == ["doc-2.txt", "doc-3.txt"]
+    assert second["next_cursor"] is None
+
+def test_filters_and_like_escaping(catalog):
+    catalog.upsert_document("100%_done.txt", "hr", catalog.ORIGIN_UPLOAD, chunks=1)
+    catalog.upsert_document("100 done.txt", "it", catalog.ORIGIN_CONFLUENCE, chunks=1)
+    assert [d["source"] for d in catalog.list_documents(query="%_")["documents"]] == ["100%_done.txt"]
+    assert [d["source"] for d in catalog.list_documents(department="it")["documents"]] == ["100 done.txt"]
+    assert [d["source"] for d in catalog.list_documents(origin=catalog.ORIGIN_UPLOAD)["documents"]] == ["100%_done.txt"]
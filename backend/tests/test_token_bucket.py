@@ -0,0 +1,59 @@
+# backend/tests/test_token_bucket.py
+import asyncio
+import time
+
+import pytest
+
+from app.bitrix24_kb import TokenBucket
+
+def _timed_acquires(bucket: TokenBucket, n: int):
+    async def run():
+        started = time.monotonic()
+        stamps = []
+        for _ in range(n):
+            await bucket.acquire()
+            stamps.append(time.monotonic() - started)
+        return stamps
+    return asyncio.run(run())
+
+def test_burst_is_available_immediately():
+    stamps = _timed_acquires(TokenBucket(rate=1, burst=3), 3)
+    assert stamps[-1] < 0.1
+
+def test_waits_for_refill_after_burst():
+    stamps = _timed_acquires(TokenBucket(rate=50, burst=1), 3)
+    # После первого токена каждый следующий — не раньше чем через 1/rate
+    assert stamps[1] >= 0.015
+    assert stamps[2] >= 0.035
+
+def test_penalize_halves_rate_and_drains_tokens():
+    bucket = TokenBucket(rate=4, burst=10)
+    bucket.penalize(0.0)
+    assert bucket.rate == pytest.approx(2)
+    assert bucket.tokens == 0
+
+def test_parallel_penalties_in_one_window_count_once():
+    bucket = TokenBucket(rate=4, burst=10)
+    bucket.penalize(60)
+    bucket.penalize(60)
+    assert bucket.rate == pytest.approx(2)
+
+def test_rate_never_drops_below_floor():
+    bucket = TokenBucket(rate=16, burst=1)
+    for _ in range(10):
+        bucket.paused_until = 0.0
+        bucket.penalize(0.0)
+    assert bucket.rate == pytest.approx(1)
+
+def test_on_success_recovers_to_base_rate():
+    bucket = TokenBucket(rate=4, burst=1)
+    bucket.penalize(0.0)
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(4)
+
+def test_acquire_waits_out_pause():
+    bucket = TokenBucket(rate=100, burst=5)
+    bucket.paused_until = time.monotonic() + 0.05
+    stamps = _timed_acquires(bucket, 1)
+    assert stamps[0] >= 0.04
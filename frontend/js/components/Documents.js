@@ -69,15 +69,43 @@ export class Documents {
 
         try {
             Notification.show('Загрузка...', 'info');
-            await fetch('/api/upload', { method: 'POST', body: formData });
-            Notification.show('✅ Документы загружены!', 'success');
+            const res = await fetch('/api/upload', { method: 'POST', body: formData });
+            if (!res.ok) throw new Error(`HTTP ${res.status}: ${await res.text()}`);
+            const data = await res.json();
+            Notification.show('✅ Документы загружены, идёт индексация...', 'success');
             this.hideModal();
             this.load();
+            await this.waitForJobs(data.jobs || []);
         } catch (err) {
             Notification.show(`❌ ${err.message}`, 'error');
         }
     }
 
+    async waitForJobs(jobs) {
+        // Индексация идёт в фоне — опрашиваем статус задач, пока все не завершатся
+        const pending = new Map(jobs.map(j => [j.job_id, j.filename]));
+        while (pending.size > 0) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            for (const [jobId, filename] of [...pending]) {
+                try {
+                    const job = await ApiClient.get(`/api/jobs/${jobId}`);
+                    if (job.status === 'done') {
+                        pending.delete(jobId);
+                    } else if (job.status === 'failed') {
+                        pending.delete(jobId);
+                        Notification.show(`❌ ${filename}: ${job.error || 'ошибка индексации'}`, 'error');
+                    }
+                } catch (err) {
+                    pending.delete(jobId);
+                }
+            }
+        }
+        if (jobs.length) {
+            Notification.show('✅ Индексация завершена', 'success');
+            this.load();
+        }
+    }
+
     hideModal() {
         document.getElementById('uploadModal').classList.remove('active');
         document.getElementById('uploadPreview').style.display = 'none';
@@ -125,41 +153,56 @@ export class Documents {
         const container = document.getElementById('documents-list-container');
         container.innerHTML = '<p class="text-muted">Загрузка...</p>';
         try {
-            const docs = await ApiClient.get('/api/documents');
-            if (docs.length === 0) {
+            const page = await ApiClient.get('/api/documents?limit=50');
+            if (page.documents.length === 0) {
                 container.innerHTML = '<p class="text-muted">Нет загруженных документов.</p>';
                 return;
             }
-            container.innerHTML = docs.map(doc => `
-                <div class="card">
-                    <div class="doc-icon pdf"><i class="bi bi-file-earmark"></i></div>
-                    <div class="doc-content">
-                        <h4>${Utils.escapeHtml(doc.filename)}</h4>
-                        <p class="doc-meta">Загружен: ${new Date(doc.uploaded_at).toLocaleDateString('ru-RU')}</p>
-                    </div>
-                    <div class="doc-actions">
-                        <button class="action-btn" data-filename="${Utils.escapeHtml(doc.filename)}" title="Удалить">
-                            <i class="bi bi-trash"></i>
-                        </button>
-                    </div>
-                </div>
-            `).join('');
-
-            container.querySelectorAll('.action-btn').forEach(btn => {
-                btn.addEventListener('click', async () => {
-                    const name = btn.dataset.filename;
-                    if (!name || !confirm(`Удалить документ "${name}"?`)) return;
-                    try {
-                        await ApiClient.delete(`/api/documents/${encodeURIComponent(name)}`);
-                        Notification.show('✅ Документ удален', 'success');
-                        this.load();
-                    } catch (e) {
-                        Notification.show('❌ Ошибка удаления', 'error');
-                    }
-                });
-            });
+            container.innerHTML = '';
+            this.appendPage(container, page);
         } catch (e) {
             container.innerHTML = `<p class="text-danger">Ошибка: ${e.message}</p>`;
         }
     }
+
+    appendPage(container, page) {
+        container.querySelector('.load-more')?.remove();
+        container.insertAdjacentHTML('beforeend', page.documents.map(doc => `
+            <div class="card">
+                <div class="doc-icon pdf"><i class="bi bi-file-earmark"></i></div>
+                <div class="doc-content">
+                    <h4>${Utils.escapeHtml(doc.filename)}</h4>
+                    <p class="doc-meta">Загружен: ${new Date(doc.uploaded_at).toLocaleDateString('ru-RU')} · фрагментов: ${doc.chunks}</p>
+                </div>
+                <div class="doc-actions">
+                    <button class="action-btn" data-filename="${Utils.escapeHtml(doc.filename)}" title="Удалить">
+                        <i class="bi bi-trash"></i>
+                    </button>
+                </div>
+            </div>
+        `).join(''));
+
+        container.querySelectorAll('.action-btn:not([data-bound])').forEach(btn => {
+            btn.dataset.bound = '1';
+            btn.addEventListener('click', async () => {
+                const name = btn.dataset.filename;
+                if (!name || !confirm(`Удалить документ "${name}"?`)) return;
+                try {
+                    await ApiClient.delete(`/api/documents/${encodeURIComponent(name)}`);
+                    Notification.show('✅ Документ удален', 'success');
+                    this.load();
+                } catch (e) {
+                    Notification.show('❌ Ошибка удаления', 'error');
+                }
+            });
+        });
+
+        if (page.next_cursor) {
+            container.insertAdjacentHTML('beforeend', '<button class="btn-secondary load-more">Показать ещё</button>');
+            container.querySelector('.load-more').addEventListener('click', async () => {
+                const next = await ApiClient.get(`/api/documents?limit=50&cursor=${encodeURIComponent(page.next_cursor)}`);
+                this.appendPage(container, next);
+            });
+        }
+    }
 }
\ No newline at end of file
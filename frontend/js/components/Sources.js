@@ -155,21 +155,48 @@ export class Sources {
     }
 
     async syncConfluence() {
-        Notification.show('Синхронизация Confluence запущена...', 'info');
         try {
             const res = await fetch('/api/sources/confluence/sync', { method: 'POST' });
             const data = await res.json();
-            if (data.status === 'ok') {
-                Notification.show(`✅ Синхронизировано ${data.synced} статей`, 'success');
-                this.loadStatus();
+            Notification.show(
+                data.status === 'running' ? 'Синхронизация Confluence уже идёт...' : 'Синхронизация Confluence запущена...',
+                'info'
+            );
+            const sync = await this.waitForConfluenceSync();
+            if (sync.state === 'done' && sync.result?.status === 'ok') {
+                Notification.show(`✅ Синхронизировано ${sync.result.synced} статей`, 'success');
+            } else if (sync.state === 'done') {
+                Notification.show('Синхронизация Confluence пропущена: источник не настроен', 'warning');
             } else {
-                Notification.show(`❌ ${data.message}`, 'error');
+                Notification.show(`❌ ${sync.error || 'Синхронизация прервана'}`, 'error');
             }
+            this.loadStatus();
         } catch (e) {
             Notification.show('❌ Ошибка синхронизации Confluence', 'error');
         }
     }
 
+    // Синхронизация идёт в фоне — опрашиваем статус, пока она не завершится
+    async waitForConfluenceSync() {
+        const progressEl = document.getElementById('confluence-sync-progress');
+        while (true) {
+            const status = await ApiClient.get('/api/sources/confluence/status');
+            const sync = status.sync || {};
+            if (sync.state !== 'running') {
+                if (progressEl) progressEl.textContent = '';
+                return sync;
+            }
+            if (progressEl) {
+                const done = sync.pages_indexed + sync.pages_skipped + sync.pages_failed;
+                const total = sync.pages_changed != null ? ` из ${sync.pages_changed}` : '';
+                const eta = sync.eta_seconds != null ? `, осталось ~${Math.ceil(sync.eta_seconds)} с` : '';
+                const unchanged = sync.pages_unchanged ? `, без изменений: ${sync.pages_unchanged}` : '';
+                progressEl.textContent = `Обработано ${done}${total} страниц (${sync.rate_pages_per_sec ?? 0} стр/с${eta})${unchanged}`;
+            }
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    }
+
     async testConfluence() {
         // Делаем запрос НА БЭКЕНД, а не в Confluence напрямую
         const base_url = document.getElementById('confluence-base-url').value.trim();